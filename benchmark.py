@@ -0,0 +1,527 @@
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import signal
+import threading
+import time
+from datetime import datetime
+
+import ffmpeg
+
+import main
+
+BENCH_DIR = os.path.abspath("benchmarks")
+STAGES = ["download_normalize", "video_mix", "audio_mix", "render", "stream", "radio"]
+
+
+def make_track_info(tracks, track_duration):
+    """Return fake track timings laid out like get_track_timings()."""
+    track_info = []
+    current_time = 0
+    for i in range(tracks):
+        track_info.append(
+            {
+                "name": f"Benchmark Track {i + 1} - Artist",
+                "start_time": current_time,
+                "duration": track_duration,
+            }
+        )
+        current_time += track_duration - main.TRANSITION_DURATION
+    return track_info
+
+
+def bench_title_overlay(title_overlay, track_info, duration, size="1920x1080", fps=25):
+    """Render titles over a synthetic video and return the achieved fps."""
+    video = ffmpeg.input(f"testsrc2=size={size}:rate={fps}", f="lavfi", t=duration)
+
+    windows = main.get_title_windows(track_info)
+    width = int(size.split("x")[0])
+    if title_overlay == "drawtext":
+        video_with_text = main.draw_titles(video, windows, width)
+    else:
+        video_with_text = main.overlay_titles(video, windows, width, fps)
+
+    # Only the filter graph is measured, the frames are discarded
+    stream = ffmpeg.output(video_with_text, "-", format="null").overwrite_output()
+
+    started = time.monotonic()
+    stream.run(capture_stdout=True, capture_stderr=True)
+    elapsed = time.monotonic() - started
+
+    return duration * fps / elapsed
+
+
+def bench_titles(tracks=20, track_duration=30, size="1920x1080", fps=25):
+    """Compare the drawtext and PNG overlay title paths."""
+    track_info = make_track_info(tracks, track_duration)
+    duration = track_info[-1]["start_time"] + track_duration
+
+    # Warm the PNG cache so only compositing is measured
+    for window in main.get_title_windows(track_info):
+        main.render_title_png(window["title"], width=int(size.split("x")[0]))
+
+    print(f"Benchmarking {tracks} titles over {duration}s of {size}@{fps}")
+    results = {}
+    for title_overlay in ["drawtext", "png"]:
+        results[title_overlay] = bench_title_overlay(
+            title_overlay, track_info, duration, size=size, fps=fps
+        )
+        print(f"{title_overlay}: {results[title_overlay]:.1f} fps")
+
+    gained = results["png"] - results["drawtext"]
+    print(
+        f"PNG overlay: {gained:+.1f} fps "
+        f"({results['png'] / results['drawtext']:.2f}x drawtext)"
+    )
+    return results
+
+
+def generate_sources(items, resolution, clip_duration, track_duration):
+    """Generate deterministic testsrc2 videos and sine audio tracks.
+
+    Sources are cached per resolution and durations and shared by every
+    playlist size, so only the first run pays for generating them.
+    """
+    source_dir = os.path.join(
+        BENCH_DIR, "sources", f"{resolution}_{clip_duration}_{track_duration}"
+    )
+    os.makedirs(source_dir, exist_ok=True)
+
+    sources = []
+    for i in range(items):
+        stem = f"Bench_Track_{i + 1:03d}_-_Synthetic"
+        video_path = os.path.join(source_dir, f"{stem}_video.mp4")
+        audio_path = os.path.join(source_dir, f"{stem}_audio.m4a")
+
+        if not os.path.exists(video_path):
+            # 30 fps on purpose, so normalization has to convert the rate
+            (
+                ffmpeg.input(
+                    f"testsrc2=size={resolution}:rate=30:duration={clip_duration}",
+                    f="lavfi",
+                )
+                .output(video_path, vcodec="libx264", preset="ultrafast")
+                .overwrite_output()
+                .run(capture_stdout=True, capture_stderr=True)
+            )
+        if not os.path.exists(audio_path):
+            (
+                ffmpeg.input(
+                    f"sine=frequency={220 + 10 * i}:duration={track_duration}",
+                    f="lavfi",
+                )
+                .filter("aformat", channel_layouts="stereo")
+                .output(audio_path, acodec="aac", **{"b:a": "192k"})
+                .overwrite_output()
+                .run(capture_stdout=True, capture_stderr=True)
+            )
+
+        sources.append(
+            {
+                "id": f"bench{i:04d}",
+                "title": stem,
+                "video": video_path,
+                "audio": audio_path,
+            }
+        )
+    return sources
+
+
+class StubYoutubeDL:
+    """Stand-in for yt_dlp.YoutubeDL that "downloads" local synthetic files.
+
+    It implements just what the download passes use and fires the same
+    postprocessor hooks yt-dlp does when a file is finished.
+    """
+
+    sources = []
+
+    def __init__(self, options):
+        self.options = options
+        self.hooks = list(options.get("postprocessor_hooks", []))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def extract_info(self, url, download=False, process=False):
+        if url == "bench://playlist":
+            return {
+                "id": "bench",
+                "entries": [
+                    {"id": s["id"], "title": s["title"], "url": f"bench://{s['id']}"}
+                    for s in self.sources
+                ],
+            }
+        source = next(s for s in self.sources if f"bench://{s['id']}" == url)
+        return {"id": source["id"], "title": source["title"]}
+
+    def sanitize_info(self, info):
+        return info
+
+    def add_postprocessor_hook(self, hook):
+        self.hooks.append(hook)
+
+    def process_ie_result(self, info, download=True):
+        source = next(s for s in self.sources if s["id"] == info["id"])
+        kind = "video" if "bestvideo" in self.options["format"] else "audio"
+        filepath = os.path.join(main.DL_DIR, os.path.basename(source[kind]))
+        shutil.copyfile(source[kind], filepath)
+
+        info = {**info, "filepath": filepath, "format_id": "bench"}
+        for hook in self.hooks:
+            hook(
+                {"status": "finished", "postprocessor": "MoveFiles", "info_dict": info}
+            )
+        main.record_download(
+            {"status": "finished", "filename": filepath, "info_dict": info}
+        )
+
+
+def stream_for(seconds, radio=False):
+    """Stream into a local FLV file for a fixed time.
+
+    Streams the latest render, or with radio generates the stream live from
+    the downloaded tracks.
+    """
+    # Interrupt our own process group, like Ctrl+C on a terminal
+    timer = threading.Timer(seconds, os.killpg, args=(0, signal.SIGINT))
+    timer.start()
+    try:
+        if radio:
+            main.stream_radio(
+                rtmp_url=os.path.abspath(main.TMP_DIR), stream_key="radio.flv"
+            )
+        else:
+            main.stream_to_youtube(
+                rtmp_url=os.path.abspath(main.TMP_DIR), stream_key="stream.flv"
+            )
+    finally:
+        timer.cancel()
+
+
+def run_stage(workspace, stage, stream_seconds, sources, conn):
+    """Run one stage in a forked child and report its resource usage.
+
+    A fresh process starts with empty RUSAGE_CHILDREN counters, so the CPU
+    time and peak RSS reported are those of this stage's ffmpeg children.
+    """
+    os.setpgrp()
+    os.chdir(workspace)
+    StubYoutubeDL.sources = sources
+
+    stages = {
+        "download_normalize": lambda: main.download_pipeline(
+            "bench://playlist", ydl_class=StubYoutubeDL
+        ),
+        "video_mix": main.create_video_mix,
+        "audio_mix": main.create_audio_mix,
+        "render": lambda: main.render_result(output_file="final_output_bench.mp4"),
+        "stream": lambda: stream_for(stream_seconds),
+        "radio": lambda: stream_for(stream_seconds, radio=True),
+    }
+
+    error = None
+    started = time.monotonic()
+    try:
+        stages[stage]()
+    except Exception as e:
+        error = str(e)
+    wall_time = time.monotonic() - started
+
+    # Reap every ffmpeg child so it is included in the usage counters
+    while True:
+        try:
+            os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    conn.send(
+        {
+            "wall_time": wall_time,
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            "peak_rss_kb": usage.ru_maxrss,
+            "error": error,
+        }
+    )
+
+
+def get_media_seconds(workspace, stage, items, clip_duration, stream_seconds):
+    """Return how many seconds of media a stage produced."""
+    paths = {
+        "video_mix": "output_video.mp4",
+        "audio_mix": "output_audio.mp4",
+        "render": "final_output_bench.mp4",
+    }
+    if stage == "download_normalize":
+        return items * clip_duration
+    if stage in ["stream", "radio"]:
+        return stream_seconds
+
+    path = os.path.join(workspace, main.RENDERED_DIR, paths[stage])
+    if not os.path.exists(path):
+        return 0.0
+    return float(ffmpeg.probe(path)["format"]["duration"])
+
+
+def bench_stages(
+    sizes=(5, 50, 200),
+    resolutions=("1280x720", "1920x1080"),
+    clip_duration=12,
+    track_duration=30,
+    transition_duration=2,
+    stream_seconds=20,
+):
+    """Run every pipeline stage on synthetic playlists and collect metrics."""
+    main.VIDEO_DURATION = clip_duration
+    main.AUDIO_DURATION = track_duration
+    main.TRANSITION_DURATION = transition_duration
+
+    context = multiprocessing.get_context("fork")
+    results = []
+
+    for resolution in resolutions:
+        for items in sizes:
+            print(f"Scenario: {items} items at {resolution}")
+            sources = generate_sources(items, resolution, clip_duration, track_duration)
+
+            workspace = os.path.join(BENCH_DIR, "workspace")
+            shutil.rmtree(workspace, ignore_errors=True)
+            os.makedirs(workspace)
+            cwd = os.getcwd()
+            os.chdir(workspace)
+            main.ensure_directories()
+            os.chdir(cwd)
+
+            for stage in STAGES:
+                parent_conn, child_conn = context.Pipe()
+                process = context.Process(
+                    target=run_stage,
+                    args=(workspace, stage, stream_seconds, sources, child_conn),
+                )
+                process.start()
+                metrics = parent_conn.recv()
+                process.join()
+
+                media_seconds = get_media_seconds(
+                    workspace, stage, items, clip_duration, stream_seconds
+                )
+                metrics.update(
+                    {
+                        "items": items,
+                        "resolution": resolution,
+                        "stage": stage,
+                        "media_seconds": media_seconds,
+                        "realtime_factor": (
+                            media_seconds / metrics["wall_time"]
+                            if metrics["wall_time"]
+                            else 0.0
+                        ),
+                    }
+                )
+                results.append(metrics)
+                print(
+                    f"  {stage}: {metrics['wall_time']:.1f}s wall, "
+                    f"{metrics['cpu_time']:.1f}s cpu, "
+                    f"{metrics['peak_rss_kb'] / 1024:.0f} MiB peak, "
+                    f"{metrics['realtime_factor']:.1f}x realtime"
+                    + (f" (error: {metrics['error']})" if metrics["error"] else "")
+                )
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": main.CPU_COUNT,
+        "config": {
+            "clip_duration": clip_duration,
+            "track_duration": track_duration,
+            "transition_duration": transition_duration,
+            "stream_seconds": stream_seconds,
+        },
+        "results": results,
+    }
+
+
+def generate_render_inputs(resolution, loop_duration, audio_duration):
+    """Generate a video mix to loop and an audio mix in RENDERED_DIR."""
+    (
+        ffmpeg.input(
+            f"testsrc2=size={resolution}:rate=25:duration={loop_duration}", f="lavfi"
+        )
+        .output(
+            os.path.join(main.RENDERED_DIR, "output_video.mp4"),
+            **main.SEGMENT_ENCODER_OPTS,
+        )
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    (
+        ffmpeg.input(f"sine=frequency=440:duration={audio_duration}", f="lavfi")
+        .filter("aformat", channel_layouts="stereo")
+        .output(
+            os.path.join(main.RENDERED_DIR, "output_audio.mp4"),
+            acodec="aac",
+            **{"b:a": "192k"},
+        )
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+
+
+def bench_render_workers(
+    workers=(1, 2, 4),
+    resolution="1920x1080",
+    loop_duration=60,
+    audio_duration=600,
+    chunk_duration=None,
+):
+    """Compare the full render with chunked renders on 1..N local workers."""
+    if chunk_duration:
+        main.RENDER_CHUNK_DURATION = chunk_duration
+
+    workspace = os.path.join(BENCH_DIR, "render_workspace")
+    shutil.rmtree(workspace, ignore_errors=True)
+    os.makedirs(workspace)
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        main.ensure_directories()
+        generate_render_inputs(resolution, loop_duration, audio_duration)
+
+        print(
+            f"Benchmarking renders of {audio_duration}s at {resolution} "
+            f"on {main.CPU_COUNT} cores"
+        )
+        runs = [("full", "full", None)]
+        runs += [(f"chunked x{count}", "chunked", count) for count in workers]
+        results = {}
+        for label, mode, count in runs:
+            # Every run renders the same key, so remove the previous output
+            for name in os.listdir(main.RENDERED_DIR):
+                if name.startswith("final_output"):
+                    os.remove(os.path.join(main.RENDERED_DIR, name))
+
+            started = time.monotonic()
+            main.render_result(
+                output_file="final_output_bench.mp4", mode=mode, workers=count
+            )
+            results[label] = time.monotonic() - started
+    finally:
+        os.chdir(cwd)
+
+    baseline = results[runs[1][0]]
+    for label, wall_time in results.items():
+        print(
+            f"{label:<12} {wall_time:7.1f}s wall, "
+            f"{audio_duration / wall_time:5.1f}x realtime, "
+            f"{baseline / wall_time:4.2f}x speedup"
+        )
+    return results
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """Print wall time changes against a baseline run and flag regressions."""
+    key = lambda r: (r["resolution"], r["items"], r["stage"])  # noqa: E731
+    baseline_results = {key(r): r for r in baseline["results"]}
+
+    regressions = 0
+    for result in current["results"]:
+        before = baseline_results.get(key(result))
+        if not before or not before["wall_time"]:
+            continue
+        change = result["wall_time"] / before["wall_time"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(
+            f"{result['resolution']} {result['items']:>4} {result['stage']:<20} "
+            f"{before['wall_time']:8.1f}s -> {result['wall_time']:8.1f}s "
+            f"({change:+.0%}){flag}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="yt-autostream benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    titles_parser = subparsers.add_parser(
+        "titles", help="Compare drawtext and PNG title overlays"
+    )
+    titles_parser.add_argument("--tracks", type=int, default=20)
+    titles_parser.add_argument("--track-duration", type=int, default=30)
+    titles_parser.add_argument("--size", default="1920x1080")
+    titles_parser.add_argument("--fps", type=int, default=25)
+
+    render_parser = subparsers.add_parser(
+        "render-workers", help="Measure chunked render speedup by worker count"
+    )
+    render_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    render_parser.add_argument("--resolution", default="1920x1080")
+    render_parser.add_argument("--loop-duration", type=int, default=60)
+    render_parser.add_argument("--audio-duration", type=int, default=600)
+    render_parser.add_argument("--chunk-duration", type=int)
+
+    stages_parser = subparsers.add_parser(
+        "stages", help="Run every pipeline stage on synthetic playlists"
+    )
+    stages_parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 200])
+    stages_parser.add_argument(
+        "--resolutions", nargs="+", default=["1280x720", "1920x1080"]
+    )
+    stages_parser.add_argument("--clip-duration", type=int, default=12)
+    stages_parser.add_argument("--track-duration", type=int, default=30)
+    stages_parser.add_argument("--transition-duration", type=int, default=2)
+    stages_parser.add_argument("--stream-seconds", type=int, default=20)
+    stages_parser.add_argument(
+        "--output", help="JSON results file (default: benchmarks/<timestamp>.json)"
+    )
+    stages_parser.add_argument(
+        "--compare", help="Previous JSON results to compare wall times against"
+    )
+    args = parser.parse_args()
+
+    if args.benchmark == "titles":
+        bench_titles(
+            tracks=args.tracks,
+            track_duration=args.track_duration,
+            size=args.size,
+            fps=args.fps,
+        )
+    elif args.benchmark == "render-workers":
+        bench_render_workers(
+            workers=args.workers,
+            resolution=args.resolution,
+            loop_duration=args.loop_duration,
+            audio_duration=args.audio_duration,
+            chunk_duration=args.chunk_duration,
+        )
+    else:
+        report = bench_stages(
+            sizes=args.sizes,
+            resolutions=args.resolutions,
+            clip_duration=args.clip_duration,
+            track_duration=args.track_duration,
+            transition_duration=args.transition_duration,
+            stream_seconds=args.stream_seconds,
+        )
+
+        output = args.output or os.path.join(
+            BENCH_DIR, datetime.now().strftime("%Y%m%d%H%M%S") + ".json"
+        )
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+
+        if args.compare:
+            with open(args.compare) as f:
+                regressions = compare_results(json.load(f), report)
+            if regressions:
+                raise SystemExit(f"{regressions} stages regressed")
@@ -17,6 +17,7 @@
         pkgs.python311Packages.yt-dlp
         pkgs.python311Packages.ffmpeg-python
         pkgs.python311Packages.datetime
+        pkgs.python311Packages.numpy
         pkgs.ffmpeg-full
         pkgs.intel-media-driver
         pkgs.libva
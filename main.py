@@ -1,11 +1,28 @@
+import asyncio
+import copy
+import fcntl
+import hashlib
+import heapq
+import itertools
+import json
+import math
 import os
+import queue
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import ffmpeg
+import numpy as np
 import yt_dlp as youtube_dl
 from datetime import datetime
 
-# TODO: Optimise drawtext filter for better performance. Render PNG with text and overlay it on video.
-# TODO: Add support for reloading stream when a new file is available
 # TODO: Add support for VAAPI hardware acceleration
 # TODO: Optimise audio normalization performance
 # TODO: Optimize video normalization performance
@@ -18,25 +35,262 @@ DATA_DIR = "data"
 DL_DIR = DATA_DIR + "/downloads"
 TMP_DIR = DATA_DIR + "/tmp"
 RENDERED_DIR = DATA_DIR + "/rendered"
+CACHE_DIR = DATA_DIR + "/cache"
+TITLE_CACHE_DIR = CACHE_DIR + "/titles"
+LOUDNORM_CACHE = CACHE_DIR + "/loudnorm.json"
+MEDIA_INDEX = CACHE_DIR + "/media.sqlite"
+MANIFEST_DIR = CACHE_DIR + "/manifests"
+STAGE_CACHE = CACHE_DIR + "/stages.json"  # Build keys of clips, mixes and renders
+NORMALIZE_STATS = CACHE_DIR + "/normalize.json"  # Speed of full re-encodes
+METRICS_LOG = DATA_DIR + "/metrics.jsonl"  # JSON lines, one per progress update
+METRICS_PROM = DATA_DIR + "/metrics.prom"  # Prometheus node_exporter textfile
+VIDEO_SEGMENT_DIR = CACHE_DIR + "/segments/video"
+AUDIO_SEGMENT_DIR = CACHE_DIR + "/segments/audio"
+ENVELOPE_DIR = CACHE_DIR + "/envelopes"
+PROXY_DIR = CACHE_DIR + "/proxies"  # Preview copies of the normalized clips
+RENDER_QUEUE_DIR = DATA_DIR + "/render_queue"  # Chunk jobs, shared with workers
+PLAYLISTS_DIR = DATA_DIR + "/playlists"  # Daemon workspaces, one per playlist
+SHARED_SOURCES_DIR = DATA_DIR + "/sources"  # Daemon store of shared downloads
+USAGE_CACHE = CACHE_DIR + "/usage.json"  # Last use of files, for evictions
+STREAMING_DIR = DATA_DIR + "/streaming"  # Files streamed now, one file per process
+DATA_LOCK = DATA_DIR + "/lock"  # Shared by running actions, see cleanup_temp_files
 
-# Ensure output directories exist
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(DL_DIR, exist_ok=True)
-os.makedirs(TMP_DIR, exist_ok=True)
-os.makedirs(RENDERED_DIR, exist_ok=True)
+
+def ensure_directories():
+    """Ensure output directories exist (relative to the working directory)"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(DL_DIR, exist_ok=True)
+    os.makedirs(TMP_DIR, exist_ok=True)
+    os.makedirs(RENDERED_DIR, exist_ok=True)
+    os.makedirs(TITLE_CACHE_DIR, exist_ok=True)
+    os.makedirs(VIDEO_SEGMENT_DIR, exist_ok=True)
+    os.makedirs(AUDIO_SEGMENT_DIR, exist_ok=True)
+    os.makedirs(ENVELOPE_DIR, exist_ok=True)
+    os.makedirs(PROXY_DIR, exist_ok=True)
+    os.makedirs(RENDER_QUEUE_DIR, exist_ok=True)
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    os.makedirs(STREAMING_DIR, exist_ok=True)
+
+
+ensure_directories()
 
 # Video configuration
 VIDEO_SKIP_START = 180  # 3 minutes
 VIDEO_DURATION = 60  # 2 minutes
 
+# Playlist manifest: the playlist listing is refreshed after PLAYLIST_TTL,
+# extracted entries (and their format URLs) expire after ENTRY_TTL.
+PLAYLIST_TTL = 60 * 60  # 1 hour
+ENTRY_TTL = 5 * 60 * 60  # 5 hours, YouTube format URLs expire after ~6
+
+COOKIES_FILE = "cookies.sqlite"
+
+# Store of downloads and normalized clips shared between workspaces, set with
+# --source-dir. Files are hard linked, so a video in several playlists is
+# downloaded, normalized and stored once.
+SOURCE_DIR = None
+
 # Audio configuration
 AUDIO_SKIP_START = 180  # 3 minutes
 AUDIO_DURATION = 300  # 5 minutes
 
 TRANSITION_DURATION = 6  # Duration of the fade transition in seconds
 
+# Video mix: "segments" encodes every clip body and crossfade separately and
+# joins them with stream copy, "xfade" re-encodes one filter chain.
+VIDEO_MIX_MODE = "segments"
+
+# The xfade and acrossfade mixes open at most MIX_GROUP_SIZE inputs per
+# ffmpeg run. Longer playlists are mixed group by group into intermediates
+# that are joined the same way, so memory use does not grow with the playlist.
+MIX_GROUP_SIZE = 16
+MIX_INTERMEDIATE_OPTS = {
+    "video": {"vcodec": "libx264", "crf": 12, "preset": "superfast"},
+    "audio": {"acodec": "flac"},
+}
+
+# Encoder settings shared by all video mix segments. Fixed, closed GOPs keep
+# the segments compatible so the concat demuxer can join them with -c copy.
+SEGMENT_ENCODER_OPTS = {
+    "vcodec": "libx264",
+    "crf": 23,
+    "preset": "superfast",
+    "pix_fmt": "yuv420p",
+    "r": 25,
+    "g": 50,
+    "keyint_min": 50,
+    "sc_threshold": 0,
+    "flags": "+cgop",
+}
+
+# Final render: "full" re-encodes the whole timeline, "selective" encodes the
+# looped video mix once and only re-encodes the keyframe-aligned spans that
+# carry titles or the global fade in/out. B-frames are disabled for the loop
+# so it can be cut on any keyframe with stream copy. When more than
+# SELECTIVE_MAX_ENCODED of the timeline would be re-encoded, as with titles
+# that stay on screen for the whole track (TITLE_DURATION None), the
+# selective render falls back to the full render.
+RENDER_MODE = "full"
+SELECTIVE_MAX_ENCODED = 0.8
+RENDER_FADE_DURATION = 5  # Global fade in/out of the final render
+LOOP_ENCODER_OPTS = {**SEGMENT_ENCODER_OPTS, "bf": 0}
+KEYFRAME_INTERVAL = SEGMENT_ENCODER_OPTS["g"] / SEGMENT_ENCODER_OPTS["r"]
+
+# Final render output: "mp4" writes one file that appears when the render is
+# complete, "hls" writes fMP4 segments and a growing playlist that can be
+# streamed while the render is still running.
+RENDER_OUTPUT = "mp4"
+HLS_SEGMENT_DURATION = 6  # Seconds, a multiple of KEYFRAME_INTERVAL
+HLS_PLAYLIST = "index.m3u8"
+HLS_RENDER_PID = "render.pid"  # In the directory of a segmented render while it runs
+
 FONT_PATH = "Font.TTF"
 
+# Track title overlays: "png" composites cached pre-rendered titles,
+# "drawtext" rasterizes the text on every frame.
+TITLE_OVERLAY = "png"
+TITLE_FONT_SIZE = 36
+TITLE_MARGIN = 20  # Pixels from the left and bottom edge
+TITLE_DURATION = None  # Seconds a title stays on screen, None for the whole track
+
+# Preview: the video mix and render at proxy size and frame rate with the
+# fastest x264 preset. Title size and margin are scaled to the proxy width.
+# A preview around a track boundary shows PREVIEW_CONTEXT seconds on both
+# sides of the crossfade.
+PREVIEW_WIDTH = 640
+PREVIEW_HEIGHT = 360
+PREVIEW_FPS = 12.5
+PREVIEW_ENCODER_OPTS = {
+    **SEGMENT_ENCODER_OPTS,
+    "crf": 28,
+    "preset": "ultrafast",
+    "r": PREVIEW_FPS,
+    "g": int(PREVIEW_FPS * KEYFRAME_INTERVAL),
+    "keyint_min": int(PREVIEW_FPS * KEYFRAME_INTERVAL),
+}
+PREVIEW_CONTEXT = 10
+
+# Normalization settings, part of the stage cache key of every normalized clip.
+# Every input is probed first: conforming H.264 is stream-copied ("copy"),
+# the right size at another frame rate only gets the fps filter ("fps"),
+# everything else is scaled, padded and re-encoded ("full"). Every method
+# writes the same MP4 track timescale, xfade fails on inputs whose time bases
+# differ and a copy would keep the timescale of the download.
+NORMALIZE_FPS = 25
+NORMALIZE_TIMESCALE = 12800  # What the MP4 muxer picks for 25 fps
+NORMALIZE_ENCODER_OPTS = {"vcodec": "libx264", "crf": 23, "preset": "superfast"}
+NORMALIZE_METHODS = ["copy", "fps", "full"]
+
+# Normalization worker pool. Every job gets its own ffmpeg thread budget so
+# NORMALIZE_WORKERS * NORMALIZE_THREADS stays close to the number of cores.
+CPU_COUNT = os.cpu_count() or 1
+NORMALIZE_WORKERS = max(1, CPU_COUNT // 4)
+NORMALIZE_THREADS = max(1, CPU_COUNT // NORMALIZE_WORKERS)
+
+# Finished downloads waiting for a normalization worker. Downloads block when
+# the queue is full so they cannot run arbitrarily far ahead.
+PIPELINE_QUEUE_SIZE = 2 * NORMALIZE_WORKERS
+
+# RENDER_MODE "chunked" renders the timeline in RENDER_CHUNK_DURATION chunks that
+# are encoded in parallel by RENDER_WORKERS local workers and by
+# render-worker processes on other nodes sharing DATA_DIR. A chunk claimed
+# by a worker that did not finish it within RENDER_CLAIM_TIMEOUT is requeued.
+RENDER_CHUNK_DURATION = 60  # Seconds, a multiple of KEYFRAME_INTERVAL
+RENDER_WORKERS = max(1, CPU_COUNT // 4)
+RENDER_CLAIM_TIMEOUT = 10 * 60
+
+# Loudness normalization targets. Tracks are measured once in a separate
+# analysis pass (loudnorm is single threaded, so one job per core) and mixed
+# with linear loudnorm using the cached measurements.
+LOUDNORM_TARGETS = {
+    "I": "-27",  # Integrated loudness target (even quieter)
+    "LRA": "11",  # Loudness range
+    "TP": "-3.0",  # True peak (lowered further to prevent clipping)
+}
+ANALYSIS_WORKERS = CPU_COUNT
+
+DEFAULT_RTMP_URL = "rtmp://a.rtmp.youtube.com/live2"
+
+# Radio mode encodes the stream live, one real-time feeder per track, with
+# the mix segment settings and the bitrate cap of a YouTube ingest.
+RADIO_ENCODER_OPTS = {**SEGMENT_ENCODER_OPTS, "maxrate": "4500k", "bufsize": "8192k"}
+
+# Supervised streaming: the RTMP connection is restarted when ffmpeg exits or
+# stops sending for STREAM_STALL_TIMEOUT seconds. Retries wait
+# STREAM_BACKOFF_INITIAL seconds, doubling up to STREAM_BACKOFF_MAX, and the
+# backoff is reset once a connection stayed up for STREAM_STABLE_AFTER seconds.
+STREAM_STALL_TIMEOUT = 20
+STREAM_BACKOFF_INITIAL = 1
+STREAM_BACKOFF_MAX = 60
+STREAM_STABLE_AFTER = 60
+STREAM_STANDBY = False  # Keep a spare RTMP ffmpeg started to reconnect faster
+
+# Simulcast destinations that need a lower bitrate share one extra rendition,
+# encoded once by the RTMP ffmpeg. The audio is shared with the full stream.
+LOW_BITRATE_ENCODER_OPTS = {
+    "c": "libx264",
+    "preset": "veryfast",
+    "s": "1280x720",
+    "b": "2500k",
+    "maxrate": "2500k",
+    "bufsize": "5000k",
+    "g": SEGMENT_ENCODER_OPTS["g"],
+}
+
+# Daemon: every playlist in DAEMON_CONFIG is processed in its own workspace
+# under PLAYLISTS_DIR every "interval" seconds. The stages of all playlists
+# share a budget of DAEMON_CPU_BUDGET cores and DAEMON_MAX_JOBS running jobs.
+# A job is budgeted DAEMON_STAGE_CORES cores, renders of playlists marked
+# "live" are started first.
+DAEMON_CONFIG = "daemon.json"
+DAEMON_INTERVAL = 60 * 60  # 1 hour
+DAEMON_CPU_BUDGET = CPU_COUNT
+DAEMON_MAX_JOBS = 2
+DAEMON_STAGES = ["download", "video_mix", "audio_mix", "render"]
+DAEMON_STAGE_CORES = {
+    "download": max(1, CPU_COUNT // 2),
+    "video_mix": max(1, CPU_COUNT // 2),
+    "audio_mix": 1,
+    "render": CPU_COUNT,
+}
+DAEMON_PORT = 8090  # Status and metrics endpoint on localhost
+
+# Disk quotas in bytes per directory, None for no quota. Over quota, files
+# are evicted least recently used first, raw downloads that were normalized
+# before anything else. DISK_MIN_FREE evicts the same files until that many
+# bytes are free on the disk. What the current mixes, the latest render and
+# a running stream depend on is never evicted.
+DISK_QUOTAS = {
+    DL_DIR: None,
+    RENDERED_DIR: None,
+    CACHE_DIR + "/segments": None,
+    PROXY_DIR: None,
+}
+DISK_MIN_FREE = None
+TEMP_SUFFIXES = (".tmp", ".link", ".part", ".ytdl")  # Removed at startup
+
+# ffmpeg progress reporting. Only the last STDERR_TAIL_LINES lines of stderr
+# are kept for error messages instead of buffering the whole log.
+METRICS_INTERVAL = 5  # Seconds between progress updates
+# METRICS_LOG is moved to METRICS_LOG.1 when it grows past this size, so a
+# stream that runs for weeks keeps at most twice this much metrics history
+METRICS_LOG_MAX_SIZE = 10 * 1024**2
+STDERR_TAIL_LINES = 200
+
+# Audio mix: "segments" caches every normalized track and crossfade as FLAC
+# and only encodes the final AAC, "acrossfade" runs one filter chain.
+AUDIO_MIX_MODE = "segments"
+AUDIO_SAMPLE_RATE = 48000
+
+# Crossfade points: "energy" decodes every track once into RMS and onset
+# envelopes and cuts it at the quietest moment within CROSSFADE_SEARCH
+# seconds of its start and end, "fixed" plays every track from start to end.
+CROSSFADE_POINTS = "energy"
+CROSSFADE_SEARCH = 15
+CROSSFADE_TOLERANCE = 0.05  # Score margin within which the edge-most point wins
+ENERGY_SAMPLE_RATE = 8000  # Mono PCM rate the envelopes are computed from
+ENERGY_HOP = 0.05  # Seconds per envelope frame
+
 
 def get_base_options():
     """Return common options for both video and audio downloads"""
@@ -48,514 +302,4494 @@ def get_base_options():
         "writethumbnail": False,  # Do not download thumbnails
         "writesubtitles": False,  # Do not download subtitles
         "writeautomaticsub": False,  # Do not download automatic subtitles
-        "cookiesfile": "cookies.sqlite",  # File to read cookies from
+        "cookiesfile": COOKIES_FILE,  # File to read cookies from
         "force_keyframes_at_cuts": True,  # Ensure clean cuts at the specified times
+        "progress_hooks": [record_download],  # Remember titles and video IDs
     }
 
 
-def normalize_video(input_path, target_width=1920, target_height=1080):
-    """Normalize video using ffmpeg-python"""
-    output_path = input_path.replace("_video.", "_video_normalized.")
-
-    if os.path.exists(output_path):
-        print(f"Skipping normalization: {input_path}")
-        return
+def file_digest(path, remember=True):
+    """Return the SHA-1 of a file's content.
 
-    print(f"Normalizing video: {input_path}")
+    Digests are remembered in the media index by path, size and mtime, so a
+    file is only read again after it changed. Without remember the index is
+    only read, as in a dry run.
+    """
+    stat = os.stat(path)
+    identity = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
     try:
-        # Setup the ffmpeg stream with desired parameters
-        stream = (
-            ffmpeg.input(input_path)
-            .filter("fps", fps=25)
-            # Scale video to target resolution while maintaining aspect ratio
-            .filter(
-                "scale",
-                width=f"{target_width}",
-                height=f"{target_height}",
-                force_original_aspect_ratio="decrease",
-            )
-            # Pad the video if needed to reach exact target dimensions
-            .filter(
-                "pad",
-                width=f"{target_width}",
-                height=f"{target_height}",
-                x="(ow-iw)/2",
-                y="(oh-ih)/2",
+        conn = open_media_index(readonly=not remember)
+    except sqlite3.OperationalError:
+        # No index to read in a dry run
+        conn = None
+    if conn is not None:
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT sha1 FROM digests "
+                    "WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    identity,
+                ).fetchone()
+        except sqlite3.OperationalError:
+            # An index from before digests were remembered
+            row = None
+        conn.close()
+        if row is not None:
+            return row["sha1"]
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    if remember:
+        with open_media_index() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                (*identity, digest.hexdigest()),
             )
-            .output(
-                output_path,
-                vcodec="libx264",
-                crf=23,
-                preset="superfast",
-                acodec="copy",
-                **{"loglevel": "error"},
+        conn.close()
+    return digest.hexdigest()
+
+
+def file_stamp(path):
+    """Return a cheap identity for a file based on its path, size and mtime."""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_json_cache(path):
+    """Load a JSON cache file, returning an empty cache if it is missing or broken."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_json_cache(path, data):
+    """Atomically write a JSON cache file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+stage_cache_lock = threading.Lock()
+
+
+def get_stage_key(inputs, params):
+    """Return the build key of an artifact made from input files and parameters.
+
+    Inputs are identified by path, size and mtime, so rebuilding an upstream
+    artifact changes the key of everything built from it.
+    """
+    return hashlib.sha1(
+        json.dumps(
+            {"inputs": [file_stamp(path) for path in inputs], "params": params},
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+
+
+def is_stage_current(output_path, key):
+    """Return whether output_path exists and was built with this key."""
+    if not os.path.exists(output_path):
+        return False
+    entry = load_json_cache(STAGE_CACHE).get(os.path.abspath(output_path), {})
+    return entry.get("key") == key and entry.get("stamp") == file_stamp(output_path)
+
+
+def record_stage_key(output_path, key, inputs=()):
+    """Remember the build key of a finished artifact, forgetting deleted ones.
+
+    The inputs an artifact still depends on are kept with it, so evictions
+    keep them as long as the artifact is needed.
+    """
+    with stage_cache_lock:
+        cache = {
+            path: entry
+            for path, entry in load_json_cache(STAGE_CACHE).items()
+            if os.path.exists(path)
+        }
+        cache[os.path.abspath(output_path)] = {
+            "key": key,
+            "stamp": file_stamp(output_path),
+            "inputs": [os.path.abspath(path) for path in inputs],
+        }
+        save_json_cache(STAGE_CACHE, cache)
+    if inputs:
+        mark_used(inputs)
+
+
+def find_stage_output(key, directory):
+    """Return an existing artifact under directory built with this key, if any."""
+    cache = load_json_cache(STAGE_CACHE)
+    for path, entry in sorted(cache.items()):
+        if (
+            path.startswith(os.path.abspath(directory) + os.sep)
+            and entry["key"] == key
+            and is_stage_current(path, key)
+        ):
+            return path
+    return None
+
+
+def publish_output(output_path, stage_key=None, inputs=()):
+    """Move a finished artifact from TMP_DIR to RENDERED_DIR and record its key."""
+    rendered_path = os.path.join(RENDERED_DIR, os.path.basename(output_path))
+    print(f"Moving {output_path} to {RENDERED_DIR}")
+    os.rename(output_path, rendered_path)
+    if stage_key is not None:
+        record_stage_key(rendered_path, stage_key, inputs)
+
+
+usage_cache_lock = threading.Lock()
+
+
+def parse_size(size):
+    """Convert a size like "500M" or "20G" to bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    size = size.strip().upper().rstrip("B")
+    if size[-1:] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def format_size(size):
+    """Format a byte count for the log."""
+    return f"{size / (1 << 20):.1f} MB"
+
+
+def mark_used(paths):
+    """Remember that files were just used, for the LRU order of evictions."""
+    now = time.time()
+    with usage_cache_lock:
+        cache = load_json_cache(USAGE_CACHE)
+        cache.update({os.path.abspath(path): now for path in paths})
+        save_json_cache(
+            USAGE_CACHE,
+            {path: used for path, used in cache.items() if os.path.exists(path)},
+        )
+
+
+def mark_streaming(paths):
+    """Record the files this process is streaming, so they are never evicted."""
+    mark_used(paths)
+    save_json_cache(
+        os.path.join(STREAMING_DIR, f"{os.getpid()}.json"),
+        {"paths": [os.path.abspath(path) for path in paths]},
+    )
+
+
+def clear_streaming():
+    """Forget the files this process was streaming."""
+    marker = os.path.join(STREAMING_DIR, f"{os.getpid()}.json")
+    if os.path.exists(marker):
+        os.remove(marker)
+
+
+def get_streaming_paths():
+    """Return the files streamed by running processes, dropping stale markers."""
+    paths = []
+    for filename in os.listdir(STREAMING_DIR):
+        if not filename.endswith(".json"):
+            continue
+        marker = os.path.join(STREAMING_DIR, filename)
+        try:
+            os.kill(int(filename.split(".")[0]), 0)
+        except ProcessLookupError:
+            os.remove(marker)
+            continue
+        except (PermissionError, ValueError):
+            pass
+        paths += load_json_cache(marker).get("paths", [])
+    return paths
+
+
+# The open DATA_LOCK of this process, its shared lock is held until it exits
+data_lock_file = None
+
+
+def cleanup_temp_files():
+    """Take the DATA_LOCK and remove temp files that runs left behind.
+
+    Every action holds a shared lock on DATA_LOCK while it runs. Temp files
+    and incomplete segmented renders are only removed when the lock can be
+    taken exclusively, so they can't belong to another process. Returns the
+    open lock file, the lock is held until it is closed.
+    """
+    lock = open(DATA_LOCK, "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"{DATA_DIR} is in use, leaving temp files alone")
+    else:
+        removed = [entry.path for entry in os.scandir(TMP_DIR)]
+        # Segmented renders whose render process is gone before it finished
+        removed += [
+            entry.path
+            for entry in os.scandir(RENDERED_DIR)
+            if entry.is_dir()
+            and entry.name.startswith("final_output")
+            and not is_render_streamable(os.path.join(entry.path, HLS_PLAYLIST))
+        ]
+        for directory in [DL_DIR, RENDERED_DIR, CACHE_DIR]:
+            for root, _, filenames in os.walk(directory):
+                removed += [
+                    os.path.join(root, filename)
+                    for filename in filenames
+                    if filename.endswith(TEMP_SUFFIXES)
+                ]
+
+        freed = sum(get_disk_size(path) for path in removed)
+        for path in removed:
+            remove_path(path)
+        if removed:
+            print(f"Removed {len(removed)} temp files ({format_size(freed)})")
+
+    fcntl.flock(lock, fcntl.LOCK_SH)
+    return lock
+
+
+def get_disk_size(path):
+    """Return the size of a file or of everything in a directory."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, filename))
+        for root, _, filenames in os.walk(path)
+        for filename in filenames
+    )
+
+
+def remove_path(path):
+    """Remove a file or a directory tree."""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+
+def get_protected_paths():
+    """Return the absolute paths evictions must keep.
+
+    These are the current mixes, the latest render, the files being streamed
+    and, following the inputs in the stage cache, everything they were built
+    from.
+    """
+    roots = [
+        os.path.join(RENDERED_DIR, "output_video.mp4"),
+        os.path.join(RENDERED_DIR, "output_audio.mp4"),
+    ]
+    for hls in [False, True]:
+        try:
+            roots.append(os.path.join(RENDERED_DIR, get_latest_render(hls)))
+        except FileNotFoundError:
+            pass
+    roots += get_streaming_paths()
+
+    cache = load_json_cache(STAGE_CACHE)
+    protected = set()
+    pending = [os.path.abspath(path) for path in roots]
+    while pending:
+        path = pending.pop()
+        if path not in protected:
+            protected.add(path)
+            pending += cache.get(path, {}).get("inputs", [])
+    return protected
+
+
+def get_eviction_candidates(directory, protected):
+    """Return the files in directory that may be evicted, first to go first.
+
+    A segmented render is one candidate. Raw downloads that were normalized
+    go first, then everything else least recently used first. Returns the
+    candidates and the size of everything in directory.
+    """
+    usage = load_json_cache(USAGE_CACHE)
+    units = []
+    for root, dirnames, filenames in os.walk(directory):
+        if HLS_PLAYLIST in filenames:
+            units.append(root)
+            dirnames.clear()
+        else:
+            units += [os.path.join(root, filename) for filename in filenames]
+
+    total = 0
+    candidates = []
+    for path in units:
+        size = get_disk_size(path)
+        total += size
+        abspath = os.path.abspath(path)
+        if any(p == abspath or p.startswith(abspath + os.sep) for p in protected):
+            continue
+        normalized = path.endswith("_video.mp4") and os.path.exists(
+            get_normalized_path(path)
+        )
+        last_used = max(os.path.getmtime(path), usage.get(abspath, 0))
+        candidates.append((not normalized, last_used, path, size))
+    return sorted(candidates), total
+
+
+def enforce_quotas(quotas=None, min_free=DISK_MIN_FREE):
+    """Evict files until every directory is within its quota.
+
+    With min_free, files are also evicted from the directories in quotas
+    until that many bytes are free on the filesystem of DATA_DIR. Files
+    that the current mixes, the latest render or a running stream depend on
+    are never evicted. Returns the number of bytes freed.
+    """
+    quotas = DISK_QUOTAS if quotas is None else quotas
+    if not any(quotas.values()) and not min_free:
+        return 0
+
+    protected = get_protected_paths()
+    freed = 0
+    everything = []
+    for directory, quota in quotas.items():
+        candidates, total = get_eviction_candidates(directory, protected)
+        everything += candidates
+        if not quota or total <= quota:
+            continue
+        for candidate in list(candidates):
+            if total <= quota:
+                break
+            _, _, path, size = candidate
+            print(f"Evicting {path} ({format_size(size)}), {directory} over quota")
+            remove_path(path)
+            everything.remove(candidate)
+            total -= size
+            freed += size
+        if total > quota:
+            print(
+                f"{directory} is still over its quota of {format_size(quota)}, "
+                f"{format_size(total)} is in use by the mixes, renders or stream"
             )
-            .overwrite_output()
+
+    if min_free:
+        for _, _, path, size in sorted(everything):
+            if shutil.disk_usage(DATA_DIR).free >= min_free:
+                break
+            print(f"Evicting {path} ({format_size(size)}), disk is almost full")
+            remove_path(path)
+            freed += size
+
+    if freed:
+        record_metrics("storage", "evict", evicted_bytes=freed)
+    return freed
+
+
+# Latest progress values per stage, exported to METRICS_PROM
+stage_metrics = {}
+metrics_lock = threading.Lock()
+
+
+def parse_progress(block):
+    """Convert one block of ffmpeg -progress output into numeric metrics."""
+
+    def number(value, suffix=""):
+        value = value.strip()
+        if suffix and value.endswith(suffix):
+            value = value[: -len(suffix)]
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    out_time_us = block.get("out_time_us") or block.get("out_time_ms", "")
+    out_time_us = number(out_time_us)
+    total_size = number(block.get("total_size", ""))
+    return {
+        "frame": number(block.get("frame", "")),
+        "fps": number(block.get("fps", "")),
+        "speed": number(block.get("speed", ""), "x"),
+        "out_time_seconds": out_time_us / 1e6 if out_time_us is not None else None,
+        "bitrate_kbps": number(block.get("bitrate", ""), "kbits/s"),
+        "drop_frames": number(block.get("drop_frames", "")),
+        "dup_frames": number(block.get("dup_frames", "")),
+        "total_size_bytes": total_size,
+    }
+
+
+def write_prometheus_metrics():
+    """Atomically rewrite the Prometheus textfile from stage_metrics."""
+    lines = []
+    names = sorted({name for values in stage_metrics.values() for name in values})
+    for name in names:
+        lines.append(f"# TYPE ytautostream_{name} gauge")
+        for stage, values in sorted(stage_metrics.items()):
+            if values.get(name) is not None:
+                lines.append(f'ytautostream_{name}{{stage="{stage}"}} {values[name]}')
+
+    tmp_path = METRICS_PROM + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, METRICS_PROM)
+
+
+def rotate_metrics_log():
+    """Replace the previous METRICS_LOG.1 with the current log.
+
+    Other processes may append to the log or rotate it at the same time, so
+    it is only moved while it is still over the limit.
+    """
+    try:
+        if os.path.getsize(METRICS_LOG) > METRICS_LOG_MAX_SIZE:
+            os.replace(METRICS_LOG, METRICS_LOG + ".1")
+    except FileNotFoundError:
+        pass
+
+
+def record_metrics(stage, event, **values):
+    """Log a metrics event as a JSON line and update the Prometheus gauges."""
+    entry = {"time": time.time(), "stage": stage, "event": event, **values}
+    with metrics_lock:
+        with open(METRICS_LOG, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            size = f.tell()
+        if size > METRICS_LOG_MAX_SIZE:
+            rotate_metrics_log()
+        stage_metrics.setdefault(stage, {}).update(
+            {
+                k: v
+                for k, v in values.items()
+                if k != "pid" and isinstance(v, (int, float))
+            }
         )
+        write_prometheus_metrics()
 
-        # Run the ffmpeg command
-        stream.run(capture_stdout=True, capture_stderr=True)
-        print(f"Successfully normalized: {input_path}")
 
-    except ffmpeg.Error as e:
-        print(f"Error normalizing {input_path}: {e.stderr.decode()}")
-        if os.path.exists(output_path):
-            os.remove(output_path)
+def start_ffmpeg(stream, stage, stdin=None, stdout=subprocess.DEVNULL):
+    """Start ffmpeg with -progress on a private pipe and monitor it.
 
+    Progress blocks are parsed as they arrive and recorded as metrics for
+    the stage, the latest one is kept in the monitor. The stage can be
+    changed in the monitor while ffmpeg runs. stderr is drained into
+    a bounded tail. Returns the process and a monitor dict for wait_ffmpeg.
+    """
+    read_fd, write_fd = os.pipe()
+    args = stream.global_args(
+        "-nostats",
+        "-progress",
+        f"pipe:{write_fd}",
+        "-stats_period",
+        str(METRICS_INTERVAL),
+    ).compile()
+    process = subprocess.Popen(
+        args, stdin=stdin, stdout=stdout, stderr=subprocess.PIPE, pass_fds=[write_fd]
+    )
+    os.close(write_fd)
 
-def download_videos(playlist_url):
-    """Download videos from playlist"""
-    video_opts = get_base_options()
-    video_opts.update(
-        {
-            "format": "bestvideo[height<=1080][vcodec^=avc1]",  # Best video only
-            "outtmpl": {
-                "default": os.path.join(DL_DIR, "%(title)s_video.%(ext)s"),
-            },
-            "download_ranges": lambda info_dict, ydl: [
-                {
-                    "start_time": VIDEO_SKIP_START,
-                    "end_time": VIDEO_SKIP_START + VIDEO_DURATION,
-                }
-            ],
-        }
+    monitor = {
+        "args": args,
+        "stage": stage,
+        "started": time.monotonic(),
+        "stderr": deque(maxlen=STDERR_TAIL_LINES),
+        "progress": None,
+        "progress_time": None,
+    }
+
+    def read_progress():
+        block = {}
+        with os.fdopen(read_fd) as progress:
+            for line in progress:
+                key, _, value = line.strip().partition("=")
+                block[key] = value
+                if key == "progress":
+                    monitor["progress"] = parse_progress(block)
+                    monitor["progress_time"] = time.monotonic()
+                    record_metrics(
+                        monitor["stage"],
+                        "progress",
+                        pid=process.pid,
+                        **monitor["progress"],
+                    )
+                    block = {}
+
+    def read_stderr():
+        for line in process.stderr:
+            monitor["stderr"].append(line)
+
+    monitor["threads"] = [
+        threading.Thread(target=read_progress, daemon=True),
+        threading.Thread(target=read_stderr, daemon=True),
+    ]
+    for thread in monitor["threads"]:
+        thread.start()
+
+    record_metrics(stage, "start", pid=process.pid, running=1)
+    return process, monitor
+
+
+def wait_ffmpeg(process, monitor):
+    """Wait for a process from start_ffmpeg, raising ffmpeg.Error on failure."""
+    returncode = process.wait()
+    for thread in monitor["threads"]:
+        thread.join()
+
+    duration = time.monotonic() - monitor["started"]
+    record_metrics(
+        monitor["stage"],
+        "end",
+        pid=process.pid,
+        running=0,
+        exit_code=returncode,
+        ffmpeg_duration_seconds=duration,
     )
 
-    with youtube_dl.YoutubeDL(video_opts) as ydl:
-        ydl.download([playlist_url])
-        ## If video downloaded, normalize it
+    stderr = b"".join(monitor["stderr"])
+    if returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, stderr)
+    return None, stderr
 
-    # Process all downloaded videos
-    for filename in os.listdir(DL_DIR):
-        if filename.endswith("_video.mp4") and not filename.endswith(
-            "_normalized_video.mp4"
-        ):
-            input_path = os.path.join(DL_DIR, filename)
-            normalize_video(input_path)
 
+def run_ffmpeg(stream, stage):
+    """Run an ffmpeg-python stream with progress metrics, like stream.run()."""
+    return wait_ffmpeg(*start_ffmpeg(stream, stage))
 
-def download_audio(playlist_url):
-    """Download audio from playlist"""
-    audio_opts = get_base_options()
-    audio_opts.update(
-        {
-            "format": "bestaudio[ext=m4a]",  # Best audio only
-            "extract_audio": True,
-            "outtmpl": {
-                "default": os.path.join(DL_DIR, "%(title)s_audio.%(ext)s"),
-            },
-            "download_ranges": lambda info_dict, ydl: [
-                {
-                    "start_time": AUDIO_SKIP_START,
-                    "end_time": AUDIO_SKIP_START + AUDIO_DURATION,
-                }
-            ],
-        }
+
+def record_stage(stage, func, *args, **kwargs):
+    """Run a pipeline stage and record how long it took."""
+    started = time.monotonic()
+    record_metrics(stage, "stage_start", stage_running=1)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        record_metrics(
+            stage,
+            "stage_end",
+            stage_running=0,
+            stage_duration_seconds=time.monotonic() - started,
+        )
+
+
+MEDIA_SUFFIXES = ["_video_normalized.mp4", "_video.mp4", "_audio.m4a"]
+
+
+def get_media_stem(filename):
+    """Return the playlist entry a downloaded file belongs to."""
+    for suffix in MEDIA_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[: -len(suffix)]
+    return os.path.splitext(filename)[0]
+
+
+def open_media_index(readonly=False):
+    """Open the media index, creating its tables on first use.
+
+    A readonly connection raises sqlite3.OperationalError when there is no
+    index yet and never creates tables.
+    """
+    if readonly:
+        conn = sqlite3.connect(f"file:{MEDIA_INDEX}?mode=ro", uri=True, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+    conn = sqlite3.connect(MEDIA_INDEX, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS media (
+            path TEXT PRIMARY KEY,
+            stem TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            duration REAL,
+            codec TEXT,
+            width INTEGER,
+            height INTEGER,
+            fps REAL
+        );
+        CREATE TABLE IF NOT EXISTS sources (
+            stem TEXT PRIMARY KEY,
+            video_id TEXT,
+            title TEXT
+        );
+        CREATE TABLE IF NOT EXISTS digests (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha1 TEXT NOT NULL
+        );
+        """
     )
+    return conn
 
-    with youtube_dl.YoutubeDL(audio_opts) as ydl:
-        ydl.download([playlist_url])
 
+def probe_media(path):
+    """Probe a media file and return the fields stored in the index."""
+    probe = ffmpeg.probe(path)
+    stream = probe["streams"][0]
+    fps = None
+    if stream.get("codec_type") == "video":
+        num, den = stream.get("r_frame_rate", "0/1").split("/")
+        fps = float(num) / float(den) if float(den) else None
 
-def create_video_mix(output_filename="output_video.mp4"):
-    """Create a mix of all normalized videos with fade transitions."""
-    # Get all normalized videos
-    videos = []
-    for filename in sorted(os.listdir(DL_DIR)):
-        if filename.endswith("_normalized.mp4"):
-            video_path = os.path.join(DL_DIR, filename)
-            videos.append(video_path)
-            # Print debug info about the video
-            probe = ffmpeg.probe(video_path)
-            duration = float(probe["streams"][0]["duration"])
-            print(f"Video: {filename}, Duration: {duration:.2f} seconds")
+    return {
+        "duration": float(
+            stream.get("duration") or probe["format"].get("duration") or 0
+        ),
+        "codec": stream.get("codec_name"),
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+        "fps": fps,
+    }
 
-    if not videos:
-        print("No videos found to mix!")
+
+def try_probe_media(path):
+    """Probe a media file, returning the ffmpeg.Error instead of raising it."""
+    try:
+        return probe_media(path)
+    except ffmpeg.Error as e:
+        return e
+
+
+def index_media(paths):
+    """Add or refresh index entries, probing only new or changed files.
+
+    Files ffprobe cannot read are reported and left out of the index, so one
+    truncated download does not stop every stage. Returns the ffmpeg.Error of
+    each of them by path.
+    """
+    failed = {}
+    with open_media_index() as conn:
+        stale = []
+        for path in paths:
+            stat = os.stat(path)
+            row = conn.execute(
+                "SELECT size, mtime_ns FROM media WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None or (row["size"], row["mtime_ns"]) != (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                stale.append((path, stat))
+
+        if stale:
+            print(f"Indexing {len(stale)} media files")
+            with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+                probes = executor.map(lambda item: try_probe_media(item[0]), stale)
+                for (path, stat), info in zip(stale, probes):
+                    if isinstance(info, ffmpeg.Error):
+                        print(
+                            f"Skipping unreadable media file {path}: "
+                            f"{info.stderr.decode().strip()}"
+                        )
+                        conn.execute("DELETE FROM media WHERE path = ?", (path,))
+                        failed[path] = info
+                        continue
+                    conn.execute(
+                        "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            path,
+                            get_media_stem(os.path.basename(path)),
+                            stat.st_size,
+                            stat.st_mtime_ns,
+                            info["duration"],
+                            info["codec"],
+                            info["width"],
+                            info["height"],
+                            info["fps"],
+                        ),
+                    )
+    conn.close()
+    return failed
+
+
+def update_media_index(directory=DL_DIR):
+    """Bring the index of a directory up to date and drop deleted files."""
+    paths = [
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if filename.endswith((".mp4", ".m4a"))
+    ]
+    index_media(paths)
+
+    with open_media_index() as conn:
+        for row in conn.execute(
+            "SELECT path FROM media WHERE path LIKE ?", (directory + "/%",)
+        ).fetchall():
+            if not os.path.exists(row["path"]):
+                conn.execute("DELETE FROM media WHERE path = ?", (row["path"],))
+    conn.close()
+
+
+def select_indexed_media(conn, suffix, directory):
+    """Return the index entries of files in directory ending with suffix."""
+    rows = conn.execute(
+        "SELECT media.*, sources.video_id, sources.title FROM media "
+        "LEFT JOIN sources ON sources.stem = media.stem "
+        "WHERE media.path LIKE ? ORDER BY media.path",
+        (directory + "/%",),
+    ).fetchall()
+    return [dict(row) for row in rows if row["path"].endswith(suffix)]
+
+
+def get_indexed_media(suffix, directory=DL_DIR):
+    """Return the indexed files ending with suffix, sorted by filename."""
+    update_media_index(directory)
+
+    with open_media_index() as conn:
+        media = select_indexed_media(conn, suffix, directory)
+    conn.close()
+    return media
+
+
+def read_indexed_media(suffix, directory=DL_DIR):
+    """Return what get_indexed_media would, without probing or writing.
+
+    Returns None when the index is missing or out of date for any of the
+    files, as a dry run cannot tell what they contain.
+    """
+    if not os.path.exists(MEDIA_INDEX):
+        return None
+    conn = open_media_index(readonly=True)
+    with conn:
+        media = select_indexed_media(conn, suffix, directory)
+    conn.close()
+
+    paths = sorted(
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if filename.endswith(suffix)
+    )
+    if [entry["path"] for entry in media] != paths:
+        return None
+    for entry in media:
+        stat = os.stat(entry["path"])
+        if (stat.st_size, stat.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+            return None
+    return media
+
+
+def get_media_info(path):
+    """Return the index entry for a single file, probing it if needed.
+
+    Raises the probe's ffmpeg.Error if the file cannot be read.
+    """
+    failed = index_media([path])
+    if path in failed:
+        raise failed[path]
+
+    with open_media_index() as conn:
+        row = conn.execute("SELECT * FROM media WHERE path = ?", (path,)).fetchone()
+    conn.close()
+    return dict(row)
+
+
+def record_download(progress):
+    """yt-dlp progress hook storing the title and video ID of a download."""
+    if progress["status"] != "finished":
         return
 
-    print(f"Total videos to mix: {len(videos)}")
+    info = progress.get("info_dict", {})
+    record_source(progress["filename"], info.get("id"), info.get("title"))
+
+
+def record_source(path, video_id, title):
+    """Store the video ID and title of a downloaded file in the media index."""
+    stem = get_media_stem(os.path.basename(path))
+    with open_media_index() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+            (stem, video_id, title),
+        )
+    conn.close()
+
+
+def get_source_id(path):
+    """Return the video ID a downloaded file was recorded with, if any."""
+    stem = get_media_stem(os.path.basename(path))
+    with open_media_index() as conn:
+        row = conn.execute(
+            "SELECT video_id FROM sources WHERE stem = ?", (stem,)
+        ).fetchone()
+    conn.close()
+    return row["video_id"] if row else None
+
 
-    # Create ffmpeg input streams
-    inputs = [ffmpeg.input(video) for video in videos]
+def link_file(source_path, link_path):
+    """Atomically hard link a file, copying it across filesystems."""
+    if os.path.exists(link_path) and os.path.samefile(source_path, link_path):
+        return
+    os.makedirs(os.path.dirname(link_path), exist_ok=True)
+    tmp_path = f"{link_path}.{os.getpid()}.link"
+    try:
+        os.link(source_path, tmp_path)
+    except OSError:
+        shutil.copy2(source_path, tmp_path)
+    os.replace(tmp_path, link_path)
+
+
+def get_shared_path(video_id, kind, filename):
+    """Return where SOURCE_DIR keeps a file of a video, e.g. its audio."""
+    return os.path.join(SOURCE_DIR, video_id, kind, filename)
+
+
+def link_shared_download(entry, name):
+    """Link a download pass of an entry from SOURCE_DIR into DL_DIR.
+
+    Returns whether another workspace already downloaded it, in which case
+    the link is recorded in the manifest like a finished download.
+    """
+    shared_dir = os.path.dirname(get_shared_path(entry["id"], name, "_"))
+    if not os.path.isdir(shared_dir) or not os.listdir(shared_dir):
+        return False
+
+    filename = sorted(os.listdir(shared_dir))[0]
+    path = os.path.join(DL_DIR, filename)
+    print(f"Linking shared {name}: {filename}")
+    link_file(os.path.join(shared_dir, filename), path)
+    record_source(path, entry["id"], entry["title"])
+    entry["files"][name] = {"path": path, "format_id": None}
+    return True
+
+
+def get_normalize_params(target_width=1920, target_height=1080):
+    """Return the settings that are part of the key of a normalized copy."""
+    return {
+        "width": target_width,
+        "height": target_height,
+        "fps": NORMALIZE_FPS,
+        "timescale": NORMALIZE_TIMESCALE,
+        "encoder": NORMALIZE_ENCODER_OPTS,
+    }
+
+
+def get_normalize_key(input_path, target_width=1920, target_height=1080):
+    """Return the stage cache key of the normalized copy of a video."""
+    return get_stage_key(
+        [input_path], get_normalize_params(target_width, target_height)
+    )
 
-    # Build the filter complex
-    filter_chains = []
 
-    # Initialize with first video
-    last_output = inputs[0].video
-    current_duration = VIDEO_DURATION
+def get_shared_normalized_path(input_path, target_width=1920, target_height=1080):
+    """Return where SOURCE_DIR keeps the normalized copy of a video, if shared.
 
-    for i in range(1, len(videos)):
-        # Calculate the offset for the transition
-        # Each video starts (VIDEO_DURATION - TRANSITION_DURATION) seconds after the previous one
-        offset = current_duration - TRANSITION_DURATION
-        current_duration += VIDEO_DURATION - TRANSITION_DURATION
+    Copies are kept per normalize settings, the key of a copy in SOURCE_DIR
+    does not depend on the workspace the source was downloaded to.
+    """
+    video_id = SOURCE_DIR and get_source_id(input_path)
+    if not video_id:
+        return None
+    settings = get_stage_key([], get_normalize_params(target_width, target_height))
+    return get_shared_path(
+        video_id,
+        f"normalized_{settings[:12]}",
+        os.path.basename(get_normalized_path(input_path)),
+    )
+
+
+def get_normalized_path(input_path):
+    """Return where the normalized copy of a downloaded video is stored."""
+    return input_path.replace("_video.", "_video_normalized.")
+
+
+def get_normalize_method(info, target_width=1920, target_height=1080):
+    """Return the cheapest of NORMALIZE_METHODS that makes a video conform."""
+    size_matches = (info["width"], info["height"]) == (target_width, target_height)
+    fps_matches = info["fps"] is not None and abs(info["fps"] - NORMALIZE_FPS) < 0.01
+
+    if size_matches and fps_matches and info["codec"] == "h264":
+        return "copy"
+    if size_matches:
+        return "fps"
+    return "full"
+
+
+def normalize_video(
+    input_path, target_width=1920, target_height=1080, threads=NORMALIZE_THREADS
+):
+    """Normalize video using ffmpeg-python
+
+    Returns the method from NORMALIZE_METHODS that was used, False when
+    ffmpeg failed and None when the normalized copy is up to date with the
+    source and settings.
+    """
+    output_path = get_normalized_path(input_path)
+    key = get_normalize_key(input_path, target_width, target_height)
+
+    if is_stage_current(output_path, key):
+        print(f"Skipping normalization: {input_path}")
+        return None
+
+    shared_path = get_shared_normalized_path(input_path, target_width, target_height)
+    if shared_path and os.path.exists(shared_path):
+        print(f"Linking shared normalized copy: {input_path}")
+        link_file(shared_path, output_path)
+        record_stage_key(output_path, key)
+        return None
+
+    # The old copy may be a hard link into SOURCE_DIR, never write through it
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    method = get_normalize_method(
+        get_media_info(input_path), target_width, target_height
+    )
+    print(f"Normalizing video ({method}): {input_path}")
+    try:
+        if method == "copy":
+            # Already H.264 at the target size and frame rate
+            stream = (
+                ffmpeg.input(input_path)
+                .output(
+                    output_path,
+                    c="copy",
+                    video_track_timescale=NORMALIZE_TIMESCALE,
+                    **{"loglevel": "error"},
+                )
+                .overwrite_output()
+            )
+        else:
+            # Setup the ffmpeg stream with desired parameters
+            video = ffmpeg.input(input_path).filter("fps", fps=NORMALIZE_FPS)
+            if method == "full":
+                video = (
+                    # Scale video to target resolution while maintaining aspect ratio
+                    video.filter(
+                        "scale",
+                        width=f"{target_width}",
+                        height=f"{target_height}",
+                        force_original_aspect_ratio="decrease",
+                    )
+                    # Pad the video if needed to reach exact target dimensions
+                    .filter(
+                        "pad",
+                        width=f"{target_width}",
+                        height=f"{target_height}",
+                        x="(ow-iw)/2",
+                        y="(oh-ih)/2",
+                    )
+                )
+            stream = video.output(
+                output_path,
+                acodec="copy",
+                threads=threads,  # Per-job budget, see NORMALIZE_THREADS
+                video_track_timescale=NORMALIZE_TIMESCALE,
+                **NORMALIZE_ENCODER_OPTS,
+                **{"loglevel": "error"},
+            ).overwrite_output()
+
+        # Run the ffmpeg command
+        run_ffmpeg(stream, "normalize")
+        record_stage_key(output_path, key)
+        if shared_path:
+            link_file(output_path, shared_path)
+        print(f"Successfully normalized: {input_path}")
+        return method
+
+    except ffmpeg.Error as e:
+        print(f"Error normalizing {input_path}: {e.stderr.decode()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+
+
+def run_normalize_job(input_path, threads):
+    """Normalize one video, returning (result, media seconds, elapsed seconds).
+
+    Unexpected errors are reported and counted as a failure so they never
+    take down the rest of the batch.
+    """
+    started = time.monotonic()
+    media_duration = 0.0
+    try:
+        result = normalize_video(input_path, threads=threads)
+        if result:
+            media_duration = get_media_info(input_path)["duration"]
+    except Exception as e:
+        print(f"Error normalizing {input_path}: {e}")
+        result = False
+    return result, media_duration, time.monotonic() - started
+
+
+def new_normalize_results():
+    """Return an empty results dict for record_normalize_result."""
+    return {
+        "normalized": [],
+        "skipped": [],
+        "failed": [],
+        "media_seconds": 0.0,
+        "methods": {
+            method: {"count": 0, "media_seconds": 0.0, "elapsed": 0.0}
+            for method in NORMALIZE_METHODS
+        },
+    }
+
+
+def record_normalize_result(results, input_path, outcome):
+    """Add the outcome of run_normalize_job to a results dict."""
+    result, media_duration, elapsed = outcome
+    if result is None:
+        results["skipped"].append(input_path)
+    elif result:
+        results["normalized"].append(input_path)
+        results["media_seconds"] += media_duration
+        method = results["methods"][result]
+        method["count"] += 1
+        method["media_seconds"] += media_duration
+        method["elapsed"] += elapsed
+        print(f"Normalized {input_path} ({result}) in {elapsed:.1f}s")
+    else:
+        results["failed"].append(input_path)
+
+
+def print_normalize_summary(results, wall_time):
+    """Print counts and throughput of a normalization run.
+
+    The time saved by the copy and fps methods is estimated from the speed
+    of full re-encodes, measured in this run or remembered from earlier ones.
+    """
+    normalized = len(results["normalized"])
+    files_per_minute = normalized / wall_time * 60 if wall_time else 0.0
+    realtime_factor = results["media_seconds"] / wall_time if wall_time else 0.0
+
+    print(
+        f"Normalization finished in {wall_time:.1f}s: {normalized} normalized, "
+        f"{len(results['skipped'])} skipped, {len(results['failed'])} failed"
+    )
+    print(
+        f"Throughput: {files_per_minute:.1f} files/min, "
+        f"{realtime_factor:.1f}x realtime"
+    )
+
+    methods = results["methods"]
+    stats = load_json_cache(NORMALIZE_STATS)
+    if methods["full"]["elapsed"]:
+        full = methods["full"]
+        stats["full_speed"] = full["media_seconds"] / full["elapsed"]
+        save_json_cache(NORMALIZE_STATS, stats)
+
+    print(
+        "Methods: "
+        + ", ".join(f"{methods[method]['count']} {method}" for method in methods)
+    )
+    if stats.get("full_speed"):
+        saved = sum(
+            methods[method]["media_seconds"] / stats["full_speed"]
+            - methods[method]["elapsed"]
+            for method in ["copy", "fps"]
+        )
+        print(f"Time saved against full re-encodes: {saved:.1f}s")
+
+    for input_path in results["failed"]:
+        print(f"Failed: {input_path}")
+
+
+def normalize_videos(input_paths, workers=None, threads=None):
+    """Normalize videos in a worker pool and print a throughput summary.
+
+    ffmpeg does the heavy lifting in a child process, so a thread pool is
+    enough to keep all cores busy. A failing file is reported and does not
+    cancel the rest of the batch.
+    """
+    workers = workers or NORMALIZE_WORKERS
+    threads = threads or max(1, CPU_COUNT // workers)
+    results = new_normalize_results()
+
+    if not input_paths:
+        print("No videos found to normalize!")
+        return results
+
+    print(
+        f"Normalizing {len(input_paths)} videos with {workers} workers "
+        f"({threads} ffmpeg threads each)"
+    )
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_normalize_job, path, threads): path
+            for path in input_paths
+        }
+        for future in as_completed(futures):
+            record_normalize_result(results, futures[future], future.result())
+
+    print_normalize_summary(results, time.monotonic() - started)
+    return results
+
+
+def get_video_options():
+    """Return download options for the video pass"""
+    video_opts = get_base_options()
+    video_opts.update(
+        {
+            "format": "bestvideo[height<=1080][vcodec^=avc1]",  # Best video only
+            "outtmpl": {
+                "default": os.path.join(DL_DIR, "%(title)s_video.%(ext)s"),
+            },
+            "download_ranges": lambda info_dict, ydl: [
+                {
+                    "start_time": VIDEO_SKIP_START,
+                    "end_time": VIDEO_SKIP_START + VIDEO_DURATION,
+                }
+            ],
+        }
+    )
+    return video_opts
+
+
+def get_audio_options():
+    """Return download options for the audio pass"""
+    audio_opts = get_base_options()
+    audio_opts.update(
+        {
+            "format": "bestaudio[ext=m4a]",  # Best audio only
+            "extract_audio": True,
+            "outtmpl": {
+                "default": os.path.join(DL_DIR, "%(title)s_audio.%(ext)s"),
+            },
+            "download_ranges": lambda info_dict, ydl: [
+                {
+                    "start_time": AUDIO_SKIP_START,
+                    "end_time": AUDIO_SKIP_START + AUDIO_DURATION,
+                }
+            ],
+        }
+    )
+    return audio_opts
+
+
+def get_downloaded_videos():
+    """Return all downloaded, not yet normalized videos."""
+    return [
+        os.path.join(DL_DIR, filename)
+        for filename in sorted(os.listdir(DL_DIR))
+        if filename.endswith("_video.mp4")
+        and not filename.endswith("_normalized_video.mp4")
+    ]
+
+
+def get_playlist_manifest(playlist_url, ydl_class=youtube_dl.YoutubeDL):
+    """Return the cached playlist manifest, extracting only what is missing.
+
+    The manifest stores the playlist's entry IDs and titles and the
+    unprocessed info of every entry, so both download passes can run their
+    own format selection on it without extracting the playlist again. On a
+    re-run only new entries, and expired entries that still have files to
+    download, are extracted.
+    """
+    manifest_path = os.path.join(
+        MANIFEST_DIR, hashlib.sha1(playlist_url.encode()).hexdigest() + ".json"
+    )
+    manifest = load_json_cache(manifest_path)
+    manifest.setdefault("url", playlist_url)
+    manifest.setdefault("entries", [])
+    now = time.time()
+
+    with ydl_class(get_base_options()) as ydl:
+        if now - manifest.get("listed_at", 0) > PLAYLIST_TTL:
+            print(f"Listing playlist: {playlist_url}")
+            listing = ydl.extract_info(playlist_url, download=False, process=False)
+            flat_entries = listing.get("entries")
+            if flat_entries is None:
+                # A single video instead of a playlist
+                flat_entries = [{**listing, "url": playlist_url}]
+
+            known = {entry["id"]: entry for entry in manifest["entries"]}
+            entries = []
+            for flat_entry in flat_entries:
+                if not flat_entry:
+                    continue
+                entry = known.get(flat_entry["id"]) or {
+                    "id": flat_entry["id"],
+                    "title": flat_entry.get("title"),
+                    "url": flat_entry.get("url") or flat_entry.get("webpage_url"),
+                    "files": {},
+                }
+                entries.append(entry)
+
+            added = len(set(e["id"] for e in entries) - set(known))
+            removed = len(set(known) - set(e["id"] for e in entries))
+            print(
+                f"Playlist has {len(entries)} entries "
+                f"({added} new, {removed} removed)"
+            )
+            manifest["entries"] = entries
+            manifest["listed_at"] = now
+
+        for entry in manifest["entries"]:
+            expired = now - entry.get("extracted_at", 0) > ENTRY_TTL
+            if "info" in entry and not (expired and entry_needs_download(entry)):
+                continue
+
+            try:
+                info = ydl.extract_info(entry["url"], download=False, process=False)
+            except Exception as e:
+                print(f"Error extracting {entry['url']}: {e}")
+                continue
+            if not info:
+                continue
+            entry["info"] = ydl.sanitize_info(info)
+            entry["title"] = info.get("title", entry["title"])
+            entry["extracted_at"] = now
+
+    manifest["path"] = manifest_path
+    save_json_cache(manifest_path, manifest)
+    return manifest
+
+
+def entry_needs_download(entry, passes=("video", "audio")):
+    """Check whether any download pass still has to fetch a manifest entry.
+
+    A video that was evicted after it was normalized is not needed again.
+    """
+
+    def is_missing(name):
+        path = entry["files"].get(name, {}).get("path", "")
+        if name == "video" and path and os.path.exists(get_normalized_path(path)):
+            return False
+        return not os.path.exists(path)
+
+    return any(is_missing(name) for name in passes)
+
+
+def download_entries(ydl, manifest, name, on_linked=None):
+    """Download every manifest entry the named pass has not fetched yet.
+
+    Format selection runs on the cached entry info through process_ie_result,
+    and the file and chosen format of each finished download are recorded in
+    the manifest. With SOURCE_DIR set, entries another workspace downloaded
+    are linked instead and passed to on_linked.
+    """
+
+    def on_finished(progress):
+        if (
+            progress["status"] == "finished"
+            and progress["postprocessor"] == "MoveFiles"
+        ):
+            info = progress["info_dict"]
+            for entry in manifest["entries"]:
+                if entry["id"] == info.get("id"):
+                    entry["files"][name] = {
+                        "path": info["filepath"],
+                        "format_id": info.get("format_id"),
+                    }
+            if SOURCE_DIR and info.get("id"):
+                filepath = info["filepath"]
+                link_file(
+                    filepath,
+                    get_shared_path(info["id"], name, os.path.basename(filepath)),
+                )
+
+    ydl.add_postprocessor_hook(on_finished)
+
+    for entry in manifest["entries"]:
+        if "info" not in entry or not entry_needs_download(entry, [name]):
+            continue
+        if SOURCE_DIR and link_shared_download(entry, name):
+            if on_linked:
+                on_linked(entry["files"][name]["path"])
+            continue
+        try:
+            ydl.process_ie_result(copy.deepcopy(entry["info"]), download=True)
+        except Exception as e:
+            print(f"Error downloading {name} of {entry['id']}: {e}")
+
+
+def save_manifest(manifest):
+    """Write a manifest returned by get_playlist_manifest back to disk."""
+    save_json_cache(manifest["path"], manifest)
+
+
+def download_videos(playlist_url, workers=None, threads=None):
+    """Download videos from playlist"""
+    manifest = get_playlist_manifest(playlist_url)
+    with youtube_dl.YoutubeDL(get_video_options()) as ydl:
+        download_entries(ydl, manifest, "video")
+        ## If video downloaded, normalize it
+    save_manifest(manifest)
+
+    # Process all downloaded videos
+    normalize_videos(get_downloaded_videos(), workers=workers, threads=threads)
+
+
+def download_audio(playlist_url):
+    """Download audio from playlist"""
+    manifest = get_playlist_manifest(playlist_url)
+    with youtube_dl.YoutubeDL(get_audio_options()) as ydl:
+        download_entries(ydl, manifest, "audio")
+    save_manifest(manifest)
+
+
+def download_pipeline(
+    playlist_url,
+    workers=None,
+    threads=None,
+    queue_size=PIPELINE_QUEUE_SIZE,
+    ydl_class=youtube_dl.YoutubeDL,
+):
+    """Download video and audio concurrently and normalize while downloading.
+
+    The video and audio passes run in their own threads. A yt-dlp
+    postprocessor hook hands every finished video to a bounded queue that
+    feeds a pool of normalization workers, so the network and the CPU are
+    busy at the same time. A full queue blocks the video download until a
+    worker frees up. After the video pass, videos downloaded by earlier runs
+    are queued too when their normalized copy is missing or out of date, e.g.
+    after a failed normalization or changed settings. ydl_class can be
+    replaced by a stub that produces local files.
+    """
+    workers = workers or NORMALIZE_WORKERS
+    threads = threads or max(1, CPU_COUNT // workers)
+    pending = queue.Queue(maxsize=queue_size)
+    queued = set()
+    results = new_normalize_results()
+    results_lock = threading.Lock()
+    timings = {}
+
+    def enqueue(input_path):
+        if input_path.endswith("_video.mp4") and input_path not in queued:
+            queued.add(input_path)
+            pending.put(input_path)
+
+    def on_video_finished(progress):
+        # MoveFiles is the last postprocessor, the file is final at this point
+        if (
+            progress["status"] == "finished"
+            and progress["postprocessor"] == "MoveFiles"
+        ):
+            enqueue(progress["info_dict"]["filepath"])
+
+    def download(name, options, on_linked=None):
+        started = time.monotonic()
+        try:
+            with ydl_class(options) as ydl:
+                download_entries(ydl, manifest, name, on_linked)
+        except Exception as e:
+            print(f"Error downloading {name}: {e}")
+        timings[f"download_{name}"] = time.monotonic() - started
+
+    def normalize_worker():
+        while True:
+            input_path = pending.get()
+            if input_path is None:
+                break
+            started = time.monotonic()
+            outcome = run_normalize_job(input_path, threads)
+            with results_lock:
+                record_normalize_result(results, input_path, outcome)
+                timings["normalize_busy"] = (
+                    timings.get("normalize_busy", 0.0) + time.monotonic() - started
+                )
+
+    print(
+        f"Starting download pipeline with {workers} normalization workers "
+        f"({threads} ffmpeg threads each)"
+    )
+    started = time.monotonic()
+    manifest = get_playlist_manifest(playlist_url, ydl_class)
+    timings["extract"] = time.monotonic() - started
+
+    video_opts = get_video_options()
+    video_opts["postprocessor_hooks"] = [on_video_finished]
+    downloaders = [
+        threading.Thread(target=download, args=("video", video_opts, enqueue)),
+        threading.Thread(target=download, args=("audio", get_audio_options())),
+    ]
+    normalizers = [threading.Thread(target=normalize_worker) for _ in range(workers)]
+    for thread in downloaders + normalizers:
+        thread.start()
+
+    downloaders[0].join()
+    for input_path in get_downloaded_videos():
+        if not is_stage_current(
+            get_normalized_path(input_path), get_normalize_key(input_path)
+        ):
+            enqueue(input_path)
+    for _ in normalizers:
+        pending.put(None)
+
+    for thread in downloaders + normalizers:
+        thread.join()
+    save_manifest(manifest)
+    wall_time = time.monotonic() - started
+
+    print_normalize_summary(results, wall_time)
+    print("Pipeline stage timings:")
+    for stage in ["extract", "download_video", "download_audio", "normalize_busy"]:
+        print(f"  {stage}: {timings.get(stage, 0.0):.1f}s")
+    print(f"  total: {wall_time:.1f}s")
+
+    return results
+
+
+def get_video_segments(videos, durations):
+    """Split the xfade timeline into clip bodies and pairwise crossfades.
+
+    Every clip plays for its indexed duration and overlaps its neighbours by
+    TRANSITION_DURATION, exactly like the single xfade chain.
+    """
+    segments = []
+    for i, video in enumerate(videos):
+        start = TRANSITION_DURATION if i > 0 else 0
+        end = durations[i] - TRANSITION_DURATION
+        if i == len(videos) - 1:
+            end = durations[i]
+        segments.append({"type": "body", "inputs": [video], "start": start, "end": end})
+
+        if i < len(videos) - 1:
+            segments.append(
+                {
+                    "type": "fade",
+                    "inputs": [video, videos[i + 1]],
+                    "start": end,
+                }
+            )
+    return segments
+
+
+def get_segment_path(segment, encoder_opts=SEGMENT_ENCODER_OPTS):
+    """Return the cache path of a segment, keyed by its inputs and settings."""
+    key = json.dumps(
+        {
+            "segment": segment,
+            "inputs": [file_stamp(path) for path in segment["inputs"]],
+            "transition_duration": TRANSITION_DURATION,
+            "encoder": encoder_opts,
+        },
+        sort_keys=True,
+    )
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(VIDEO_SEGMENT_DIR, f"{segment['type']}_{digest}.mp4")
+
+
+def encode_video_segment(
+    segment, output_path, threads=NORMALIZE_THREADS, encoder_opts=SEGMENT_ENCODER_OPTS
+):
+    """Encode one clip body or crossfade segment of the video mix."""
+    if segment["type"] == "body":
+        video = ffmpeg.input(
+            segment["inputs"][0],
+            ss=segment["start"],
+            t=segment["end"] - segment["start"],
+        ).video
+    else:
+        outgoing = ffmpeg.input(
+            segment["inputs"][0],
+            ss=segment["start"],
+            t=TRANSITION_DURATION,
+        ).video
+        incoming = ffmpeg.input(segment["inputs"][1], t=TRANSITION_DURATION).video
+        video = ffmpeg.filter(
+            [outgoing, incoming],
+            "xfade",
+            transition="fade",
+            duration=TRANSITION_DURATION,
+            offset=0,
+        )
+
+    tmp_path = os.path.join(TMP_DIR, os.path.basename(output_path))
+    try:
+        stream = ffmpeg.output(
+            video,
+            tmp_path,
+            an=None,
+            threads=threads,
+            **encoder_opts,
+            **{"loglevel": "error"},
+        ).overwrite_output()
+        run_ffmpeg(stream, "video_segment")
+        os.rename(tmp_path, output_path)
+    except ffmpeg.Error:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def create_segmented_video_mix(
+    videos,
+    durations,
+    output_filename="output_video.mp4",
+    stage_key=None,
+    encoder_opts=SEGMENT_ENCODER_OPTS,
+):
+    """Create the video mix from cached segments joined with stream copy.
+
+    Only segments whose inputs or settings changed are encoded, so adding,
+    removing or reordering one video re-encodes just the segments it touches.
+    """
+    segments = get_video_segments(videos, durations)
+    segment_paths = [get_segment_path(segment, encoder_opts) for segment in segments]
+    pending = [
+        (segment, path)
+        for segment, path in zip(segments, segment_paths)
+        if not os.path.exists(path)
+    ]
+    print(
+        f"Video segments: {len(segments) - len(pending)} cached, "
+        f"{len(pending)} to encode"
+    )
+
+    output_path = os.path.join(TMP_DIR, output_filename)
+    list_path = os.path.join(TMP_DIR, "video_segments.txt")
+
+    try:
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=NORMALIZE_WORKERS) as executor:
+            futures = [
+                executor.submit(
+                    encode_video_segment, segment, path, encoder_opts=encoder_opts
+                )
+                for segment, path in pending
+            ]
+            for future in as_completed(futures):
+                future.result()
+        if pending:
+            elapsed = time.monotonic() - started
+            print(f"Encoded {len(pending)} segments in {elapsed:.1f}s")
+
+        with open(list_path, "w") as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+
+        stream = (
+            ffmpeg.input(list_path, f="concat", safe=0)
+            .output(output_path, c="copy", an=None)
+            .overwrite_output()
+        )
+
+        # Print the generated command for debugging
+        print("Generated ffmpeg command:")
+        print(stream.compile())
+
+        run_ffmpeg(stream, "video_mix")
+        print(f"Successfully created video mix: {output_path}")
+
+        publish_output(output_path, stage_key, videos + segment_paths)
+
+    except ffmpeg.Error as e:
+        print(f"Error creating video mix: {e.stderr.decode()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+
+def crossfade_in_groups(
+    paths,
+    durations,
+    open_input,
+    crossfade,
+    output_path,
+    output_opts,
+    intermediate_suffix,
+    intermediate_opts,
+    stage,
+):
+    """Crossfade files with chains of at most MIX_GROUP_SIZE inputs.
+
+    A playlist that fits in one group is mixed by a single chain. Larger ones
+    are split into balanced groups that are mixed into intermediate files,
+    and the intermediates are joined the same way until one chain is left.
+    A group lasts the sum of its inputs minus one TRANSITION_DURATION per
+    crossfade, so joining groups with the same overlap puts every transition
+    at the offset it has in one linear chain.
+
+    open_input(path, level) returns the stream of an input at a level of the
+    hierarchy, crossfade(previous, current, offset) joins two streams.
+    """
+    level = 0
+    intermediates = []
+    try:
+        while True:
+            group_count = math.ceil(len(paths) / MIX_GROUP_SIZE)
+            group_size = math.ceil(len(paths) / group_count)
+            if group_count > 1:
+                print(
+                    f"Mixing level {level}: {len(paths)} inputs "
+                    f"in {group_count} groups"
+                )
+
+            group_paths = []
+            group_durations = []
+            for first in range(0, len(paths), group_size):
+                group = range(first, min(first + group_size, len(paths)))
+                last_output = open_input(paths[first], level)
+                current_duration = durations[first]
+
+                for i in group[1:]:
+                    # Each input starts TRANSITION_DURATION seconds before
+                    # the previous one ends
+                    offset = current_duration - TRANSITION_DURATION
+                    current_duration += durations[i] - TRANSITION_DURATION
+
+                    print(f"Adding input {i} at offset: {offset:.2f}s")
+                    last_output = crossfade(
+                        last_output, open_input(paths[i], level), offset
+                    )
+
+                if group_count == 1:
+                    stream = ffmpeg.output(last_output, output_path, **output_opts)
+                    stream = stream.overwrite_output()
+                else:
+                    group_path = os.path.join(
+                        TMP_DIR,
+                        f"{stage}_{level}_{first // group_size:04d}"
+                        + intermediate_suffix,
+                    )
+                    intermediates.append(group_path)
+                    group_paths.append(group_path)
+                    group_durations.append(current_duration)
+                    stream = ffmpeg.output(
+                        last_output,
+                        group_path,
+                        **intermediate_opts,
+                        **{"loglevel": "error"},
+                    ).overwrite_output()
+
+                # Print the generated command for debugging
+                print("Generated ffmpeg command:")
+                print(stream.compile())
+
+                run_ffmpeg(stream, stage)
+
+            if group_count == 1:
+                return
+
+            # The inputs of this level are no longer needed
+            for path in paths:
+                if path in intermediates:
+                    os.remove(path)
+                    intermediates.remove(path)
+            paths, durations = group_paths, group_durations
+            level += 1
+    finally:
+        for path in intermediates:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def get_video_mix_key(videos, mode=VIDEO_MIX_MODE):
+    """Return the stage cache key of the video mix of these clips."""
+    return get_stage_key(
+        videos,
+        {
+            "mode": mode,
+            "transition_duration": TRANSITION_DURATION,
+            "encoder": SEGMENT_ENCODER_OPTS if mode == "segments" else None,
+        },
+    )
+
+
+def create_video_mix(output_filename="output_video.mp4", mode=VIDEO_MIX_MODE):
+    """Create a mix of all normalized videos with fade transitions.
+
+    The mix is skipped when it was already built from the same clips with
+    the same settings.
+    """
+    # Get all normalized videos
+    videos = []
+    durations = []
+    for media in get_indexed_media("_normalized.mp4"):
+        videos.append(media["path"])
+        durations.append(media["duration"])
+        # Print debug info about the video
+        filename = os.path.basename(media["path"])
+        print(f"Video: {filename}, Duration: {media['duration']:.2f} seconds")
+
+    if not videos:
+        print("No videos found to mix!")
+        return
+
+    print(f"Total videos to mix: {len(videos)}")
+
+    stage_key = get_video_mix_key(videos, mode)
+    if is_stage_current(os.path.join(RENDERED_DIR, output_filename), stage_key):
+        print(f"Video mix is up to date: {output_filename}")
+        return
+
+    if mode == "segments":
+        create_segmented_video_mix(videos, durations, output_filename, stage_key)
+        return
+
+    # Output path
+    output_path = os.path.join(TMP_DIR, output_filename)
+
+    try:
+        crossfade_in_groups(
+            videos,
+            durations,
+            lambda path, level: ffmpeg.input(path).video,
+            lambda previous, current, offset: ffmpeg.filter(
+                [previous, current],
+                "xfade",
+                transition="fade",
+                duration=TRANSITION_DURATION,
+                offset=offset,
+            ),
+            output_path,
+            {
+                "vcodec": "libx264",
+                "crf": 23,
+                "preset": "superfast",
+                "an": None,  # Explicitly disable audio
+            },
+            ".mp4",
+            {**MIX_INTERMEDIATE_OPTS["video"], "an": None},
+            "video_mix",
+        )
+        print(f"Successfully created video mix: {output_path}")
+
+        publish_output(output_path, stage_key, videos)
+
+    except ffmpeg.Error as e:
+        print(f"Error creating video mix: {e.stderr.decode()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+
+def get_track_name(media):
+    """Return the display name of an indexed track."""
+    # Prefer the original title, fall back to the restricted filename
+    # with underscores replaced by spaces
+    return media["title"] or media["stem"].replace("_", " ")
+
+
+def get_track_timings(tracks=None, cached_only=False):
+    """Get track names and their start times from the audio files.
+
+    Durations are those of the played part between the crossfade points, so
+    titles line up with the transitions of the audio mix. tracks defaults to
+    the indexed audio files. With cached_only nothing is analyzed and None
+    is returned when a crossfade point is not cached yet.
+    """
+    track_info = []
+    current_time = 0
+
+    if tracks is None:
+        tracks = get_indexed_media("_audio.m4a")
+    points = get_crossfade_points(tracks, cached_only=cached_only)
+    if points is None:
+        return None
+    for media in tracks:
+        start, end = points[media["path"]]
+        track_info.append(
+            {
+                "name": get_track_name(media),
+                "start_time": current_time,
+                "duration": end - start,
+            }
+        )
+        # Account for crossfade
+        current_time += end - start - TRANSITION_DURATION
+
+    return track_info
+
+
+def analyze_loudness(audio_path):
+    """Run the loudnorm measurement pass and return its JSON summary."""
+    stream = (
+        ffmpeg.input(audio_path)
+        .audio.filter("loudnorm", **LOUDNORM_TARGETS, print_format="json")
+        .output("-", format="null")
+    )
+    _, stderr = run_ffmpeg(stream, "loudness_analysis")
+
+    # loudnorm prints its summary as the last JSON object on stderr
+    stderr = stderr.decode(errors="replace")
+    return json.loads(stderr[stderr.rindex("{") : stderr.rindex("}") + 1])
+
+
+def measure_loudness(audio_files, workers=None):
+    """Return loudnorm measurements for each file, analyzing only new content.
+
+    Measurements are cached by file content and loudnorm targets, so re-mixing
+    a playlist where one track changed only re-analyzes that track.
+    """
+    workers = workers or ANALYSIS_WORKERS
+    cache = load_json_cache(LOUDNORM_CACHE)
+    targets = json.dumps(LOUDNORM_TARGETS, sort_keys=True)
+
+    keys = {}
+    for audio_path in audio_files:
+        keys[audio_path] = hashlib.sha1(
+            f"{file_digest(audio_path)}\0{targets}".encode()
+        ).hexdigest()
+
+    pending = [path for path in audio_files if keys[path] not in cache]
+    print(
+        f"Loudness analysis: {len(audio_files) - len(pending)} cached, "
+        f"{len(pending)} to analyze"
+    )
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(analyze_loudness, path): path for path in pending
+            }
+            for future in as_completed(futures):
+                audio_path = futures[future]
+                try:
+                    cache[keys[audio_path]] = future.result()
+                    print(f"Analyzed loudness: {audio_path}")
+                except (ffmpeg.Error, ValueError) as e:
+                    print(f"Error analyzing loudness of {audio_path}: {e}")
+        save_json_cache(LOUDNORM_CACHE, cache)
+
+    return {path: cache.get(keys[path]) for path in audio_files}
+
+
+def loudnorm_params(measurement):
+    """Return linear loudnorm parameters for a cached measurement."""
+    params = dict(LOUDNORM_TARGETS)
+    if measurement is None:
+        # Analysis failed, fall back to single-pass dynamic normalization
+        return params
+
+    params.update(
+        {
+            "measured_I": measurement["input_i"],
+            "measured_TP": measurement["input_tp"],
+            "measured_LRA": measurement["input_lra"],
+            "measured_thresh": measurement["input_thresh"],
+            "offset": measurement["target_offset"],
+            "linear": "true",
+        }
+    )
+    return params
+
+
+def compute_envelopes(audio_path):
+    """Decode a track through a pipe and return its RMS and onset envelopes.
+
+    The PCM is processed in chunks as it arrives, so memory use does not
+    depend on the track length. Every frame covers ENERGY_HOP seconds, the
+    onset envelope is the rise of the log RMS from one frame to the next.
+    """
+    hop = int(ENERGY_SAMPLE_RATE * ENERGY_HOP)
+    process, monitor = start_ffmpeg(
+        ffmpeg.input(audio_path).output(
+            "pipe:",
+            format="f32le",
+            ac=1,
+            ar=ENERGY_SAMPLE_RATE,
+            **{"loglevel": "error"},
+        ),
+        "energy_analysis",
+        stdout=subprocess.PIPE,
+    )
+
+    rms = []
+    remainder = np.empty(0, dtype=np.float32)
+    for chunk in iter(lambda: process.stdout.read(hop * 4 * 1024), b""):
+        samples = np.concatenate([remainder, np.frombuffer(chunk, dtype=np.float32)])
+        frames = len(samples) // hop
+        blocks = samples[: frames * hop].reshape(frames, hop)
+        rms.append(np.sqrt(np.mean(blocks**2, axis=1)))
+        remainder = samples[frames * hop :]
+    process.stdout.close()
+    wait_ffmpeg(process, monitor)
+
+    rms = np.concatenate(rms) if rms else np.empty(0, dtype=np.float32)
+    log_rms = np.log10(rms + 1e-6)
+    onset = np.maximum(np.diff(log_rms, prepend=log_rms[:1]), 0)
+    return rms, onset
+
+
+def get_envelope_path(audio_path, remember=True):
+    """Return where the envelopes of a track are cached.
+
+    The key covers the file content and the analysis settings, remember is
+    passed on to file_digest.
+    """
+    digest = file_digest(audio_path, remember)
+    key = hashlib.sha1(
+        f"{digest}\0{ENERGY_SAMPLE_RATE}\0{ENERGY_HOP}".encode()
+    ).hexdigest()
+    return os.path.join(ENVELOPE_DIR, f"{key}.npz")
+
+
+def load_envelopes(audio_path):
+    """Return the cached envelopes of a track, computing them if needed.
+
+    Envelopes are cached as float16 arrays. Returns None when the track
+    cannot be decoded.
+    """
+    envelope_path = get_envelope_path(audio_path)
+    key = os.path.splitext(os.path.basename(envelope_path))[0]
+
+    if not os.path.exists(envelope_path):
+        try:
+            rms, onset = compute_envelopes(audio_path)
+        except ffmpeg.Error as e:
+            print(f"Error analyzing energy of {audio_path}: {e.stderr.decode()}")
+            return None
+
+        tmp_path = os.path.join(TMP_DIR, f"{key}.npz")
+        np.savez(tmp_path, rms=rms.astype(np.float16), onset=onset.astype(np.float16))
+        os.rename(tmp_path, envelope_path)
+        print(f"Analyzed energy: {audio_path}")
+
+    with np.load(envelope_path) as envelopes:
+        return envelopes["rms"].astype(np.float32), envelopes["onset"].astype(
+            np.float32
+        )
+
+
+def pick_crossfade_points(envelopes, duration):
+    """Return the (in, out) points of a track in seconds.
+
+    The in point starts the fade-in and the out point ends the fade-out. Both
+    are searched within CROSSFADE_SEARCH seconds of the track edges, scoring
+    every candidate by the mean level over the fade plus the onset strength
+    at the cut, so fades avoid loud passages and cuts avoid hitting a beat.
+    Candidates within CROSSFADE_TOLERANCE of the best score count as ties,
+    which go to the candidate closest to the track edge, so flat or silent
+    tracks keep their full length. At least three TRANSITION_DURATIONs of the
+    track are always kept.
+    """
+    fade_frames = max(1, round(TRANSITION_DURATION / ENERGY_HOP))
+    search = min(CROSSFADE_SEARCH, (duration - 3 * TRANSITION_DURATION) / 2)
+    if envelopes is None or search <= 0:
+        return 0.0, duration
+
+    rms, onset = envelopes
+    search_frames = int(search / ENERGY_HOP)
+    if len(rms) < fade_frames + search_frames:
+        return 0.0, duration
+
+    level = rms / (np.median(rms) + 1e-6)
+    onset = onset / (onset.max() + 1e-6)
+    # fade_level[i] is the mean level of the fade covering frames i..i+fade_frames
+    fade_level = np.convolve(level, np.ones(fade_frames) / fade_frames, "valid")
+
+    def pick_from_edge(scores):
+        # Index of the first candidate, counted from the edge, that ties the best
+        return int(np.argmax(scores <= scores.min() + CROSSFADE_TOLERANCE))
+
+    in_scores = fade_level[: search_frames + 1] + onset[: search_frames + 1]
+    in_frame = pick_from_edge(in_scores)
+
+    # Out candidates run backwards from the last fade that ends at the track end
+    last = len(fade_level) - 1
+    starts = np.arange(last, last - search_frames - 1, -1)
+    cuts = np.minimum(starts + fade_frames, len(onset) - 1)
+    out_scores = fade_level[starts] + onset[cuts]
+    out_frame = int(starts[pick_from_edge(out_scores)]) + fade_frames
+
+    in_point = in_frame * ENERGY_HOP
+    out_point = min(out_frame * ENERGY_HOP, duration)
+    return round(in_point, 3), round(out_point, 3)
+
+
+def get_crossfade_points(tracks, workers=None, cached_only=False):
+    """Return the (in, out) points of indexed tracks, keyed by path.
+
+    With CROSSFADE_POINTS "fixed" every track plays from start to end. With
+    cached_only None is returned instead of analyzing tracks whose
+    envelopes are not cached.
+    """
+    if CROSSFADE_POINTS != "energy":
+        return {media["path"]: (0.0, media["duration"]) for media in tracks}
+    if cached_only and not all(
+        os.path.exists(get_envelope_path(media["path"], remember=False))
+        for media in tracks
+    ):
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers or ANALYSIS_WORKERS) as executor:
+        envelopes = list(
+            executor.map(load_envelopes, [media["path"] for media in tracks])
+        )
+    return {
+        media["path"]: pick_crossfade_points(track_envelopes, media["duration"])
+        for media, track_envelopes in zip(tracks, envelopes)
+    }
+
+
+def prepare_audio_track(audio_path, measurement, points=None):
+    """Normalize a track once and cache its head, body and tail as FLAC.
+
+    The head and tail are the first and last TRANSITION_DURATION seconds that
+    take part in the crossfades, the body is everything in between. points
+    are the (in, out) seconds to play, the whole track by default. The cuts
+    are made on exact sample positions so the parts join gaplessly.
+    """
+    params = loudnorm_params(measurement)
+    key = hashlib.sha1(
+        json.dumps(
+            {
+                "audio": file_digest(audio_path),
+                "loudnorm": params,
+                "transition_duration": TRANSITION_DURATION,
+                "sample_rate": AUDIO_SAMPLE_RATE,
+                "points": points,
+            },
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+    parts = {
+        part: os.path.join(AUDIO_SEGMENT_DIR, f"{key}_{part}.flac")
+        for part in ["head", "body", "tail"]
+    }
+
+    if all(os.path.exists(path) for path in parts.values()):
+        return key, parts
+
+    print(f"Normalizing audio: {audio_path}")
+    full_path = os.path.join(TMP_DIR, f"{key}_full.flac")
+    tmp_paths = {part: os.path.join(TMP_DIR, f"{key}_{part}.flac") for part in parts}
+
+    try:
+        stream = (
+            ffmpeg.input(audio_path)
+            .audio.filter("loudnorm", **params)
+            .filter("aresample", AUDIO_SAMPLE_RATE)
+            # Pin the layout, the FLAC encoder cannot negotiate one after loudnorm
+            .filter("aformat", channel_layouts="stereo")
+            .output(full_path, acodec="flac", **{"loglevel": "error"})
+            .overwrite_output()
+        )
+        run_ffmpeg(stream, "audio_segment")
+
+        # FLAC stores the exact sample count, so the cuts are sample accurate
+        start, end = 0, int(ffmpeg.probe(full_path)["streams"][0]["duration_ts"])
+        if points is not None:
+            start = round(points[0] * AUDIO_SAMPLE_RATE)
+            end = min(end, round(points[1] * AUDIO_SAMPLE_RATE))
+        fade_samples = TRANSITION_DURATION * AUDIO_SAMPLE_RATE
+        ranges = {
+            "head": (start, start + fade_samples),
+            "body": (start + fade_samples, end - fade_samples),
+            "tail": (end - fade_samples, end),
+        }
+
+        split = ffmpeg.input(full_path).audio.filter_multi_output("asplit", 3)
+        outputs = []
+        for i, (part, (start_sample, end_sample)) in enumerate(ranges.items()):
+            outputs.append(
+                split[i]
+                .filter("atrim", start_sample=start_sample, end_sample=end_sample)
+                .filter("asetpts", "PTS-STARTPTS")
+                .output(tmp_paths[part], acodec="flac", **{"loglevel": "error"})
+            )
+        stream = ffmpeg.merge_outputs(*outputs).overwrite_output()
+        run_ffmpeg(stream, "audio_segment")
+
+        for part, path in parts.items():
+            os.rename(tmp_paths[part], path)
+    finally:
+        for path in [full_path, *tmp_paths.values()]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    return key, parts
+
+
+def prepare_audio_fade(outgoing, incoming):
+    """Crossfade the tail of one track into the head of the next and cache it."""
+    (outgoing_key, outgoing_parts), (incoming_key, incoming_parts) = outgoing, incoming
+    key = hashlib.sha1(
+        f"{outgoing_key}\0{incoming_key}\0{TRANSITION_DURATION}".encode()
+    ).hexdigest()
+    fade_path = os.path.join(AUDIO_SEGMENT_DIR, f"{key}_fade.flac")
+
+    if os.path.exists(fade_path):
+        return fade_path
+
+    tmp_path = os.path.join(TMP_DIR, f"{key}_fade.flac")
+    try:
+        stream = (
+            ffmpeg.filter(
+                [
+                    ffmpeg.input(outgoing_parts["tail"]).audio,
+                    ffmpeg.input(incoming_parts["head"]).audio,
+                ],
+                "acrossfade",
+                duration=TRANSITION_DURATION,
+                curve1="tri",
+                curve2="tri",
+            )
+            .output(tmp_path, acodec="flac", **{"loglevel": "error"})
+            .overwrite_output()
+        )
+        run_ffmpeg(stream, "audio_segment")
+        os.rename(tmp_path, fade_path)
+    except ffmpeg.Error:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return fade_path
+
+
+def create_segmented_audio_mix(
+    audio_files,
+    measurements,
+    points,
+    output_filename="output_audio.mp4",
+    stage_key=None,
+):
+    """Assemble the audio mix from cached per-track and crossfade segments.
+
+    Unchanged tracks and crossfades are reused from the cache, only the final
+    AAC encode runs every time. The PCM segments are joined sample-exactly, so
+    track boundaries stay at the same positions as in the acrossfade chain.
+    """
+    output_path = os.path.join(TMP_DIR, output_filename)
+    list_path = os.path.join(TMP_DIR, "audio_segments.txt")
+
+    try:
+        with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+            tracks = list(
+                executor.map(
+                    lambda audio: prepare_audio_track(
+                        audio, measurements[audio], points[audio]
+                    ),
+                    audio_files,
+                )
+            )
+            fades = list(executor.map(prepare_audio_fade, tracks[:-1], tracks[1:]))
+
+        segment_paths = [tracks[0][1]["head"]]
+        for i, (_, parts) in enumerate(tracks):
+            segment_paths.append(parts["body"])
+            if i < len(fades):
+                segment_paths.append(fades[i])
+        segment_paths.append(tracks[-1][1]["tail"])
+
+        with open(list_path, "w") as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+
+        stream = (
+            ffmpeg.input(list_path, f="concat", safe=0)
+            .output(output_path, acodec="aac", **{"b:a": "192k"}, vn=None)
+            .overwrite_output()
+        )
+
+        # Print the generated command for debugging
+        print("Generated ffmpeg command:")
+        print(stream.compile())
+
+        run_ffmpeg(stream, "audio_mix")
+        print(f"Successfully created audio mix: {output_path}")
+
+        publish_output(output_path, stage_key, audio_files + segment_paths)
+
+    except ffmpeg.Error as e:
+        print(f"Error creating audio mix: {e.stderr.decode()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+
+def get_audio_mix_key(audio_files, mode=AUDIO_MIX_MODE):
+    """Return the stage cache key of the audio mix of these tracks."""
+    return get_stage_key(
+        audio_files,
+        {
+            "mode": mode,
+            "loudnorm": LOUDNORM_TARGETS,
+            "transition_duration": TRANSITION_DURATION,
+            "sample_rate": AUDIO_SAMPLE_RATE,
+            "crossfade_points": CROSSFADE_POINTS,
+            "crossfade_search": CROSSFADE_SEARCH,
+            "crossfade_tolerance": CROSSFADE_TOLERANCE,
+        },
+    )
+
+
+def create_audio_mix(output_filename="output_audio.mp4", mode=AUDIO_MIX_MODE):
+    """Create a mix of all audio with fade transitions.
+
+    The mix is skipped when it was already built from the same tracks with
+    the same settings.
+    """
+    # Get all audio files
+    tracks = get_indexed_media("_audio.m4a")
+    audio_files = []
+    for media in tracks:
+        audio_files.append(media["path"])
+        # Print debug info about the audio
+        filename = os.path.basename(media["path"])
+        print(f"Audio: {filename}, Duration: {media['duration']:.2f} seconds")
+
+    if not audio_files:
+        print("No audio files found to mix!")
+        return
+
+    print(f"Total audio files to mix: {len(audio_files)}")
+
+    stage_key = get_audio_mix_key(audio_files, mode)
+    if is_stage_current(os.path.join(RENDERED_DIR, output_filename), stage_key):
+        print(f"Audio mix is up to date: {output_filename}")
+        return
+
+    # First pass to analyze audio, cached across runs
+    measurements = measure_loudness(audio_files)
+    points = get_crossfade_points(tracks)
+
+    if mode == "segments":
+        create_segmented_audio_mix(
+            audio_files, measurements, points, output_filename, stage_key
+        )
+        return
+
+    def open_input(path, level):
+        if level > 0:
+            return ffmpeg.input(path).audio
+        # Cut and normalize the tracks themselves, intermediates are mixed
+        start, end = points[path]
+        return (
+            ffmpeg.input(path)
+            .audio.filter("atrim", start=start, end=end)
+            .filter("asetpts", "PTS-STARTPTS")
+            .filter("loudnorm", **loudnorm_params(measurements[path]))
+            .filter("aresample", AUDIO_SAMPLE_RATE)
+            .filter("aformat", channel_layouts="stereo")
+        )
+
+    # Output path
+    output_path = os.path.join(TMP_DIR, output_filename)
+
+    try:
+        crossfade_in_groups(
+            audio_files,
+            [end - start for start, end in (points[path] for path in audio_files)],
+            open_input,
+            lambda previous, current, offset: ffmpeg.filter(
+                [previous, current],
+                "acrossfade",
+                duration=TRANSITION_DURATION,
+                curve1="tri",
+                curve2="tri",
+                d=TRANSITION_DURATION,
+            ),
+            output_path,
+            {
+                "acodec": "aac",
+                "b:a": "192k",
+                "vn": None,  # Explicitly disable video
+            },
+            ".flac",
+            {**MIX_INTERMEDIATE_OPTS["audio"], "vn": None},
+            "audio_mix",
+        )
+        print(f"Successfully created audio mix: {output_path}")
+
+        publish_output(output_path, stage_key, audio_files)
+
+    except ffmpeg.Error as e:
+        print(f"Error creating audio mix: {e.stderr.decode()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+
+def get_title_windows(track_info):
+    """Return the title text and visible window for each track."""
+    windows = []
+    for track in track_info:
+        # Create fade-in and fade-out times
+        fade_duration = min(TRANSITION_DURATION, 2)  # Use shorter fade for text
+        start_time = track["start_time"]
+        end_time = start_time + track["duration"] - TRANSITION_DURATION
+        if TITLE_DURATION is not None:
+            end_time = min(end_time, start_time + TITLE_DURATION)
+
+        # Split track name into title and rest (if there's a hyphen)
+        parts = track["name"].split(" - ", 1)
+        title = parts[0] if parts else track["name"]
+        # subtitle = parts[1] if len(parts) > 1 else ''
+
+        windows.append(
+            {
+                "title": title,
+                "start_time": start_time,
+                "end_time": end_time,
+                "fade_duration": fade_duration,
+            }
+        )
+    return windows
+
+
+def get_title_geometry(width=1920):
+    """Return the title font size and margin for a frame width.
+
+    TITLE_FONT_SIZE and TITLE_MARGIN are meant for 1920 pixel wide frames,
+    narrower frames get the same layout scaled down.
+    """
+    scale = width / 1920
+    return max(1, round(TITLE_FONT_SIZE * scale)), round(TITLE_MARGIN * scale)
+
+
+def get_font_params(fontsize=TITLE_FONT_SIZE, font_path=None):
+    """Return the drawtext font parameters shared by all title renderers.
+
+    font_path overrides FONT_PATH, as for render chunks encoded elsewhere.
+    """
+    font_path = font_path or FONT_PATH
+    params = {"fontcolor": "white", "fontsize": str(fontsize)}
+    if font_path and os.path.exists(font_path):
+        params["fontfile"] = font_path
+    return params
+
+
+def draw_titles(video, windows, width=1920, font_path=None):
+    """Draw track titles with one drawtext filter per track."""
+    video_with_text = video
+    fontsize, margin = get_title_geometry(width)
+
+    for window in windows:
+        start_time = window["start_time"]
+        end_time = window["end_time"]
+        fade_duration = window["fade_duration"]
+
+        # Title parameters (larger, positioned at bottom left)
+        title_params = {
+            "text": window["title"],
+            **get_font_params(fontsize, font_path),
+            "x": str(margin),  # TITLE_MARGIN pixels from left edge
+            "y": f"h-th-{margin}",  # TITLE_MARGIN pixels from bottom
+            "enable": f"between(t,{start_time},{end_time})",
+            "alpha": f"if(lt(t,{start_time + fade_duration}),((t-{start_time})/{fade_duration}),"
+            f"if(gt(t,{end_time - fade_duration}),(({end_time}-t)/{fade_duration}),1))",
+        }
+
+        # Apply the drawtext filters
+        video_with_text = ffmpeg.filter(video_with_text, "drawtext", **title_params)
+
+    return video_with_text
+
+
+def render_title_png(text, width=1920, font_path=None):
+    """Rasterize a title once into a transparent PNG strip and cache it.
+
+    The strip spans the full frame width and is anchored to the bottom of the
+    frame, so the text lands on exactly the same pixels as the drawtext path.
+    The cache key covers the text, the font file and the geometry. The
+    background is made RGBA inside the lavfi source; a format filter placed
+    after it only receives the opaque frames the color source negotiates.
+    """
+    fontsize, margin = get_title_geometry(width)
+    height = fontsize * 3
+    font_params = get_font_params(fontsize, font_path)
+    font_stamp = ""
+    if "fontfile" in font_params:
+        font_path = font_params["fontfile"]
+        font_stat = os.stat(font_path)
+        font_stamp = f"{font_path}:{font_stat.st_size}:{font_stat.st_mtime_ns}"
+
+    # rgba tells these strips apart from the opaque ones cached before
+    key = hashlib.sha1(
+        f"{text}\0{font_stamp}\0{fontsize}\0{margin}\0{width}x{height}\0rgba".encode()
+    ).hexdigest()
+    png_path = os.path.join(TITLE_CACHE_DIR, f"{key}.png")
+
+    if os.path.exists(png_path):
+        return png_path
+
+    tmp_path = os.path.join(TMP_DIR, f"title_{key}.png")
+    try:
+        stream = (
+            ffmpeg.input(f"color=c=black@0.0:s={width}x{height},format=rgba", f="lavfi")
+            .filter(
+                "drawtext",
+                text=text,
+                **font_params,
+                x=str(margin),
+                y=f"h-th-{margin}",
+            )
+            .output(tmp_path, vframes=1, **{"loglevel": "error"})
+            .overwrite_output()
+        )
+        run_ffmpeg(stream, "title_png")
+        os.rename(tmp_path, png_path)
+    except ffmpeg.Error:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return png_path
+
+
+def overlay_titles(video, windows, width=1920, fps=25, font_path=None):
+    """Composite cached title PNGs, each only inside its track window.
+
+    Every title is a short looped image input, faded in and out on its alpha
+    channel and shifted to the start of its track, so the main video is
+    passed through untouched outside the title windows.
+    """
+    video_with_text = video
+
+    for window in windows:
+        start_time = window["start_time"]
+        end_time = window["end_time"]
+        fade_duration = window["fade_duration"]
+        visible_duration = end_time - start_time
+
+        png_path = render_title_png(window["title"], width, font_path)
+        title = (
+            ffmpeg.input(png_path, loop=1, framerate=fps, t=visible_duration)
+            .filter("format", "rgba")
+            .filter("fade", type="in", start_time=0, duration=fade_duration, alpha=1)
+            .filter(
+                "fade",
+                type="out",
+                start_time=visible_duration - fade_duration,
+                duration=fade_duration,
+                alpha=1,
+            )
+            .filter("setpts", f"PTS-STARTPTS+{start_time}/TB")
+        )
+
+        video_with_text = ffmpeg.filter(
+            [video_with_text, title],
+            "overlay",
+            x="0",
+            y="H-h",
+            eof_action="pass",
+            enable=f"between(t,{start_time},{end_time})",
+        )
+
+    return video_with_text
+
+
+def encode_loop_video(video_path, threads=CPU_COUNT):
+    """Re-encode the video mix once with a fixed keyframe grid and cache it."""
+    key = hashlib.sha1(
+        json.dumps(
+            {"video": file_stamp(video_path), "encoder": LOOP_ENCODER_OPTS},
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+    loop_path = os.path.join(VIDEO_SEGMENT_DIR, f"loop_{key}.mp4")
+
+    if os.path.exists(loop_path):
+        return loop_path
+
+    print(f"Encoding loop video: {video_path}")
+    tmp_path = os.path.join(TMP_DIR, os.path.basename(loop_path))
+    try:
+        stream = (
+            ffmpeg.input(video_path)
+            .output(
+                tmp_path,
+                an=None,
+                threads=threads,
+                force_key_frames=f"expr:gte(t,n_forced*{KEYFRAME_INTERVAL})",
+                **LOOP_ENCODER_OPTS,
+                **{"loglevel": "error"},
+            )
+            .overwrite_output()
+        )
+        run_ffmpeg(stream, "render_loop")
+        os.rename(tmp_path, loop_path)
+    except ffmpeg.Error:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return loop_path
+
+
+def get_render_spans(windows, audio_duration, loop_duration):
+    """Split the timeline into spans that need encoding and spans to copy.
+
+    Keyframes of the looped video sit every KEYFRAME_INTERVAL seconds from
+    the start of each loop. Every title window and the global fades are
+    widened to the surrounding keyframes and merged, the gaps in between can
+    be stream-copied. Returns (start, end, needs_encode) tuples.
+    """
+
+    def snap(t, round_up):
+        loop_start = math.floor(t / loop_duration) * loop_duration
+        local = round(t - loop_start, 6)
+        keyframes = local / KEYFRAME_INTERVAL
+        keyframe = math.ceil(keyframes) if round_up else math.floor(keyframes)
+        snapped = loop_start + min(keyframe * KEYFRAME_INTERVAL, loop_duration)
+        return min(max(snapped, 0), audio_duration)
+
+    dirty = [(0, RENDER_FADE_DURATION)]
+    dirty += [(window["start_time"], window["end_time"]) for window in windows]
+    dirty.append((audio_duration - RENDER_FADE_DURATION, audio_duration))
+
+    merged = []
+    for start, end in sorted((snap(s, False), snap(e, True)) for s, e in dirty):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    spans = []
+    position = 0
+    for start, end in merged:
+        if start > position:
+            spans.append((position, start, False))
+        spans.append((start, end, True))
+        position = end
+    if position < audio_duration:
+        spans.append((position, audio_duration, False))
+    return spans
+
+
+def encode_render_span(
+    loop_path,
+    loop_duration,
+    span_path,
+    start,
+    end,
+    windows,
+    audio_duration,
+    title_overlay,
+    threads=NORMALIZE_THREADS,
+    width=1920,
+    encoder_opts=LOOP_ENCODER_OPTS,
+    font_path=None,
+):
+    """Encode one span of the final timeline with its titles and fades.
+
+    A span that starts inside one of the global fades is built from the
+    keyframe before the fade and trimmed, as fades cannot start in the past.
+    width is the frame width of the loop, the titles are scaled to it.
+    font_path overrides FONT_PATH for the titles.
+    """
+    origin = start
+    if start < RENDER_FADE_DURATION:
+        origin = 0
+    elif start > audio_duration - RENDER_FADE_DURATION:
+        fade_start = audio_duration - RENDER_FADE_DURATION
+        origin = math.floor(fade_start / KEYFRAME_INTERVAL) * KEYFRAME_INTERVAL
+
+    # Shift the title windows that fall inside this span to span time
+    span_windows = [
+        {
+            **window,
+            "start_time": window["start_time"] - origin,
+            "end_time": window["end_time"] - origin,
+        }
+        for window in windows
+        if window["start_time"] < end and window["end_time"] > origin
+    ]
+
+    # Number the frames instead of trusting their timestamps, which jump
+    # where the loop wraps and would make the span a few frames too long
+    video = (
+        ffmpeg.input(loop_path, stream_loop=-1, ss=origin % loop_duration)
+        .video.filter("setpts", "N/FRAME_RATE/TB")
+        .filter("trim", duration=end - origin)
+    )
+
+    if title_overlay == "drawtext":
+        video = draw_titles(video, span_windows, width, font_path)
+    else:
+        video = overlay_titles(video, span_windows, width, encoder_opts["r"], font_path)
+
+    if origin < RENDER_FADE_DURATION:
+        video = ffmpeg.filter(
+            video, "fade", type="in", duration=RENDER_FADE_DURATION, start_time=-origin
+        )
+    if end > audio_duration - RENDER_FADE_DURATION:
+        video = ffmpeg.filter(
+            video,
+            "fade",
+            type="out",
+            duration=RENDER_FADE_DURATION,
+            start_time=audio_duration - RENDER_FADE_DURATION - origin,
+        )
+
+    if origin < start:
+        video = video.filter("trim", start=start - origin).filter(
+            "setpts", "PTS-STARTPTS"
+        )
+
+    stream = ffmpeg.output(
+        video,
+        span_path,
+        an=None,
+        threads=threads,
+        **encoder_opts,
+        **{"loglevel": "error"},
+    ).overwrite_output()
+    run_ffmpeg(stream, "render_span")
+
+
+def render_selective(
+    video_path,
+    audio_path,
+    output_file,
+    windows,
+    audio_duration,
+    title_overlay,
+    stage_key=None,
+    output=RENDER_OUTPUT,
+):
+    """Render the final output re-encoding only the spans that change.
+
+    The video mix is encoded once into a loop with a fixed keyframe grid.
+    Spans with titles or the global fades are re-encoded with the same
+    encoder settings, everything else is copied from the loop, and the pieces
+    are joined by the concat demuxer together with the audio mix.
+    """
+    output_path, output_opts = get_render_output(output_file, output)
+    list_path = os.path.join(TMP_DIR, "render_spans.txt")
+    span_paths = []
+
+    try:
+        loop_path = encode_loop_video(video_path)
+        loop_duration = get_media_info(loop_path)["duration"]
+        spans = get_render_spans(windows, audio_duration, loop_duration)
+
+        encoded = sum(end - start for start, end, dirty in spans if dirty)
+        print(
+            f"Selective render: {len(spans)} spans, re-encoding {encoded:.0f}s "
+            f"of {audio_duration:.0f}s ({encoded / audio_duration:.0%})"
+        )
+
+        entries = []
+        with ThreadPoolExecutor(max_workers=NORMALIZE_WORKERS) as executor:
+            futures = []
+            for i, (start, end, dirty) in enumerate(spans):
+                if dirty:
+                    span_path = os.path.join(TMP_DIR, f"render_span_{i:05d}.mp4")
+                    span_paths.append(span_path)
+                    entries.append((span_path, None, None))
+                    futures.append(
+                        executor.submit(
+                            encode_render_span,
+                            loop_path,
+                            loop_duration,
+                            span_path,
+                            start,
+                            end,
+                            windows,
+                            audio_duration,
+                            title_overlay,
+                        )
+                    )
+                    continue
+
+                # Copied spans are cut from the loop, one entry per loop pass
+                position = start
+                while position < end:
+                    loop_start = math.floor(position / loop_duration) * loop_duration
+                    piece_end = min(end, loop_start + loop_duration)
+                    entries.append(
+                        (loop_path, position - loop_start, piece_end - loop_start)
+                    )
+                    position = piece_end
+
+            for future in as_completed(futures):
+                future.result()
+
+        with open(list_path, "w") as f:
+            for path, inpoint, outpoint in entries:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+                if inpoint is not None:
+                    f.write(f"inpoint {inpoint:.6f}\n")
+                    f.write(f"outpoint {outpoint:.6f}\n")
+
+        stream = ffmpeg.output(
+            ffmpeg.input(list_path, f="concat", safe=0).video,
+            ffmpeg.input(audio_path).audio,
+            output_path,
+            c="copy",
+            t=audio_duration,
+            **output_opts,
+        ).overwrite_output()
+
+        # Print the generated command for debugging
+        print("Generated ffmpeg command:")
+        print(stream.compile())
+
+        run_ffmpeg(stream, "render")
+        print(f"Successfully created final output: {output_path}")
+
+        finish_render_output(output_path, stage_key, output, [video_path, audio_path])
+
+    except ffmpeg.Error as e:
+        print(f"Error creating final output: {e.stderr.decode()}")
+        remove_render_output(output_path, output)
+    finally:
+        for path in [list_path, *span_paths]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def get_render_chunks(audio_duration):
+    """Split the timeline into (start, end) chunks for a chunked render.
+
+    Chunks last RENDER_CHUNK_DURATION seconds rounded to the keyframe grid,
+    so every chunk starts on a keyframe of the joined render.
+    """
+    keyframes = max(1, round(RENDER_CHUNK_DURATION / KEYFRAME_INTERVAL))
+    chunk_duration = keyframes * KEYFRAME_INTERVAL
+    return [
+        (i * chunk_duration, min((i + 1) * chunk_duration, audio_duration))
+        for i in range(math.ceil(audio_duration / chunk_duration))
+    ]
+
+
+# Paths of render chunk jobs, relative to DATA_DIR
+RENDER_JOB_PATHS = ("loop_path", "span_path", "font_path")
+
+
+def submit_render_chunks(jobs):
+    """Queue render chunk jobs in RENDER_QUEUE_DIR for any worker to claim.
+
+    The job files store their paths relative to DATA_DIR, so workers on other
+    nodes find them wherever they mount the shared data directory.
+    """
+    for job in jobs:
+        queued = dict(job)
+        for field in RENDER_JOB_PATHS:
+            if queued.get(field):
+                path = os.path.relpath(queued[field], DATA_DIR)
+                if path.startswith(os.pardir):
+                    raise ValueError(f"{queued[field]} is outside {DATA_DIR}")
+                queued[field] = path
+        job_path = os.path.splitext(job["span_path"])[0] + ".json"
+        with open(job_path + ".tmp", "w") as f:
+            json.dump(queued, f)
+        os.rename(job_path + ".tmp", job_path)
+
+
+def claim_render_chunk(prefix=""):
+    """Claim a queued render chunk, returning its claim path and job or None.
+
+    Only jobs whose file name starts with prefix are claimed. Claiming
+    renames the job file, which only one worker can do, also when the
+    workers run on different nodes sharing RENDER_QUEUE_DIR. The paths of
+    the job are resolved against this node's DATA_DIR.
+    """
+    for name in sorted(os.listdir(RENDER_QUEUE_DIR)):
+        if not name.startswith(prefix) or not name.endswith(".json"):
+            continue
+        job_path = os.path.join(RENDER_QUEUE_DIR, name)
+        claim_path = os.path.splitext(job_path)[0] + ".claimed"
+        try:
+            os.rename(job_path, claim_path)
+        except FileNotFoundError:
+            continue
+        # The claim time, for requeueing chunks of workers that went away
+        os.utime(claim_path)
+        with open(claim_path) as f:
+            job = json.load(f)
+        for field in RENDER_JOB_PATHS:
+            if job.get(field):
+                job[field] = os.path.join(DATA_DIR, job[field])
+        return claim_path, job
+    return None
+
+
+def run_render_worker(threads=CPU_COUNT, wait=True, prefix=""):
+    """Encode queued render chunks, forever with wait, else until none are left.
+
+    Only chunks whose job file starts with prefix are encoded. Every chunk is
+    encoded to a private file first, so a chunk that was requeued and encoded
+    twice is still replaced atomically. A chunk whose inputs this node cannot
+    find fails instead of being encoded without them.
+    """
+    while True:
+        claimed = claim_render_chunk(prefix)
+        if claimed is None:
+            if not wait:
+                return
+            time.sleep(1)
+            continue
+
+        claim_path, job = claimed
+        base = os.path.splitext(claim_path)[0]
+        span_path = job["span_path"]
+        tmp_path = f"{base}.{os.uname().nodename}-{threading.get_ident()}.mp4"
+        print(f"Rendering chunk {os.path.basename(span_path)}")
+        try:
+            for field in ["loop_path", "font_path"]:
+                if job.get(field) and not os.path.exists(job[field]):
+                    raise ffmpeg.Error(
+                        "ffmpeg", None, f"{job[field]}: No such file".encode()
+                    )
+            encode_render_span(**{**job, "span_path": tmp_path}, threads=threads)
+            os.replace(tmp_path, span_path)
+            open(base + ".done", "w").close()
+        except ffmpeg.Error as e:
+            with open(base + ".failed", "wb") as f:
+                f.write(e.stderr)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if os.path.exists(claim_path):
+            os.remove(claim_path)
+
+
+def wait_for_render_chunks(jobs, threads, prefix=""):
+    """Wait until every chunk is encoded, raising ffmpeg.Error if one failed.
+
+    Chunks claimed longer than RENDER_CLAIM_TIMEOUT ago are requeued and
+    encoded here, among the jobs starting with prefix, if no other worker
+    picks them up first.
+    """
+    while True:
+        pending = 0
+        for job in jobs:
+            base = os.path.splitext(job["span_path"])[0]
+            if os.path.exists(base + ".failed"):
+                with open(base + ".failed", "rb") as f:
+                    raise ffmpeg.Error("ffmpeg", None, f.read())
+            if os.path.exists(base + ".done"):
+                continue
+
+            pending += 1
+            try:
+                claimed_for = time.time() - os.path.getmtime(base + ".claimed")
+                if claimed_for > RENDER_CLAIM_TIMEOUT:
+                    print(f"Requeueing chunk {os.path.basename(job['span_path'])}")
+                    os.rename(base + ".claimed", base + ".json")
+            except FileNotFoundError:
+                pass
+
+        if not pending:
+            return
+        run_render_worker(threads, wait=False, prefix=prefix)
+        time.sleep(1)
+
+
+def render_chunked(
+    video_path,
+    audio_path,
+    output_file,
+    windows,
+    audio_duration,
+    title_overlay,
+    stage_key=None,
+    output=RENDER_OUTPUT,
+    workers=None,
+):
+    """Render the final output in chunks that are encoded in parallel.
+
+    Every chunk is the slice of the looped video mix with its titles and
+    fades, queued in RENDER_QUEUE_DIR for the local workers and any
+    render-worker process on another node. The job files start with the
+    render's job id, the local workers only encode chunks of this render.
+    The title font is copied next to the jobs, so other nodes draw the
+    same titles. The chunks are joined by the concat demuxer and the audio
+    mix is copied in as a whole, so chunk boundaries cannot introduce audio
+    gaps or drift.
+    """
+    workers = workers or RENDER_WORKERS
+    threads = max(1, CPU_COUNT // workers)
+    output_path, output_opts = get_render_output(output_file, output)
+    list_path = os.path.join(TMP_DIR, "render_chunks.txt")
+
+    video_duration = get_media_info(video_path)["duration"]
+    chunks = get_render_chunks(audio_duration)
+    job_id = (stage_key or f"render{os.getpid()}")[:12]
+    prefix = f"{job_id}_"
+    font_path = None
+    if "fontfile" in get_font_params():
+        font_path = os.path.join(
+            RENDER_QUEUE_DIR, prefix + "font" + os.path.splitext(FONT_PATH)[1]
+        )
+    jobs = [
+        {
+            "loop_path": video_path,
+            "loop_duration": video_duration,
+            "span_path": os.path.join(RENDER_QUEUE_DIR, f"{prefix}{i:05d}.mp4"),
+            "start": start,
+            "end": end,
+            "windows": windows,
+            "audio_duration": audio_duration,
+            "title_overlay": title_overlay,
+            "font_path": font_path,
+        }
+        for i, (start, end) in enumerate(chunks)
+    ]
+    print(
+        f"Chunked render: {len(chunks)} chunks, {workers} local workers "
+        f"with {threads} threads each"
+    )
+
+    try:
+        if font_path:
+            shutil.copy2(FONT_PATH, font_path)
+        submit_render_chunks(jobs)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(run_render_worker, threads, False, prefix)
+                for _ in range(workers)
+            ]
+            for future in as_completed(futures):
+                future.result()
+        wait_for_render_chunks(jobs, threads, prefix)
+
+        with open(list_path, "w") as f:
+            for job in jobs:
+                f.write(f"file '{os.path.abspath(job['span_path'])}'\n")
+
+        stream = ffmpeg.output(
+            ffmpeg.input(list_path, f="concat", safe=0).video,
+            ffmpeg.input(audio_path).audio,
+            output_path,
+            c="copy",
+            t=audio_duration,
+            **output_opts,
+        ).overwrite_output()
+
+        # Print the generated command for debugging
+        print("Generated ffmpeg command:")
+        print(stream.compile())
+
+        run_ffmpeg(stream, "render")
+        print(f"Successfully created final output: {output_path}")
+
+        finish_render_output(output_path, stage_key, output, [video_path, audio_path])
+
+    except ffmpeg.Error as e:
+        print(f"Error creating final output: {e.stderr.decode()}")
+        remove_render_output(output_path, output)
+    finally:
+        for job in jobs:
+            base = os.path.splitext(job["span_path"])[0]
+            for suffix in [".mp4", ".json", ".claimed", ".done", ".failed"]:
+                if os.path.exists(base + suffix):
+                    os.remove(base + suffix)
+        if font_path and os.path.exists(font_path):
+            os.remove(font_path)
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+
+def get_render_key(
+    video_path, audio_path, track_info, title_overlay, mode, output=RENDER_OUTPUT
+):
+    """Return the stage cache key of a final render."""
+    inputs = [video_path, audio_path]
+    if FONT_PATH and os.path.exists(FONT_PATH):
+        inputs.append(FONT_PATH)
+
+    params = {
+        "mode": mode,
+        "output": output,
+        "title_overlay": title_overlay,
+        "titles": get_title_windows(track_info),
+        "title_font_size": TITLE_FONT_SIZE,
+        "title_margin": TITLE_MARGIN,
+        "fade_duration": RENDER_FADE_DURATION,
+    }
+    if mode in ["selective", "chunked"]:
+        params["encoder"] = LOOP_ENCODER_OPTS
+    if mode == "chunked":
+        params["chunk_duration"] = RENDER_CHUNK_DURATION
+    if output == "hls":
+        params["hls_segment_duration"] = HLS_SEGMENT_DURATION
+    return get_stage_key(inputs, params)
+
+
+def get_render_output(output_file, output=RENDER_OUTPUT):
+    """Return where a render is written and its extra ffmpeg output options.
+
+    An "mp4" render is written to TMP_DIR and moved to RENDERED_DIR when it is
+    complete. An "hls" render is written straight into its own directory in
+    RENDERED_DIR, as fMP4 segments and an event playlist that grows with every
+    segment and is closed with ENDLIST when the render is done.
+    """
+    if output != "hls":
+        return os.path.join(TMP_DIR, output_file), {}
+
+    render_dir = os.path.join(RENDERED_DIR, os.path.splitext(output_file)[0])
+    os.makedirs(render_dir, exist_ok=True)
+    # Until the render is finished its playlist is only followed while this
+    # process runs, see is_render_streamable
+    with open(os.path.join(render_dir, HLS_RENDER_PID), "w") as f:
+        f.write(str(os.getpid()))
+    return os.path.join(render_dir, HLS_PLAYLIST), {
+        "f": "hls",
+        "hls_time": HLS_SEGMENT_DURATION,
+        "hls_list_size": 0,  # Keep every segment in the playlist
+        "hls_playlist_type": "event",
+        "hls_segment_type": "fmp4",
+        "hls_fmp4_init_filename": "init.mp4",
+        "hls_segment_filename": os.path.join(render_dir, "segment_%05d.m4s"),
+    }
+
+
+def finish_render_output(output_path, stage_key, output=RENDER_OUTPUT, inputs=()):
+    """Make a finished render available in RENDERED_DIR."""
+    if output == "hls":
+        record_stage_key(output_path, stage_key, inputs)
+        os.remove(os.path.join(os.path.dirname(output_path), HLS_RENDER_PID))
+    else:
+        publish_output(output_path, stage_key, inputs)
+
+
+def remove_render_output(output_path, output=RENDER_OUTPUT):
+    """Remove the partial output of a failed render."""
+    if output == "hls":
+        shutil.rmtree(os.path.dirname(output_path), ignore_errors=True)
+    elif os.path.exists(output_path):
+        os.remove(output_path)
+
+
+def render_result(
+    video_file="output_video.mp4",
+    audio_file="output_audio.mp4",
+    output_file=None,
+    title_overlay=TITLE_OVERLAY,
+    mode=RENDER_MODE,
+    output=RENDER_OUTPUT,
+    workers=None,
+):
+    """Combine video and audio mix with track name overlays.
+
+    Nothing is rendered when a final output built from the same mixes,
+    titles and settings already exists. workers is the number of local
+    workers of a chunked render.
+    """
+
+    if output_file is None:
+        timestamp = datetime.now().strftime("%Y%m%d%H%M")
+        output_file = f"final_output_{timestamp}.mp4"
+
+    video_path = os.path.join(RENDERED_DIR, video_file)
+    audio_path = os.path.join(RENDERED_DIR, audio_file)
+
+    # Get track timing information
+    track_info = get_track_timings()
+
+    stage_key = get_render_key(
+        video_path, audio_path, track_info, title_overlay, mode, output
+    )
+    rendered_path = find_stage_output(stage_key, RENDERED_DIR)
+    if rendered_path is not None:
+        print(
+            "Final render is up to date: "
+            + os.path.relpath(rendered_path, os.path.abspath(RENDERED_DIR))
+        )
+        return
+
+    # Get audio and video durations
+    audio_duration = get_media_info(audio_path)["duration"]
+    video_duration = get_media_info(video_path)["duration"]
+
+    if mode == "selective":
+        spans = get_render_spans(
+            get_title_windows(track_info), audio_duration, video_duration
+        )
+        encoded = sum(end - start for start, end, dirty in spans if dirty)
+        if encoded / audio_duration > SELECTIVE_MAX_ENCODED:
+            print(
+                f"Selective render would re-encode {encoded / audio_duration:.0%} "
+                "of the timeline, rendering it in full (shorten the titles with "
+                "--title-duration)"
+            )
+            mode = "full"
+
+    if mode == "selective":
+        render_selective(
+            video_path,
+            audio_path,
+            output_file,
+            get_title_windows(track_info),
+            audio_duration,
+            title_overlay,
+            stage_key,
+            output,
+        )
+        return
+
+    if mode == "chunked":
+        render_chunked(
+            video_path,
+            audio_path,
+            output_file,
+            get_title_windows(track_info),
+            audio_duration,
+            title_overlay,
+            stage_key,
+            output,
+            workers,
+        )
+        return
+
+    output_path, output_opts = get_render_output(output_file, output)
+    if output == "hls":
+        # Fixed GOPs, so every segment starts on a keyframe
+        output_opts.update(
+            {
+                option: SEGMENT_ENCODER_OPTS[option]
+                for option in ["g", "keyint_min", "sc_threshold"]
+            }
+        )
+
+    # Calculate how many times to loop the video
+    loop_times = int(audio_duration / video_duration) + 1
+
+    # Create video input with explicit loop count and trim to audio duration
+    video = (
+        ffmpeg.input(video_path, stream_loop=loop_times)
+        .filter("setpts", "PTS-STARTPTS")
+        .filter("trim", duration=audio_duration)
+    )
+    audio = ffmpeg.input(audio_path)
+
+    try:
+        # Add the track titles
+        windows = get_title_windows(track_info)
+        if title_overlay == "drawtext":
+            video_with_text = draw_titles(video, windows)
+        else:
+            video_with_text = overlay_titles(video, windows)
+
+        # Add fade in/out effects to the video
+        fade_duration = RENDER_FADE_DURATION
+
+        # Apply fade in/out effects
+        video_with_effects = ffmpeg.filter(
+            video_with_text, "fade", type="in", duration=fade_duration
+        )
+        video_with_effects = ffmpeg.filter(
+            video_with_effects,
+            "fade",
+            type="out",
+            duration=fade_duration,
+            start_time=audio_duration - fade_duration,
+        )
+
+        # Combine video and audio
+        stream = ffmpeg.output(
+            video_with_effects,
+            audio.audio,
+            output_path,
+            vcodec="libx264",
+            acodec="aac",
+            **{"b:a": "192k"},
+            preset="superfast",
+            crf=23,
+            **output_opts,
+        ).overwrite_output()
+
+        # Print the generated command for debugging
+        print("Generated ffmpeg command:")
+        print(stream.compile())
+
+        # Run the ffmpeg command
+        run_ffmpeg(stream, "render")
+        print(f"Successfully created final output: {output_path}")
+
+        finish_render_output(output_path, stage_key, output, [video_path, audio_path])
+
+    except ffmpeg.Error as e:
+        print(f"Error creating final output: {e.stderr.decode()}")
+        remove_render_output(output_path, output)
+
+
+def get_proxy_path(clip_path):
+    """Return the cache path of the preview proxy of a normalized clip."""
+    key = get_stage_key(
+        [clip_path],
+        {
+            "width": PREVIEW_WIDTH,
+            "height": PREVIEW_HEIGHT,
+            "encoder": PREVIEW_ENCODER_OPTS,
+        },
+    )
+    return os.path.join(PROXY_DIR, f"{key}.mp4")
+
+
+def encode_proxy(clip_path, proxy_path, threads=NORMALIZE_THREADS):
+    """Scale a normalized clip down to the preview size and frame rate."""
+    tmp_path = os.path.join(TMP_DIR, os.path.basename(proxy_path))
+    try:
+        stream = (
+            ffmpeg.input(clip_path)
+            .video.filter("scale", PREVIEW_WIDTH, PREVIEW_HEIGHT)
+            .output(
+                tmp_path,
+                an=None,
+                threads=threads,
+                **PREVIEW_ENCODER_OPTS,
+                **{"loglevel": "error"},
+            )
+            .overwrite_output()
+        )
+        run_ffmpeg(stream, "preview_proxy")
+        os.rename(tmp_path, proxy_path)
+    except ffmpeg.Error:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def create_preview_mix(output_filename="preview_video.mp4"):
+    """Build the video mix from preview proxies of the normalized clips.
+
+    Proxies and mix segments are cached like their full size counterparts,
+    so only changed clips are scaled down again. The segments are cut at the
+    durations of the normalized clips, so the preview has the same timeline
+    as the full video mix. Returns the path of the mix.
+    """
+    clips = get_indexed_media("_normalized.mp4")
+    if not clips:
+        raise FileNotFoundError("No normalized videos found to preview")
+
+    proxies = [get_proxy_path(media["path"]) for media in clips]
+    pending = [
+        (media["path"], proxy)
+        for media, proxy in zip(clips, proxies)
+        if not os.path.exists(proxy)
+    ]
+    print(
+        f"Preview proxies: {len(clips) - len(pending)} cached, "
+        f"{len(pending)} to encode"
+    )
+    with ThreadPoolExecutor(max_workers=NORMALIZE_WORKERS) as executor:
+        futures = [
+            executor.submit(encode_proxy, clip, proxy) for clip, proxy in pending
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+    output_path = os.path.join(RENDERED_DIR, output_filename)
+    stage_key = get_stage_key(
+        proxies,
+        {
+            "durations": [media["duration"] for media in clips],
+            "transition_duration": TRANSITION_DURATION,
+            "encoder": PREVIEW_ENCODER_OPTS,
+        },
+    )
+    if not is_stage_current(output_path, stage_key):
+        create_segmented_video_mix(
+            proxies,
+            [media["duration"] for media in clips],
+            output_filename,
+            stage_key,
+            PREVIEW_ENCODER_OPTS,
+        )
+    if not os.path.exists(output_path):
+        raise FileNotFoundError(f"Preview video mix failed: {output_path}")
+    return output_path
+
+
+def get_preview_window(track_info, audio_duration, start=None, end=None, boundary=None):
+    """Return the start and end of the part of the timeline to preview.
+
+    boundary is the number of a track, counting from 1. The window then
+    covers the crossfade into that track and PREVIEW_CONTEXT seconds on both
+    sides of it.
+    """
+    if boundary is not None:
+        if not 1 < boundary <= len(track_info):
+            raise ValueError(f"There is no crossfade into track {boundary}")
+        crossfade = track_info[boundary - 1]["start_time"]
+        start = crossfade - PREVIEW_CONTEXT
+        end = crossfade + TRANSITION_DURATION + PREVIEW_CONTEXT
+
+    start = max(0, start or 0)
+    end = min(audio_duration, end or audio_duration)
+    if start >= end:
+        raise ValueError(f"Empty preview window: {start:.2f}s to {end:.2f}s")
+    return start, end
+
+
+def render_preview(
+    output_file="preview.mp4",
+    title_overlay=TITLE_OVERLAY,
+    start=None,
+    end=None,
+    boundary=None,
+):
+    """Render a low resolution preview of the final output or a part of it.
+
+    The titles and fades are built by the same graph as the span renders of
+    the final output, over a video mix of PREVIEW_WIDTH x PREVIEW_HEIGHT
+    proxies and with the title geometry scaled to match. The audio is cut
+    from the regular audio mix, which is shared with the final render. The
+    audio mix is not rebuilt for a preview, it has to exist and is used as
+    it is when it is out of date.
+    """
+    started = time.monotonic()
+    audio_path = os.path.join(RENDERED_DIR, "output_audio.mp4")
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(
+            f"Audio mix not found: {audio_path}, run process to build it"
+        )
+    audio_files = [media["path"] for media in get_indexed_media("_audio.m4a")]
+    if not is_stage_current(audio_path, get_audio_mix_key(audio_files)):
+        print(
+            f"Warning: {audio_path} is out of date, the preview uses it "
+            "as it is until process rebuilds it"
+        )
+    video_path = create_preview_mix()
+
+    track_info = get_track_timings()
+    audio_duration = get_media_info(audio_path)["duration"]
+    start, end = get_preview_window(track_info, audio_duration, start, end, boundary)
+    print(
+        f"Rendering preview from {start:.2f}s to {end:.2f}s "
+        f"at {PREVIEW_WIDTH}x{PREVIEW_HEIGHT}"
+    )
+
+    span_path = os.path.join(TMP_DIR, "preview_span.mp4")
+    output_path = os.path.join(TMP_DIR, output_file)
+    try:
+        encode_render_span(
+            video_path,
+            get_media_info(video_path)["duration"],
+            span_path,
+            start,
+            end,
+            get_title_windows(track_info),
+            audio_duration,
+            title_overlay,
+            threads=CPU_COUNT,
+            width=PREVIEW_WIDTH,
+            encoder_opts=PREVIEW_ENCODER_OPTS,
+        )
+        stream = ffmpeg.output(
+            ffmpeg.input(span_path).video,
+            ffmpeg.input(audio_path, ss=start, t=end - start).audio,
+            output_path,
+            vcodec="copy",
+            acodec="aac",
+            movflags="+faststart",
+            **{"b:a": "128k", "loglevel": "error"},
+        ).overwrite_output()
+        run_ffmpeg(stream, "preview")
+        publish_output(output_path)
+        print(
+            f"Preview ready in {time.monotonic() - started:.1f}s: "
+            + os.path.join(RENDERED_DIR, output_file)
+        )
+
+    except ffmpeg.Error as e:
+        print(f"Error creating preview: {e.stderr.decode()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    finally:
+        if os.path.exists(span_path):
+            os.remove(span_path)
+
+
+def get_latest_render(hls=False):
+    """Return the filename of the newest final_output_* render.
+
+    With hls the playlist of the newest segmented render is returned instead,
+    relative to RENDERED_DIR. It exists as soon as the first segment does.
+    Renders that stopped before they were complete are skipped.
+    """
+    if hls:
+        files = [
+            os.path.join(f, HLS_PLAYLIST)
+            for f in os.listdir(RENDERED_DIR)
+            if f.startswith("final_output")
+            and is_render_streamable(os.path.join(RENDERED_DIR, f, HLS_PLAYLIST))
+        ]
+    else:
+        files = [
+            f
+            for f in os.listdir(RENDERED_DIR)
+            if f.startswith("final_output") and f.endswith(".mp4")
+        ]
+    if not files:
+        raise FileNotFoundError("No rendered files found")
+    return sorted(files)[-1]
+
+
+def is_render_streamable(playlist_path):
+    """Return whether the playlist of a segmented render can be streamed.
+
+    A complete playlist ends with ENDLIST. An incomplete one is only followed
+    while the process rendering it is still running, the playlist of a
+    render that was killed would be reloaded forever.
+    """
+    try:
+        with open(playlist_path) as f:
+            if "#EXT-X-ENDLIST" in f.read():
+                return True
+        with open(os.path.join(os.path.dirname(playlist_path), HLS_RENDER_PID)) as f:
+            os.kill(int(f.read()), 0)
+    except (FileNotFoundError, ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def get_playlist_duration(playlist_path):
+    """Return the total duration of the segments listed in an HLS playlist."""
+    duration = 0.0
+    with open(playlist_path) as f:
+        for line in f:
+            if line.startswith("#EXTINF:"):
+                duration += float(line[len("#EXTINF:") :].split(",")[0])
+    return duration
+
+
+def start_stream_muxer(full_rtmp_url, low_bitrate_urls=(), paced=False, stage="stream"):
+    """Start the long-lived ffmpeg that forwards MPEG-TS on stdin to RTMP.
+
+    With paced the muxer reads its input in real time, for feeders that write
+    as fast as the pipe takes it. Input that arrives late, e.g. while the
+    next feeder starts, is sent right away until the stream has caught up
+    with the wall clock, so these delays do not add up.
+
+    full_rtmp_url can also be a list of URLs. Several destinations are fed
+    from the same read through the tee muxer, where every destination fails
+    on its own instead of stopping the others, see get_failed_destinations.
+    The low_bitrate_urls get a rendition encoded once with
+    LOW_BITRATE_ENCODER_OPTS. Metrics are recorded under stage.
+    """
+    if isinstance(full_rtmp_url, str):
+        full_rtmp_url = [full_rtmp_url]
+
+    stream = ffmpeg.input("pipe:", format="mpegts", **({"re": None} if paced else {}))
+    if len(full_rtmp_url) == 1 and not low_bitrate_urls:
+        output = stream.output(
+            full_rtmp_url[0],
+            format="flv",
+            vcodec="copy",
+            acodec="copy",
+            **{"loglevel": "error"},
+        )
+    else:
+        # Output video 0 is the copied stream, video 1 the low bitrate one.
+        # tee passes the MPEG-TS codec tags on, so set the FLV ones for
+        # H.264 and AAC.
+        streams = [stream.video, stream.audio]
+        options = {"c:v:0": "copy", "c:a": "copy", "tag:v": 7, "tag:a": 10}
+        if low_bitrate_urls:
+            streams.append(stream.video)
+            options.update({f"{k}:v:1": v for k, v in LOW_BITRATE_ENCODER_OPTS.items()})
+        slaves = [
+            f"[f=flv:onfail=ignore:select=\\'{video},a\\']{url}"
+            for video, urls in (("v:0", full_rtmp_url), ("v:1", low_bitrate_urls))
+            for url in urls
+        ]
+        output = ffmpeg.output(
+            *streams,
+            "|".join(slaves),
+            format="tee",
+            **options,
+            **{"loglevel": "error"},
+        )
+
+    return start_ffmpeg(
+        output.overwrite_output(),
+        stage,
+        stdin=subprocess.PIPE,
+    )
+
+
+def get_failed_destinations(monitor):
+    """Return the indexes of the tee destinations of a muxer that failed."""
+    failed = set()
+    for line in list(monitor["stderr"]):
+        _, found, rest = line.partition(b"Slave muxer #")
+        if found:
+            failed.add(int(rest.split(b" ")[0]))
+    return failed
+
+
+def stop_feeder(feeder):
+    """Stop a feeder ffmpeg, killing it when it does not exit in time.
+
+    A feeder waiting for an HLS playlist to grow does not always react to
+    SIGTERM, and the muxer never sees the end of its input while it runs.
+    """
+    if feeder.poll() is None:
+        feeder.terminate()
+        try:
+            feeder.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            feeder.kill()
+            feeder.wait()
+
+
+def stop_stream_muxer(muxer, monitor, feeder=None):
+    """Stop a muxer from start_stream_muxer and the feeder writing into it.
+
+    Returns the last line ffmpeg logged when the muxer failed, else None.
+    """
+    if feeder is not None:
+        stop_feeder(feeder)
+    muxer.stdin.close()
+    if muxer.poll() is None:
+        muxer.terminate()
+        try:
+            muxer.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            # Stuck writing to a dead connection
+            muxer.kill()
+    try:
+        wait_ffmpeg(muxer, monitor)
+    except ffmpeg.Error as e:
+        lines = [
+            line
+            for line in e.stderr.decode(errors="replace").splitlines()
+            if line.strip()
+            and not line.strip().endswith(":")
+            and line != "Conversion failed!"
+        ]
+        return lines[-1] if lines else f"exit code {muxer.returncode}"
+    return None
+
+
+def stream_with_reload(rtmp_url=None, stream_key=None, hls=False):
+    """
+    Stream the latest render in a loop and switch to new renders on the fly
+
+    One long-lived ffmpeg process holds the RTMP connection and reads MPEG-TS
+    from its stdin. For every loop a short-lived feeder ffmpeg copies the
+    newest final_output_* file into that pipe, shifting its timestamps by the
+    time already streamed, so a new render is picked up at the next loop
+    boundary without reconnecting and without a timestamp jump.
+
+    With hls the newest segmented render is streamed instead. Its playlist is
+    read from segment 0 and followed while the render is still appending to
+    it, so the stream goes live as soon as the first segment is rendered.
+
+    When a feeder fails, or the render it follows fails or is killed, the
+    stream falls back to the newest complete render.
+    Args:
+        rtmp_url (str): YouTube RTMP URL (default: rtmp://a.rtmp.youtube.com/live2)
+        stream_key (str): Your YouTube stream key
+        hls (bool): Stream the segmented renders of RENDER_OUTPUT "hls"
+    """
+    if not rtmp_url:
+        rtmp_url = DEFAULT_RTMP_URL
+
+    if not stream_key:
+        raise ValueError("YouTube stream key is required")
+
+    if hls:
+        print("Waiting for the first segment of a render...")
+        while True:
+            try:
+                get_latest_render(hls=True)
+                break
+            except FileNotFoundError:
+                time.sleep(1)
+
+    # Full RTMP URL with stream key
+    full_rtmp_url = f"{rtmp_url}/{stream_key}"
+
+    muxer, monitor = start_stream_muxer(full_rtmp_url)
+
+    print("Starting stream to YouTube with reload support...")
+    print("Press Ctrl+C to stop the stream")
+
+    offset = 0.0
+    current_file = None
+    feeder = None
+    try:
+        while muxer.poll() is None:
+            try:
+                input_file = get_latest_render(hls)
+            except FileNotFoundError:
+                # The only segmented render failed, wait for the next one
+                time.sleep(1)
+                continue
+            if input_file != current_file:
+                print(f"Streaming {input_file} from {offset:.2f}s")
+                current_file = input_file
+                mark_streaming([os.path.join(RENDERED_DIR, input_file)])
+
+            input_path = os.path.join(RENDERED_DIR, input_file)
+            input_args = {"re": None}
+            if hls:
+                # Start at segment 0 and keep reloading until ENDLIST
+                input_args["live_start_index"] = 0
+
+            # Feed one loop of the file in real time
+            started = time.monotonic()
+            feeder = subprocess.Popen(
+                ffmpeg.input(input_path, **input_args)
+                .output(
+                    "pipe:",
+                    format="mpegts",
+                    vcodec="copy",
+                    acodec="copy",
+                    output_ts_offset=offset,
+                    **{"loglevel": "error"},
+                )
+                .compile(),
+                stdout=muxer.stdin,
+            )
+            while feeder.poll() is None:
+                try:
+                    feeder.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    if hls and not is_render_streamable(input_path):
+                        print(f"Render of {input_file} stopped before it was complete")
+                        stop_feeder(feeder)
+            if feeder.returncode != 0:
+                print(
+                    f"Feeder for {input_file} exited with code {feeder.returncode}, "
+                    "falling back to the newest complete render"
+                )
+                # The feeder reads in real time, so it fed at most the time it
+                # ran, plus what ffmpeg reads ahead at the start. Timestamps
+                # may jump forward here, but never back.
+                offset += time.monotonic() - started + KEYFRAME_INTERVAL
+                current_file = None
+                time.sleep(1)
+                continue
+
+            # A segmented render is only complete once it has been fed
+            if hls:
+                offset += get_playlist_duration(input_path)
+            else:
+                offset += get_media_info(input_path)["duration"]
+
+        print(f"Stream ended with code {muxer.poll()}")
+
+    except KeyboardInterrupt:
+        print("\nStream stopped by user")
+    finally:
+        clear_streaming()
+        if feeder is not None:
+            stop_feeder(feeder)
+        muxer.stdin.close()
+        try:
+            wait_ffmpeg(muxer, monitor)
+        except ffmpeg.Error as e:
+            print(f"Streaming error: {e.stderr.decode()}")
+
+
+def get_radio_tracks(shuffle=False):
+    """Yield downloaded audio tracks forever, re-reading the index every pass.
+
+    New downloads and a changed order are picked up at the next pass. With
+    shuffle every pass gets a new random order that does not start with the
+    track that was just played.
+    """
+    last_path = None
+    while True:
+        tracks = get_indexed_media("_audio.m4a")
+        if not tracks:
+            raise FileNotFoundError("No audio files found for radio mode")
+
+        if shuffle:
+            random.shuffle(tracks)
+            if len(tracks) > 1 and tracks[0]["path"] == last_path:
+                tracks.append(tracks.pop(0))
+
+        for media in tracks:
+            yield media
+            last_path = media["path"]
+
+
+def prepare_radio_track(media):
+    """Measure, cut and normalize one track, reusing the audio mix caches.
+
+    Returns the track's crossfade points and its prepared audio parts.
+    """
+    audio_path = media["path"]
+    measurement = measure_loudness([audio_path])[audio_path]
+    points = get_crossfade_points([media], workers=1)[audio_path]
+    return points, prepare_audio_track(audio_path, measurement, points)
+
+
+def get_radio_segment(
+    video_path,
+    video_start,
+    list_path,
+    duration,
+    windows,
+    offset,
+    title_overlay=TITLE_OVERLAY,
+    fade_in=False,
+):
+    """Return the feeder stream for one track of the radio stream.
+
+    The looped video mix continues at video_start with the track's title on
+    top, the audio parts in list_path are joined by the concat demuxer. Both
+    are encoded to MPEG-TS on stdout as fast as the muxer reads it, shifted by
+    the time already streamed. The muxer paces the stream.
+    """
+    video = ffmpeg.input(video_path, stream_loop=-1, ss=video_start, t=duration).video
+
+    if title_overlay == "drawtext":
+        video = draw_titles(video, windows)
+    else:
+        video = overlay_titles(video, windows)
+
+    if fade_in:
+        video = ffmpeg.filter(video, "fade", type="in", duration=RENDER_FADE_DURATION)
+
+    audio = ffmpeg.input(list_path, f="concat", safe=0).audio
+    return ffmpeg.output(
+        video,
+        audio,
+        "pipe:",
+        format="mpegts",
+        acodec="aac",
+        **{"b:a": "192k"},
+        t=duration,
+        output_ts_offset=offset,
+        **RADIO_ENCODER_OPTS,
+        **{"loglevel": "error"},
+    )
+
+
+def stream_radio(
+    rtmp_url=None,
+    stream_key=None,
+    shuffle=False,
+    title_overlay=TITLE_OVERLAY,
+    video_file="output_video.mp4",
+):
+    """
+    Generate the stream live from the downloaded tracks instead of a render
+
+    Like stream_with_reload, one long-lived ffmpeg holds the RTMP connection
+    and it reads its input in real time. Every track is fed by its own
+    encoder that runs ahead of it as far as the pipe allows, so the startup
+    of the next encoder is made up: the crossfade from the previous track and
+    the track body come from the cached normalized audio segments, the video
+    mix keeps looping underneath with the track title composited on top.
+    The video mix has to be built beforehand, only the audio crossfades from
+    track to track, the video mix keeps playing through. The next track is
+    normalized while the current one is on air, so the track order can
+    change at any time without re-rendering and memory and disk use do not
+    grow with the playlist.
+
+    Args:
+        rtmp_url (str): YouTube RTMP URL (default: rtmp://a.rtmp.youtube.com/live2)
+        stream_key (str): Your YouTube stream key
+        shuffle (bool): Play every pass over the tracks in a random order
+        title_overlay (str): "png" or "drawtext", see TITLE_OVERLAY
+        video_file (str): The video mix in RENDERED_DIR to loop
+    """
+    if not rtmp_url:
+        rtmp_url = DEFAULT_RTMP_URL
+
+    if not stream_key:
+        raise ValueError("YouTube stream key is required")
+
+    video_path = os.path.join(RENDERED_DIR, video_file)
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video mix not found: {video_path}")
+    loop_duration = get_media_info(video_path)["duration"]
+
+    # Full RTMP URL with stream key
+    full_rtmp_url = f"{rtmp_url}/{stream_key}"
+
+    muxer, monitor = start_stream_muxer(full_rtmp_url, paced=True)
+
+    print("Starting radio stream to YouTube...")
+    print("Press Ctrl+C to stop the stream")
+
+    tracks = get_radio_tracks(shuffle)
+    list_path = os.path.join(TMP_DIR, "radio_segment.txt")
+    offset = 0.0
+    video_start = 0.0
+    previous = None
+    feeder = None
+    stream_started = None
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            media = next(tracks)
+            upcoming = executor.submit(prepare_radio_track, media)
+
+            while muxer.poll() is None:
+                current_media = media
+                (start, end), current = upcoming.result()
+
+                # Normalize the next track while this one is on air
+                media = next(tracks)
+                upcoming = executor.submit(prepare_radio_track, media)
+
+                # The first track starts with its head, every later one with
+                # the crossfade from the previous track
+                if previous is None:
+                    parts = [current[1]["head"], current[1]["body"]]
+                else:
+                    parts = [prepare_audio_fade(previous, current), current[1]["body"]]
+                previous = current
+                mark_streaming([video_path, current_media["path"], *parts])
+
+                with open(list_path, "w") as f:
+                    for path in parts:
+                        f.write(f"file '{os.path.abspath(path)}'\n")
+                duration = sum(get_media_info(path)["duration"] for path in parts)
+
+                track_name = get_track_name(current_media)
+                windows = get_title_windows(
+                    [
+                        {
+                            "name": track_name,
+                            "start_time": 0,
+                            "duration": end - start,
+                        }
+                    ]
+                )
+                print(f"Now playing: {track_name} at {offset:.2f}s")
+
+                if stream_started is None:
+                    stream_started = time.monotonic()
+                feeder, feeder_monitor = start_ffmpeg(
+                    get_radio_segment(
+                        video_path,
+                        video_start,
+                        list_path,
+                        duration,
+                        windows,
+                        offset,
+                        title_overlay=title_overlay,
+                        fade_in=offset == 0,
+                    ),
+                    "radio",
+                    stdout=muxer.stdin,
+                )
+                wait_ffmpeg(feeder, feeder_monitor)
+                offset += duration
+
+                # The muxer holds the feeders to real time, when the stream
+                # takes longer than its duration the encoders cannot keep up
+                elapsed = time.monotonic() - stream_started
+                record_metrics(
+                    "radio",
+                    "track",
+                    track_duration_seconds=duration,
+                    realtime_factor=offset / elapsed if elapsed else 0.0,
+                    lag_seconds=elapsed - offset,
+                )
+                if elapsed > offset + KEYFRAME_INTERVAL:
+                    print(
+                        f"Radio encoder is behind real time: {offset:.1f}s "
+                        f"of media took {elapsed:.1f}s"
+                    )
+
+                video_start = (video_start + duration) % loop_duration
+
+        print(f"Stream ended with code {muxer.poll()}")
+
+    except ffmpeg.Error as e:
+        print(f"Radio error: {e.stderr.decode()}")
+    except KeyboardInterrupt:
+        print("\nStream stopped by user")
+    finally:
+        clear_streaming()
+        if feeder is not None and feeder.poll() is None:
+            feeder.terminate()
+        if os.path.exists(list_path):
+            os.remove(list_path)
+        muxer.stdin.close()
+        try:
+            wait_ffmpeg(muxer, monitor)
+        except ffmpeg.Error as e:
+            print(f"Streaming error: {e.stderr.decode()}")
+
+
+def stream_to_youtube(
+    input_file=None,
+    rtmp_url=None,
+    stream_key=None,
+    standby=STREAM_STANDBY,
+    destinations=(),
+    low_bitrate_destinations=(),
+):
+    """
+    Stream the input file to YouTube RTMP server in an infinite loop
+
+    The stream is supervised: when the RTMP ffmpeg exits or its output stops
+    advancing for STREAM_STALL_TIMEOUT seconds it is restarted with
+    exponential backoff, and the loop continues where the last connection
+    left off instead of from the start. The file is fed in real time by a
+    separate ffmpeg, as in stream_with_reload. With standby the next RTMP
+    ffmpeg is started ahead of time; it waits for input before connecting, so
+    it never publishes alongside the live connection.
+
+    The file can be simulcast to further destinations from the same read.
+    A failing destination is reported and dropped while the others keep
+    streaming, it is retried when the stream reconnects after every
+    destination failed.
+    Args:
+        input_file (str): The file to stream
+        rtmp_url (str): YouTube RTMP URL (default: rtmp://a.rtmp.youtube.com/live2)
+        stream_key (str): Your YouTube stream key
+        standby (bool): Keep a spare RTMP ffmpeg started to reconnect faster
+        destinations (list): Further full RTMP URLs to stream to
+        low_bitrate_destinations (list): Full RTMP URLs that get the
+            LOW_BITRATE_ENCODER_OPTS rendition
+    """
+    if not rtmp_url:
+        rtmp_url = DEFAULT_RTMP_URL
+
+    if not stream_key and not destinations and not low_bitrate_destinations:
+        raise ValueError("YouTube stream key is required")
+
+    # Find the latest rendered file if input_file is not provided
+    if input_file is None:
+        input_file = get_latest_render()
+
+    input_path = os.path.join(RENDERED_DIR, input_file)
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+    loop_duration = get_media_info(input_path)["duration"]
+    mark_streaming([input_path])
+
+    # Full RTMP URLs with stream key
+    full_rtmp_urls = [f"{rtmp_url}/{stream_key}"] if stream_key else []
+    full_rtmp_urls += destinations
+    targets = full_rtmp_urls + list(low_bitrate_destinations)
+
+    print("Starting stream to YouTube...")
+    if len(targets) > 1:
+        for index, url in enumerate(targets):
+            # Leave the stream key out of the log
+            print(f"Destination {index}: {url.rsplit('/', 1)[0]}/...")
+    print("Press Ctrl+C to stop the stream")
+
+    position = 0.0
+    backoff = STREAM_BACKOFF_INITIAL
+    reconnects = 0
+    failed_at = None
+    spare = None
+    muxer = monitor = feeder = None
+    try:
+        while True:
+            if spare is not None:
+                (muxer, monitor), spare = spare, None
+                # The spare reports as the stream from now on
+                monitor["stage"] = "stream"
+                record_metrics("stream", "start", pid=muxer.pid, running=1)
+            else:
+                muxer, monitor = start_stream_muxer(
+                    full_rtmp_urls, low_bitrate_destinations
+                )
 
-        print(f"Adding video {i} at offset: {offset:.2f}s")
+            # Feed the loop in real time, starting where the last connection
+            # stopped
+            feeder = subprocess.Popen(
+                ffmpeg.input(input_path, ss=position, stream_loop=-1, re=None)
+                .output(
+                    "pipe:",
+                    format="mpegts",
+                    vcodec="copy",
+                    acodec="copy",
+                    **{"loglevel": "error"},
+                )
+                .compile(),
+                stdout=muxer.stdin,
+            )
+            if standby:
+                # Under its own stage, so its idle samples do not overwrite
+                # the metrics of the live stream
+                spare = start_stream_muxer(
+                    full_rtmp_urls, low_bitrate_destinations, stage="stream_standby"
+                )
 
-        # Apply the xfade filter
-        current_video = inputs[i].video
-        last_output = ffmpeg.filter(
-            [last_output, current_video],
-            "xfade",
-            transition="fade",
-            duration=TRANSITION_DURATION,
-            offset=offset,
-        )
-        filter_chains.append(last_output)
+            connected = time.monotonic()
+            last_advance = connected
+            sent = 0.0
+            failed = set()
+            reason = None
+            while muxer.poll() is None:
+                time.sleep(1)
+                for index in sorted(get_failed_destinations(monitor) - failed):
+                    failed.add(index)
+                    print(
+                        f"Destination {index} failed, streaming to "
+                        f"{len(targets) - len(failed)}/{len(targets)}"
+                    )
+                    record_metrics(f"destination_{index}", "health", healthy=0)
+                if len(failed) == len(targets):
+                    reason = "all destinations failed"
+                    break
 
-    # Output path
-    output_path = os.path.join(TMP_DIR, output_filename)
+                progress = monitor["progress"]
+                if not progress or (progress["out_time_seconds"] or 0.0) <= sent:
+                    if time.monotonic() - last_advance > STREAM_STALL_TIMEOUT:
+                        reason = f"no output for {STREAM_STALL_TIMEOUT}s"
+                        break
+                    continue
 
-    try:
-        # Build the ffmpeg command
-        stream = ffmpeg.output(
-            last_output,  # Final video stream after all transitions
-            output_path,
-            vcodec="libx264",
-            crf=23,
-            preset="superfast",
-            an=None,  # Explicitly disable audio
-        ).overwrite_output()
+                if sent == 0.0:
+                    for index in set(range(len(targets))) - failed:
+                        record_metrics(f"destination_{index}", "health", healthy=1)
+                sent = progress["out_time_seconds"]
+                last_advance = time.monotonic()
+                if failed_at is not None:
+                    latency = monitor["progress_time"] - failed_at
+                    print(f"Reconnected after {latency:.1f}s")
+                    record_metrics(
+                        "stream",
+                        "reconnect",
+                        reconnects=reconnects,
+                        reconnect_latency_seconds=latency,
+                    )
+                    failed_at = None
 
-        # Print the generated command for debugging
-        print("Generated ffmpeg command:")
-        print(stream.compile())
+            if failed_at is None:
+                failed_at = time.monotonic()
+            error = stop_stream_muxer(muxer, monitor, feeder)
+            muxer = None
+            for index in set(range(len(targets))) - failed:
+                record_metrics(f"destination_{index}", "health", healthy=0)
+            if time.monotonic() - connected >= STREAM_STABLE_AFTER:
+                backoff = STREAM_BACKOFF_INITIAL
 
-        # Run the ffmpeg command
-        stream.run(capture_stdout=True, capture_stderr=True)
-        print(f"Successfully created video mix: {output_path}")
+            position = (position + sent) % loop_duration
+            reconnects += 1
+            print(
+                f"Stream disconnected ({reason or error or 'ended'}), reconnecting in "
+                f"{backoff}s at {position:.2f}s"
+            )
+            record_metrics(
+                "stream",
+                "disconnect",
+                reconnects=reconnects,
+                backoff_seconds=backoff,
+                position_seconds=position,
+            )
+            time.sleep(backoff)
+            backoff = min(backoff * 2, STREAM_BACKOFF_MAX)
 
-        print(f"Moving {output_path} to {RENDERED_DIR}")
-        os.rename(output_path, os.path.join(RENDERED_DIR, output_filename))
+    except KeyboardInterrupt:
+        print("\nStream stopped by user")
+    finally:
+        clear_streaming()
+        if muxer is not None:
+            stop_stream_muxer(muxer, monitor, feeder)
+        if spare is not None:
+            stop_stream_muxer(*spare)
 
-    except ffmpeg.Error as e:
-        print(f"Error creating video mix: {e.stderr.decode()}")
-        if os.path.exists(output_path):
-            os.remove(output_path)
 
+def load_daemon_config(config_path):
+    """Read the playlists of the daemon, filling in the defaults.
 
-def get_track_timings():
-    """Get track names and their start times from the audio files."""
-    track_info = []
-    current_time = 0
+    The config is a JSON object with a "playlists" list. Every playlist needs
+    a "url" and can set a "name" for its workspace, an "interval" in seconds,
+    a "priority" (higher first), "live" when its renders are being streamed
+    and extra "args" for every process run. "cpu_budget", "max_jobs" and
+    "port" override the daemon defaults.
+    """
+    with open(config_path) as f:
+        config = json.load(f)
 
-    for filename in sorted(os.listdir(DL_DIR)):
-        if filename.endswith("_audio.m4a"):
-            # Extract track name by removing '_audio.m4a' and replacing underscores with spaces
-            track_name = filename.replace("_audio.m4a", "").replace("_", " ")
-            track_info.append(
-                {
-                    "name": track_name,
-                    "start_time": current_time,
-                    "duration": AUDIO_DURATION,
-                }
-            )
-            current_time += (
-                AUDIO_DURATION - TRANSITION_DURATION
-            )  # Account for crossfade
+    config.setdefault("cpu_budget", DAEMON_CPU_BUDGET)
+    config.setdefault("max_jobs", DAEMON_MAX_JOBS)
+    config.setdefault("port", DAEMON_PORT)
+    for playlist in config["playlists"]:
+        playlist.setdefault(
+            "name", hashlib.sha1(playlist["url"].encode()).hexdigest()[:12]
+        )
+        playlist.setdefault("interval", DAEMON_INTERVAL)
+        playlist.setdefault("priority", 0)
+        playlist.setdefault("live", False)
+        playlist.setdefault("args", [])
 
-    return track_info
+    names = [playlist["name"] for playlist in config["playlists"]]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Playlist names in {config_path} are not unique")
+    return config
 
 
-def create_audio_mix(output_filename="output_audio.mp4"):
-    """Create a mix of all audio with fade transitions."""
-    # Get all audio files
-    audio_files = []
-    for filename in sorted(os.listdir(DL_DIR)):
-        if filename.endswith("_audio.m4a"):
-            audio_path = os.path.join(DL_DIR, filename)
-            audio_files.append(audio_path)
-            # Print debug info about the audio
-            probe = ffmpeg.probe(audio_path)
-            duration = float(probe["streams"][0]["duration"])
-            print(f"Audio: {filename}, Duration: {duration:.2f} seconds")
+def get_job_priority(playlist, stage):
+    """Return the sort key of a daemon job, smaller keys are started first.
 
-    if not audio_files:
-        print("No audio files found to mix!")
-        return
+    Renders of live playlists go first, then the other stages of live
+    playlists, then by playlist priority. Within a playlist later stages go
+    first, so a run that started is finished before the next one begins.
+    """
+    live = playlist["live"]
+    return (
+        not (live and stage == "render"),
+        not live,
+        -playlist["priority"],
+        -DAEMON_STAGES.index(stage),
+    )
 
-    print(f"Total audio files to mix: {len(audio_files)}")
 
-    # Create ffmpeg input streams with normalization
-    normalized_inputs = []
-    for audio in audio_files:
-        # First pass to analyze audio
-        input_stream = ffmpeg.input(audio)
+def get_stage_command(playlist, stage, cores):
+    """Return the process command that runs one stage of a playlist.
 
-        # Add normalized audio to our inputs
-        normalized = input_stream.audio.filter(
-            "loudnorm",
-            I="-27",  # Integrated loudness target (even quieter)
-            LRA="11",  # Loudness range
-            TP="-3.0",  # True peak (lowered further to prevent clipping)
-        )
-        normalized_inputs.append(normalized)
+    The other stages are skipped with the existing --skip-* options, the
+    download and render workers are sized to the cores of the job.
+    """
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "process",
+        "--playlist-url",
+        playlist["url"],
+        "--workspace",
+        os.path.join(PLAYLISTS_DIR, playlist["name"]),
+        "--source-dir",
+        os.path.abspath(SHARED_SOURCES_DIR),
+    ]
+    skip_args = {
+        "download": ["--skip-dl", "1"],
+        "video_mix": ["--skip-video-mixing", "1"],
+        "audio_mix": ["--skip-audio-mixing", "1"],
+        "render": ["--skip-render"],
+    }
+    for other in DAEMON_STAGES:
+        if other != stage:
+            command += skip_args[other]
 
-    # Build the filter complex
-    filter_chains = []
+    workers = max(1, cores // 4)
+    if stage == "download":
+        command += [
+            "--normalize-workers",
+            str(workers),
+            "--normalize-threads",
+            str(max(1, cores // workers)),
+        ]
+    elif stage == "render":
+        command += ["--render-workers", str(workers)]
+    return command + playlist["args"]
 
-    # Initialize with first normalized audio
-    last_output = normalized_inputs[0]
-    current_duration = AUDIO_DURATION
 
-    for i in range(1, len(audio_files)):
-        # Calculate the offset for the transition
-        offset = current_duration - TRANSITION_DURATION
-        current_duration += AUDIO_DURATION - TRANSITION_DURATION
+async def run_scheduled_job(scheduler, job, log_path):
+    """Wait until a job is first in line and fits the budget, then run it.
 
-        print(f"Adding audio {i} at offset: {offset:.2f}s")
+    The first waiting job is never overtaken by a smaller one, so a large
+    render is not starved by downloads. Returns the exit code.
+    """
+    condition = scheduler["condition"]
+    cores = min(job["cores"], scheduler["cpu_budget"])
+    entry = (job["priority"], next(scheduler["sequence"]), job)
 
-        # Apply the acrossfade filter with normalized audio
-        current_audio = normalized_inputs[i]
-        last_output = ffmpeg.filter(
-            [last_output, current_audio],
-            "acrossfade",
-            duration=TRANSITION_DURATION,
-            curve1="tri",
-            curve2="tri",
-            d=TRANSITION_DURATION,
+    def can_start():
+        return (
+            scheduler["waiting"][0] is entry
+            and scheduler["cpu_used"] + cores <= scheduler["cpu_budget"]
+            and len(scheduler["running"]) < scheduler["max_jobs"]
         )
-        filter_chains.append(last_output)
 
-    # Output path
-    output_path = os.path.join(TMP_DIR, output_filename)
+    async with condition:
+        heapq.heappush(scheduler["waiting"], entry)
+        job.update(state="queued", queued_at=time.time())
+        try:
+            await condition.wait_for(can_start)
+        except asyncio.CancelledError:
+            scheduler["waiting"].remove(entry)
+            heapq.heapify(scheduler["waiting"])
+            raise
+        heapq.heappop(scheduler["waiting"])
+        scheduler["cpu_used"] += cores
+        scheduler["running"].append(job)
+        # The next job in line may fit as well
+        condition.notify_all()
 
+    job.update(state="running", started_at=time.time())
+    process = None
     try:
-        # Build the ffmpeg command
-        stream = ffmpeg.output(
-            last_output,  # Final audio stream after all transitions
-            output_path,
-            acodec="aac",
-            **{"b:a": "192k"},
-            vn=None,  # Explicitly disable video
-        ).overwrite_output()
+        with open(log_path, "ab") as log:
+            process = await asyncio.create_subprocess_exec(
+                *job["command"], stdout=log, stderr=asyncio.subprocess.STDOUT
+            )
+            job["pid"] = process.pid
+            return await process.wait()
+    except asyncio.CancelledError:
+        if process and process.returncode is None:
+            process.terminate()
+            await process.wait()
+        raise
+    finally:
+        job["state"] = "finished"
+        async with condition:
+            scheduler["cpu_used"] -= cores
+            scheduler["running"].remove(job)
+            condition.notify_all()
 
-        # Print the generated command for debugging
-        print("Generated ffmpeg command:")
-        print(stream.compile())
 
-        # Run the ffmpeg command
-        stream.run(capture_stdout=True, capture_stderr=True)
-        print(f"Successfully created audio mix: {output_path}")
+async def run_playlist(daemon, playlist):
+    """Run the stages of a playlist every interval through the scheduler."""
+    status = daemon["playlists"][playlist["name"]]
+    workspace = os.path.join(PLAYLISTS_DIR, playlist["name"])
+    os.makedirs(workspace, exist_ok=True)
+    log_path = os.path.join(workspace, "process.log")
+
+    while True:
+        started = time.time()
+        status.update(state="running", last_run=started, next_run=None)
+        for stage in DAEMON_STAGES:
+            cores = DAEMON_STAGE_CORES[stage]
+            job = {
+                "playlist": playlist["name"],
+                "stage": stage,
+                "cores": cores,
+                "priority": get_job_priority(playlist, stage),
+                "command": get_stage_command(playlist, stage, cores),
+            }
+            status["job"] = job
+            returncode = await run_scheduled_job(daemon["scheduler"], job, log_path)
+            if returncode != 0:
+                status["failures"] += 1
+                status["last_error"] = f"{stage} exited with {returncode}"
+                print(f"[{playlist['name']}] {status['last_error']}, see {log_path}")
+                break
+        else:
+            status.update(last_success=time.time(), last_error=None)
+            print(f"[{playlist['name']}] Processed in {time.time() - started:.1f}s")
 
-        print(f"Moving {output_path} to {RENDERED_DIR}")
-        os.rename(output_path, os.path.join(RENDERED_DIR, output_filename))
+        status["runs"] += 1
+        status.update(
+            state="idle",
+            job=None,
+            last_duration=time.time() - started,
+            next_run=time.time() + playlist["interval"],
+        )
+        await asyncio.sleep(playlist["interval"])
 
-    except ffmpeg.Error as e:
-        print(f"Error creating audio mix: {e.stderr.decode()}")
-        if os.path.exists(output_path):
-            os.remove(output_path)
 
+def get_daemon_status(daemon):
+    """Return the state of the scheduler and every playlist as a dict."""
+    scheduler = daemon["scheduler"]
 
-def render_result(
-    video_file="output_video.mp4",
-    audio_file="output_audio.mp4",
-    output_file=None,
-):
-    """Combine video and audio mix with track name overlays."""
+    def describe(job):
+        return {key: value for key, value in job.items() if key != "command"}
 
-    if output_file is None:
-        timestamp = datetime.now().strftime("%Y%m%d%H%M")
-        output_file = f"final_output_{timestamp}.mp4"
+    return {
+        "cpu_budget": scheduler["cpu_budget"],
+        "cpu_used": scheduler["cpu_used"],
+        "max_jobs": scheduler["max_jobs"],
+        "running": [describe(job) for job in scheduler["running"]],
+        "queued": [describe(job) for _, _, job in sorted(scheduler["waiting"])],
+        "playlists": {
+            name: {**status, "job": status["job"] and describe(status["job"])}
+            for name, status in daemon["playlists"].items()
+        },
+        "shared_sources": (
+            len(os.listdir(SHARED_SOURCES_DIR))
+            if os.path.isdir(SHARED_SOURCES_DIR)
+            else 0
+        ),
+    }
 
-    video_path = os.path.join(RENDERED_DIR, video_file)
-    audio_path = os.path.join(RENDERED_DIR, audio_file)
-    output_path = os.path.join(TMP_DIR, output_file)
 
-    # Get track timing information
-    track_info = get_track_timings()
+def get_daemon_metrics(daemon):
+    """Return the daemon gauges and the metrics of every workspace.
 
-    # Get audio and video durations
-    audio_probe = ffmpeg.probe(audio_path)
-    video_probe = ffmpeg.probe(video_path)
-    audio_duration = float(audio_probe["streams"][0]["duration"])
-    video_duration = float(video_probe["streams"][0]["duration"])
+    The METRICS_PROM textfiles of the workspaces are merged with an added
+    playlist label, so one scrape covers all playlists.
+    """
+    samples = {}
 
-    # Calculate how many times to loop the video
-    loop_times = int(audio_duration / video_duration) + 1
+    def add(name, value, labels=""):
+        series = f"{name}{{{labels}}}" if labels else name
+        samples.setdefault(name, []).append(f"{series} {value}")
 
-    # Create video input with explicit loop count and trim to audio duration
-    video = (
-        ffmpeg.input(video_path, stream_loop=loop_times)
-        .filter("setpts", "PTS-STARTPTS")
-        .filter("trim", duration=audio_duration)
-    )
-    audio = ffmpeg.input(audio_path)
+    scheduler = daemon["scheduler"]
+    add("ytautostream_daemon_cpu_budget", scheduler["cpu_budget"])
+    add("ytautostream_daemon_cpu_used", scheduler["cpu_used"])
+    add("ytautostream_daemon_jobs_running", len(scheduler["running"]))
+    add("ytautostream_daemon_jobs_queued", len(scheduler["waiting"]))
 
-    # Create drawtext filters for each track
-    video_with_text = video
+    for name, status in daemon["playlists"].items():
+        label = f'playlist="{name}"'
+        add(
+            "ytautostream_daemon_playlist_running",
+            int(status["state"] != "idle"),
+            label,
+        )
+        add("ytautostream_daemon_playlist_failures", status["failures"], label)
+        if status["last_success"]:
+            add("ytautostream_daemon_last_success", status["last_success"], label)
 
-    for track in track_info:
-        # Create fade-in and fade-out times
-        fade_duration = min(TRANSITION_DURATION, 2)  # Use shorter fade for text
-        start_time = track["start_time"]
-        end_time = start_time + track["duration"] - TRANSITION_DURATION
+        prom_path = os.path.join(PLAYLISTS_DIR, name, METRICS_PROM)
+        if not os.path.exists(prom_path):
+            continue
+        with open(prom_path) as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                series, _, value = line.strip().rpartition(" ")
+                metric, _, labels = series.partition("{")
+                labels = labels.rstrip("}")
+                add(metric, value, label + ("," + labels if labels else ""))
 
-        # Split track name into title and rest (if there's a hyphen)
-        parts = track["name"].split(" - ", 1)
-        title = parts[0] if parts else track["name"]
-        # subtitle = parts[1] if len(parts) > 1 else ''
+    lines = []
+    for metric in sorted(samples):
+        lines.append(f"# TYPE {metric} gauge")
+        lines += samples[metric]
+    return "\n".join(lines) + "\n"
 
-        # Title parameters (larger, positioned at bottom left)
-        if FONT_PATH and os.path.exists(FONT_PATH):
-            title_params = {
-                "text": title,
-                "fontcolor": "white",
-                "fontfile": FONT_PATH,
-                "fontsize": "36",
-                "x": "20",  # 20 pixels from left edge
-                "y": "h-th-20",  # 20 pixels from bottom
-                "enable": f"between(t,{start_time},{end_time})",
-                "alpha": f"if(lt(t,{start_time + fade_duration}),((t-{start_time})/{fade_duration}),"
-                f"if(gt(t,{end_time - fade_duration}),(({end_time}-t)/{fade_duration}),1))",
-            }
-        else:
-            title_params = {
-                "text": title,
-                "fontcolor": "white",
-                "fontsize": "36",
-                "x": "20",  # 20 pixels from left edge
-                "y": "h-th-20",  # 20 pixels from bottom
-                "enable": f"between(t,{start_time},{end_time})",
-                "alpha": f"if(lt(t,{start_time + fade_duration}),((t-{start_time})/{fade_duration}),"
-                f"if(gt(t,{end_time - fade_duration}),(({end_time}-t)/{fade_duration}),1))",
-            }
 
-        # Apply the drawtext filters
-        video_with_text = ffmpeg.filter(video_with_text, "drawtext", **title_params)
+async def handle_status_request(daemon, reader, writer):
+    """Serve GET /status as JSON and GET /metrics in the Prometheus format."""
     try:
-        # Add fade in/out effects to the video
-        fade_duration = 5  # 2 second fade duration
+        request = (await reader.readline()).decode(errors="replace").split()
+        while (await reader.readline()).strip():
+            pass  # Skip the headers
 
-        # Apply fade in/out effects
-        video_with_effects = ffmpeg.filter(
-            video_with_text, "fade", type="in", duration=fade_duration
-        )
-        video_with_effects = ffmpeg.filter(
-            video_with_effects,
-            "fade",
-            type="out",
-            duration=fade_duration,
-            start_time=audio_duration - fade_duration,
+        path = request[1] if len(request) > 1 else ""
+        if path == "/status":
+            code, content_type = "200 OK", "application/json"
+            body = json.dumps(get_daemon_status(daemon), indent=2)
+        elif path == "/metrics":
+            code, content_type = "200 OK", "text/plain; version=0.0.4"
+            body = get_daemon_metrics(daemon)
+        else:
+            code, content_type, body = "404 Not Found", "text/plain", "Not found\n"
+
+        body = body.encode()
+        writer.write(
+            f"HTTP/1.0 {code}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
         )
+        await writer.drain()
+    finally:
+        writer.close()
 
-        # Combine video and audio
-        stream = ffmpeg.output(
-            video_with_effects,
-            audio.audio,
-            output_path,
-            vcodec="libx264",
-            acodec="aac",
-            **{"b:a": "192k"},
-            preset="superfast",
-            crf=23,
-        ).overwrite_output()
 
-        # Print the generated command for debugging
-        print("Generated ffmpeg command:")
-        print(stream.compile())
+async def run_daemon(config_path=DAEMON_CONFIG, port=None):
+    """Process every playlist of the config on its interval until stopped.
 
-        # Run the ffmpeg command
-        stream.run(capture_stdout=True, capture_stderr=True)
-        print(f"Successfully created final output: {output_path}")
+    Each stage runs as a process action in the playlist's workspace under
+    PLAYLISTS_DIR, so a crashing yt-dlp or ffmpeg only fails that job.
+    Downloads and normalized clips are shared through SHARED_SOURCES_DIR.
+    """
+    config = load_daemon_config(config_path)
+    os.makedirs(SHARED_SOURCES_DIR, exist_ok=True)
+    daemon = {
+        "scheduler": {
+            "cpu_budget": config["cpu_budget"],
+            "max_jobs": config["max_jobs"],
+            "cpu_used": 0,
+            "running": [],
+            "waiting": [],
+            "sequence": itertools.count(),
+            "condition": asyncio.Condition(),
+        },
+        "playlists": {
+            playlist["name"]: {
+                "url": playlist["url"],
+                "live": playlist["live"],
+                "state": "idle",
+                "job": None,
+                "runs": 0,
+                "failures": 0,
+                "last_run": None,
+                "last_duration": None,
+                "last_success": None,
+                "last_error": None,
+                "next_run": None,
+            }
+            for playlist in config["playlists"]
+        },
+    }
 
-        print(f"Moving {output_path} to {RENDERED_DIR}")
-        os.rename(output_path, os.path.join(RENDERED_DIR, output_file))
+    port = port or config["port"]
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_status_request(daemon, reader, writer),
+        "127.0.0.1",
+        port,
+    )
+    print(
+        f"Managing {len(config['playlists'])} playlists with "
+        f"{config['cpu_budget']} cores and {config['max_jobs']} jobs, "
+        f"status on http://127.0.0.1:{port}/status"
+    )
+    async with server:
+        await asyncio.gather(
+            *(run_playlist(daemon, playlist) for playlist in config["playlists"])
+        )
 
-    except ffmpeg.Error as e:
-        print(f"Error creating final output: {e.stderr.decode()}")
-        if os.path.exists(output_path):
-            os.remove(output_path)
 
+def use_workspace(workspace=None, source_dir=None):
+    """Set SOURCE_DIR and make workspace the working directory.
 
-# Create the mixes
-def stream_to_youtube(input_file=None, rtmp_url=None, stream_key=None):
+    DATA_DIR and everything in it are relative to the working directory, so
+    they end up in the workspace. The font and cookies stay where they are.
     """
-    Stream the input file to YouTube RTMP server in an infinite loop
-    Args:
-        input_file (str): The file to stream
-        rtmp_url (str): YouTube RTMP URL (default: rtmp://a.rtmp.youtube.com/live2)
-        stream_key (str): Your YouTube stream key
-    """
-    if not rtmp_url:
-        rtmp_url = "rtmp://a.rtmp.youtube.com/live2"
+    global FONT_PATH, COOKIES_FILE, SOURCE_DIR
+    if source_dir:
+        SOURCE_DIR = os.path.abspath(source_dir)
+    if workspace:
+        FONT_PATH = os.path.abspath(FONT_PATH)
+        COOKIES_FILE = os.path.abspath(COOKIES_FILE)
+        os.makedirs(workspace, exist_ok=True)
+        os.chdir(workspace)
+        ensure_directories()
 
-    if not stream_key:
-        raise ValueError("YouTube stream key is required")
 
-    # Find the latest rendered file if input_file is not provided
-    if input_file is None:
-        files = [f for f in os.listdir(RENDERED_DIR) if f.startswith("final_output")]
-        if not files:
-            raise FileNotFoundError("No rendered files found")
-        input_file = sorted(files)[-1]
+def print_build_plan(
+    video_mode=VIDEO_MIX_MODE,
+    audio_mode=AUDIO_MIX_MODE,
+    title_overlay=TITLE_OVERLAY,
+    render_mode=RENDER_MODE,
+    render_output=RENDER_OUTPUT,
+):
+    """Print which artifacts a process run would rebuild, without building.
 
-    input_path = os.path.join(RENDERED_DIR, input_file)
-    if not os.path.exists(input_path):
-        raise FileNotFoundError(f"Input file not found: {input_path}")
+    An artifact is rebuilt when its inputs or parameters changed or when
+    anything upstream of it is rebuilt. Only the existing media index and
+    envelope caches are read, nothing is probed, analyzed or written. An
+    artifact whose inputs are not in these caches yet is reported as
+    unknown, it is rebuilt unless a run finds it up to date.
+    """
 
-    # Full RTMP URL with stream key
-    full_rtmp_url = f"{rtmp_url}/{stream_key}"
+    def status(rebuild):
+        if rebuild is None:
+            return "unknown (not cached yet), rebuild"
+        return "rebuild" if rebuild else "up to date"
 
-    try:
-        # Setup the stream with loop input and consistent output settings
-        stream = (
-            ffmpeg.input(
-                input_path, stream_loop=-1, re=None
-            )  # -1 means infinite loop, re=None adds 'real-time' flag
-            # .filter("format", "nv12")  # VA-API requires NV12 (equivalent to yuv420p)
-            # .filter("hwupload")  # Upload to GPU
-            .output(
-                full_rtmp_url,
-                format="flv",
-                # vcodec="h264_vaapi",
-                # vaapi_device="/dev/dri/renderD128",
-                # vcodec="h264_qsv",
-                # vcodec="libx264",
-                # acodec="aac",
-                vcodec="copy",
-                acodec="copy",
-                **{
-                    "b:v": "4500k",  # Video bitrate
-                    "b:a": "192k",  # Audio bitrate
-                    "bufsize": "8192k",
-                    "maxrate": "4500k",
-                    "preset": "veryfast",
-                    "g": "50",  # Keyframe interval
-                    "r": "25",  # Output framerate
-                    # "profile:v": "main",  # Ensures yuv420p compatibility
-                    # "qp": "20",  # Quality parameter (lower = better quality)
-                },
-            )
-            .overwrite_output()
+    print("Build plan (downloads are not checked in a dry run):")
+
+    normalize_rebuild = False
+    for input_path in get_downloaded_videos():
+        rebuild = not is_stage_current(
+            get_normalized_path(input_path), get_normalize_key(input_path)
         )
+        normalize_rebuild = normalize_rebuild or rebuild
+        print(f"  normalize {os.path.basename(input_path)}: {status(rebuild)}")
 
-        print("Starting stream to YouTube...")
-        print("Press Ctrl+C to stop the stream")
+    video_path = os.path.join(RENDERED_DIR, "output_video.mp4")
+    videos = read_indexed_media("_normalized.mp4")
+    video_rebuild = None
+    if videos is not None:
+        video_rebuild = normalize_rebuild or not is_stage_current(
+            video_path,
+            get_video_mix_key([media["path"] for media in videos], video_mode),
+        )
+    print(f"  video_mix {os.path.basename(video_path)}: {status(video_rebuild)}")
 
-        # Run the ffmpeg command
-        stream.run(capture_stdout=True, capture_stderr=True)
+    audio_path = os.path.join(RENDERED_DIR, "output_audio.mp4")
+    tracks = read_indexed_media("_audio.m4a")
+    audio_rebuild = None
+    if tracks is not None:
+        audio_rebuild = not is_stage_current(
+            audio_path,
+            get_audio_mix_key([media["path"] for media in tracks], audio_mode),
+        )
+    print(f"  audio_mix {os.path.basename(audio_path)}: {status(audio_rebuild)}")
 
-    except ffmpeg.Error as e:
-        print(f"Streaming error: {e.stderr.decode()}")
-    except KeyboardInterrupt:
-        print("\nStream stopped by user")
+    render_rebuild = True
+    if video_rebuild is None or audio_rebuild is None:
+        render_rebuild = None
+    elif not video_rebuild and not audio_rebuild:
+        track_info = get_track_timings(tracks, cached_only=True)
+        if track_info is None:
+            render_rebuild = None
+        else:
+            render_key = get_render_key(
+                video_path,
+                audio_path,
+                track_info,
+                title_overlay,
+                render_mode,
+                render_output,
+            )
+            render_rebuild = find_stage_output(render_key, RENDERED_DIR) is None
+    print(f"  render final_output_*.mp4: {status(render_rebuild)}")
 
 
 def main():
     """Main entry point with argument parsing"""
     import argparse
 
+    global TITLE_DURATION, data_lock_file
+
     parser = argparse.ArgumentParser(
         description="YouTube Playlist Processor and Streamer"
     )
     parser.add_argument(
         "action",
-        choices=["process", "stream"],
+        choices=["process", "stream", "render-worker", "daemon", "preview"],
         help='Action to perform: "process" to download and process files, '
-        '"stream" to start streaming',
+        '"stream" to start streaming, "render-worker" to encode chunks of '
+        'chunked renders started on another node, "daemon" to keep processing '
+        'the playlists of a config file, "preview" to render a low resolution '
+        "preview of the downloaded files",
     )
     parser.add_argument(
         "--playlist-url",
@@ -565,41 +4799,301 @@ def main():
         "--stream-key",
         help="YouTube stream key (required for stream action)",
     )
+    parser.add_argument(
+        "--workspace",
+        help="Directory to keep DATA_DIR in instead of the working directory",
+    )
+    parser.add_argument(
+        "--source-dir",
+        help="Directory of downloads and normalized clips shared with other "
+        "workspaces",
+    )
+    parser.add_argument(
+        "--config",
+        default=DAEMON_CONFIG,
+        help="Playlists of the daemon action (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help=f"Status and metrics port of the daemon (default: {DAEMON_PORT})",
+    )
+    parser.add_argument(
+        "--rtmp-url",
+        default=DEFAULT_RTMP_URL,
+        help="RTMP server to stream to (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--reload",
+        action="store_true",
+        help="Switch to newly rendered files without restarting the stream",
+    )
+    parser.add_argument(
+        "--radio",
+        action="store_true",
+        help="Mix, title and encode the downloaded tracks live instead of "
+        "looping the final render",
+    )
+    parser.add_argument(
+        "--shuffle",
+        action="store_true",
+        help="Play the tracks in a random order in radio mode",
+    )
+    parser.add_argument(
+        "--standby",
+        action="store_true",
+        help="Keep a spare RTMP connection process started to reconnect faster",
+    )
+    parser.add_argument(
+        "--destination",
+        action="append",
+        default=[],
+        metavar="URL",
+        help="Full RTMP URL with stream key to simulcast to, can be repeated",
+    )
+    parser.add_argument(
+        "--low-bitrate-destination",
+        action="append",
+        default=[],
+        metavar="URL",
+        help="Like --destination, but sends a lower bitrate rendition that is "
+        "encoded once for all of them",
+    )
     parser.add_argument(
         "--skip-dl",
         help="YouTube stream key (required for stream action)",
     )
+    parser.add_argument(
+        "--sequential-dl",
+        action="store_true",
+        help="Download video, then audio, and normalize afterwards",
+    )
+    parser.add_argument(
+        "--normalize-workers",
+        type=int,
+        help=f"Number of parallel normalization jobs (default: {NORMALIZE_WORKERS})",
+    )
+    parser.add_argument(
+        "--normalize-threads",
+        type=int,
+        help="ffmpeg threads per normalization job "
+        "(default: cores divided by workers)",
+    )
+    parser.add_argument(
+        "--title-overlay",
+        choices=["png", "drawtext"],
+        default=TITLE_OVERLAY,
+        help="How track titles are rendered (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--title-duration",
+        type=float,
+        default=TITLE_DURATION,
+        metavar="SECONDS",
+        help="Show each track title for SECONDS after the track starts "
+        "(default: until the crossfade into the next track)",
+    )
+    parser.add_argument(
+        "--render-mode",
+        choices=["full", "selective", "chunked"],
+        default=RENDER_MODE,
+        help="Re-encode the whole final render, only the spans with titles "
+        "and fades, or the whole render in parallel chunks (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        help=f"Number of parallel chunk encodes (default: {RENDER_WORKERS})",
+    )
+    parser.add_argument(
+        "--render-output",
+        choices=["mp4", "hls"],
+        default=RENDER_OUTPUT,
+        help="Render one MP4 file or fMP4 segments with a growing HLS playlist "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--hls",
+        action="store_true",
+        help="Stream the latest segmented render, following its playlist while "
+        "it is still being rendered",
+    )
+    parser.add_argument(
+        "--video-mix-mode",
+        choices=["segments", "xfade"],
+        default=VIDEO_MIX_MODE,
+        help="Build the video mix from cached segments or one xfade chain "
+        "(default: %(default)s)",
+    )
     parser.add_argument(
         "--skip-video-mixing",
         help="YouTube stream key (required for stream action)",
     )
+    parser.add_argument(
+        "--audio-mix-mode",
+        choices=["segments", "acrossfade"],
+        default=AUDIO_MIX_MODE,
+        help="Build the audio mix from cached segments or one acrossfade chain "
+        "(default: %(default)s)",
+    )
     parser.add_argument(
         "--skip-audio-mixing",
         help="YouTube stream key (required for stream action)",
     )
+    parser.add_argument(
+        "--disk-quota",
+        action="append",
+        default=[],
+        metavar="DIR=SIZE",
+        help="Evict the least recently used files of a directory in "
+        f"DISK_QUOTAS ({', '.join(DISK_QUOTAS)}) above SIZE, e.g. "
+        f"{DL_DIR}=20G, can be repeated",
+    )
+    parser.add_argument(
+        "--min-free",
+        type=parse_size,
+        default=DISK_MIN_FREE,
+        metavar="SIZE",
+        help="Evict the least recently used files until SIZE is free on disk",
+    )
+    parser.add_argument(
+        "--start",
+        type=float,
+        help="Start of the preview in seconds (default: the beginning)",
+    )
+    parser.add_argument(
+        "--end",
+        type=float,
+        help="End of the preview in seconds (default: the end)",
+    )
+    parser.add_argument(
+        "--boundary",
+        type=int,
+        metavar="TRACK",
+        help=f"Preview the crossfade into track number TRACK and {PREVIEW_CONTEXT} "
+        "seconds around it",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show which stages the process action would rebuild and exit",
+    )
+    parser.add_argument(
+        "--skip-render",
+        action="store_true",
+        help="Stop after mixing, radio mode streams without a final render",
+    )
 
     args = parser.parse_args()
 
     # Validate required arguments based on action
     if args.action == "process" and not args.playlist_url:
         parser.error("--playlist-url is required when action is 'process'")
-    elif args.action == "stream" and not args.stream_key:
+    elif args.action == "stream" and not (
+        args.stream_key or args.destination or args.low_bitrate_destination
+    ):
         parser.error("--stream-key is required when action is 'stream'")
+    elif (args.destination or args.low_bitrate_destination) and (
+        args.radio or args.reload or args.hls
+    ):
+        parser.error("destinations are only supported when streaming a render")
 
-    if args.action == "process":
+    quotas = dict(DISK_QUOTAS)
+    for quota in args.disk_quota:
+        directory, _, size = quota.partition("=")
+        directory = os.path.normpath(directory)
+        if directory not in quotas or not size:
+            parser.error(f"--disk-quota needs one of {', '.join(quotas)}=SIZE")
+        quotas[directory] = parse_size(size)
+
+    TITLE_DURATION = args.title_duration
+    use_workspace(args.workspace, args.source_dir)
+    data_lock_file = cleanup_temp_files()
+
+    if args.action == "process" and args.dry_run:
+        print_build_plan(
+            video_mode=args.video_mix_mode,
+            audio_mode=args.audio_mix_mode,
+            title_overlay=args.title_overlay,
+            render_mode=args.render_mode,
+            render_output=args.render_output,
+        )
+    elif args.action == "process":
         """Download and process all files"""
+        enforce_quotas(quotas, args.min_free)
+        if not args.skip_dl and args.sequential_dl:
+            record_stage(
+                "download_video",
+                download_videos,
+                args.playlist_url,
+                workers=args.normalize_workers,
+                threads=args.normalize_threads,
+            )
+            record_stage("download_audio", download_audio, args.playlist_url)
+        elif not args.skip_dl:
+            record_stage(
+                "download",
+                download_pipeline,
+                args.playlist_url,
+                workers=args.normalize_workers,
+                threads=args.normalize_threads,
+            )
         if not args.skip_dl:
-            download_videos(args.playlist_url)
-            download_audio(args.playlist_url)
+            enforce_quotas(quotas, args.min_free)
+
         if not args.skip_video_mixing:
-            create_video_mix()
+            record_stage("video_mix", create_video_mix, mode=args.video_mix_mode)
 
         if not args.skip_audio_mixing:
-            create_audio_mix()
+            record_stage("audio_mix", create_audio_mix, mode=args.audio_mix_mode)
 
-        render_result()
+        if not args.skip_render:
+            record_stage(
+                "render",
+                render_result,
+                title_overlay=args.title_overlay,
+                mode=args.render_mode,
+                output=args.render_output,
+                workers=args.render_workers,
+            )
+            enforce_quotas(quotas, args.min_free)
+    elif args.action == "preview":
+        record_stage(
+            "preview",
+            render_preview,
+            title_overlay=args.title_overlay,
+            start=args.start,
+            end=args.end,
+            boundary=args.boundary,
+        )
+    elif args.action == "daemon":
+        asyncio.run(run_daemon(args.config, port=args.port))
+    elif args.action == "render-worker":
+        workers = args.render_workers or RENDER_WORKERS
+        print(f"Waiting for render chunks in {RENDER_QUEUE_DIR}...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in range(workers):
+                executor.submit(run_render_worker, max(1, CPU_COUNT // workers))
     elif args.action == "stream":
-        stream_to_youtube(stream_key=args.stream_key)
+        if args.radio:
+            stream_radio(
+                rtmp_url=args.rtmp_url,
+                stream_key=args.stream_key,
+                shuffle=args.shuffle,
+                title_overlay=args.title_overlay,
+            )
+        elif args.reload or args.hls:
+            stream_with_reload(
+                rtmp_url=args.rtmp_url, stream_key=args.stream_key, hls=args.hls
+            )
+        else:
+            stream_to_youtube(
+                rtmp_url=args.rtmp_url,
+                stream_key=args.stream_key,
+                standby=args.standby,
+                destinations=args.destination,
+                low_bitrate_destinations=args.low_bitrate_destination,
+            )
 
 
 if __name__ == "__main__":
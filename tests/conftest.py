@@ -0,0 +1,37 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Run the test in an empty data directory."""
+    monkeypatch.chdir(tmp_path)
+    main.ensure_directories()
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def mpegts_ffmpeg():
+    """Skip unless ffmpeg can read back the MPEG-TS the stream pipes carry."""
+    if shutil.which("ffmpeg") is None:
+        pytest.skip("ffmpeg is not installed")
+    encoded = subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=duration=1"]
+        + ["-f", "mpegts", "-"],
+        capture_output=True,
+    ).stdout
+    decoded = subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "mpegts", "-i", "-", "-f", "null", "-"],
+        input=encoded,
+        capture_output=True,
+    )
+    if decoded.returncode != 0:
+        pytest.skip("ffmpeg cannot demux MPEG-TS")
@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+
+import ffmpeg
+import numpy as np
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg is not installed"
+)
+
+FREQUENCIES = [300, 700, 1500]
+DURATIONS = [9.5, 7.25, 8]
+
+
+def generate_tracks():
+    """Write stereo AAC sine tracks the way the audio download pass stores them."""
+    for i, (frequency, duration) in enumerate(zip(FREQUENCIES, DURATIONS)):
+        (
+            ffmpeg.input(f"sine=frequency={frequency}:duration={duration}", f="lavfi")
+            .filter("aformat", channel_layouts="stereo")
+            .output(
+                os.path.join(main.DL_DIR, f"Track_{i}_audio.m4a"),
+                acodec="aac",
+                **{"b:a": "192k"},
+            )
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+
+
+def count_samples(path):
+    return int(ffmpeg.probe(path)["streams"][0]["duration_ts"])
+
+
+def dominant_frequency(samples):
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    return np.argmax(spectrum) * main.AUDIO_SAMPLE_RATE / len(samples)
+
+
+def test_segment_boundaries_match_track_timings(workspace, monkeypatch):
+    monkeypatch.setattr(main, "TRANSITION_DURATION", 2)
+    monkeypatch.setattr(main, "CROSSFADE_POINTS", "fixed")
+    generate_tracks()
+
+    main.create_audio_mix(mode="segments")
+    track_info = main.get_track_timings()
+    assert len(track_info) == len(FREQUENCIES)
+
+    # Rebuild the segment list from the cache, in the order the mix joins it
+    tracks = main.get_indexed_media("_audio.m4a")
+    audio_files = [media["path"] for media in tracks]
+    measurements = main.measure_loudness(audio_files)
+    points = main.get_crossfade_points(tracks)
+    parts = [
+        main.prepare_audio_track(path, measurements[path], points[path])
+        for path in audio_files
+    ]
+    fades = [main.prepare_audio_fade(*pair) for pair in zip(parts, parts[1:])]
+
+    rate = main.AUDIO_SAMPLE_RATE
+    fade_samples = main.TRANSITION_DURATION * rate
+    position = 0
+    for i, (track, (_, track_parts)) in enumerate(zip(track_info, parts)):
+        # Each track starts with its head, or with the crossfade into it
+        assert abs(position - track["start_time"] * rate) <= 1
+        fade = track_parts["head"] if i == 0 else fades[i - 1]
+        assert count_samples(fade) == fade_samples
+        position += fade_samples
+        body = count_samples(track_parts["body"])
+        assert abs(body - (track["duration"] * rate - 2 * fade_samples)) <= 1
+        position += body
+    assert count_samples(parts[-1][1]["tail"]) == fade_samples
+    position += fade_samples
+
+    last = track_info[-1]
+    assert abs(position - (last["start_time"] + last["duration"]) * rate) <= 1
+
+    # The decoded mix plays each track alone between its crossfades
+    output = subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-i",
+            os.path.join(main.RENDERED_DIR, "output_audio.mp4"),
+            "-ac",
+            "1",
+            "-ar",
+            str(rate),
+            "-f",
+            "f32le",
+            "-",
+        ],
+        check=True,
+        capture_output=True,
+    ).stdout
+    mix = np.frombuffer(output, dtype=np.float32)
+    window = rate // 10
+    for track, frequency in zip(track_info, FREQUENCIES):
+        body_start = round((track["start_time"] + main.TRANSITION_DURATION) * rate)
+        body_end = round(
+            (track["start_time"] + track["duration"] - main.TRANSITION_DURATION) * rate
+        )
+        for start in (body_start + window, body_end - 2 * window):
+            found = dominant_frequency(mix[start : start + window])
+            assert abs(found - frequency) < 20
@@ -0,0 +1,53 @@
+import shutil
+
+import pytest
+
+import benchmark
+import main
+
+
+def make_run(*wall_times):
+    stages = ["video_mix", "audio_mix", "render"]
+    return {
+        "results": [
+            {"resolution": "1280x720", "items": 5, "stage": stage, "wall_time": t}
+            for stage, t in zip(stages, wall_times)
+        ]
+    }
+
+
+def test_slower_stages_are_flagged_as_regressions(capsys):
+    baseline = make_run(10.0, 4.0, 20.0)
+    assert benchmark.compare_results(baseline, make_run(10.5, 3.0, 22.5)) == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.endswith("REGRESSION") for line in lines] == [False, False, True]
+
+    assert benchmark.compare_results(baseline, make_run(10.5, 3.0, 22.5), 0.2) == 0
+
+
+def test_stages_missing_from_the_baseline_are_skipped(capsys):
+    baseline = make_run(10.0, 0.0)
+    assert benchmark.compare_results(baseline, make_run(30.0, 30.0, 30.0)) == 1
+    assert len(capsys.readouterr().out.splitlines()) == 1
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_stages_run_on_synthetic_media(workspace, monkeypatch):
+    monkeypatch.setattr(benchmark, "BENCH_DIR", str(workspace / "benchmarks"))
+    monkeypatch.setattr(benchmark, "STAGES", ["download_normalize", "audio_mix"])
+    for setting in ["VIDEO_DURATION", "AUDIO_DURATION", "TRANSITION_DURATION"]:
+        monkeypatch.setattr(main, setting, getattr(main, setting))
+
+    run = benchmark.bench_stages(
+        sizes=[2],
+        resolutions=["320x240"],
+        clip_duration=2,
+        track_duration=4,
+        transition_duration=1,
+    )
+    results = {result["stage"]: result for result in run["results"]}
+    assert list(results) == ["download_normalize", "audio_mix"]
+    assert all(result["error"] is None for result in results.values())
+    assert results["download_normalize"]["media_seconds"] == 4
+    assert results["audio_mix"]["media_seconds"] == pytest.approx(7, abs=0.1)
+    assert results["audio_mix"]["cpu_time"] > 0
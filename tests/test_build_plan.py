@@ -0,0 +1,94 @@
+import os
+import re
+import shutil
+
+import pytest
+
+import benchmark
+import main
+
+
+def get_plan(capsys, **kwargs):
+    """Run a dry run and return the status of every artifact by name."""
+    capsys.readouterr()
+    main.print_build_plan(**kwargs)
+    return dict(re.findall(r"^  (.+?): (.+)$", capsys.readouterr().out, re.M))
+
+
+def test_dry_run_builds_no_caches(workspace, capsys):
+    for filename in ["Track_video.mp4", "Track_video_normalized.mp4"]:
+        with open(os.path.join(main.DL_DIR, filename), "wb") as f:
+            f.write(b"not probed")
+    with open(os.path.join(main.DL_DIR, "Track_audio.m4a"), "wb") as f:
+        f.write(b"not analyzed")
+
+    plan = get_plan(capsys)
+    assert plan == {
+        "normalize Track_video.mp4": "rebuild",
+        "video_mix output_video.mp4": "unknown (not cached yet), rebuild",
+        "audio_mix output_audio.mp4": "unknown (not cached yet), rebuild",
+        "render final_output_*.mp4": "unknown (not cached yet), rebuild",
+    }
+    assert not os.path.exists(main.MEDIA_INDEX)
+    assert os.listdir(main.ENVELOPE_DIR) == []
+
+
+def test_stage_keys_change_with_their_inputs(workspace):
+    source = os.path.join(main.DL_DIR, "Track_audio.m4a")
+    artifact = os.path.join(main.RENDERED_DIR, "output_audio.mp4")
+    for path in [source, artifact]:
+        with open(path, "w") as f:
+            f.write(path)
+
+    key = main.get_stage_key([source], {"setting": 1})
+    main.record_stage_key(artifact, key, [source])
+    assert main.is_stage_current(artifact, key)
+    assert not main.is_stage_current(artifact, main.get_stage_key([source], {}))
+
+    # Rebuilding an input changes the key of everything built from it
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert main.get_stage_key([source], {"setting": 1}) != key
+
+    # So does replacing the artifact behind the cache's back
+    os.utime(artifact, ns=(0, 0))
+    assert not main.is_stage_current(artifact, key)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_rebuilt_audio_invalidates_the_render(workspace, monkeypatch, capsys):
+    monkeypatch.setattr(benchmark, "BENCH_DIR", str(workspace / "benchmarks"))
+    monkeypatch.setattr(main, "TRANSITION_DURATION", 1)
+    monkeypatch.setattr(main, "RENDER_FADE_DURATION", 1)
+    sources = benchmark.generate_sources(2, "320x240", 2, 4)
+    monkeypatch.setattr(benchmark.StubYoutubeDL, "sources", sources)
+    main.download_pipeline("bench://playlist", ydl_class=benchmark.StubYoutubeDL)
+    main.create_video_mix()
+    main.create_audio_mix()
+    main.render_result()
+
+    plan = get_plan(capsys)
+    assert set(plan.values()) == {"up to date"}
+
+    # Without the envelopes the titles of the render are not known
+    shutil.rmtree(main.ENVELOPE_DIR)
+    os.makedirs(main.ENVELOPE_DIR)
+    plan = get_plan(capsys)
+    assert plan["audio_mix output_audio.mp4"] == "up to date"
+    assert plan["render final_output_*.mp4"] == "unknown (not cached yet), rebuild"
+    assert os.listdir(main.ENVELOPE_DIR) == []
+    main.get_track_timings()
+
+    # A track downloaded again is indexed by the next run, which rebuilds the
+    # audio mix and the render but keeps the video mix
+    track = main.get_indexed_media("_audio.m4a")[0]["path"]
+    stat = os.stat(track)
+    os.utime(track, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    plan = get_plan(capsys)
+    assert plan["audio_mix output_audio.mp4"] == "unknown (not cached yet), rebuild"
+
+    main.get_indexed_media("_audio.m4a")
+    plan = get_plan(capsys)
+    assert plan["video_mix output_video.mp4"] == "up to date"
+    assert plan["audio_mix output_audio.mp4"] == "rebuild"
+    assert plan["render final_output_*.mp4"] == "rebuild"
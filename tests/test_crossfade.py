@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def crossfade_settings(monkeypatch):
+    monkeypatch.setattr(main, "TRANSITION_DURATION", 3)
+    monkeypatch.setattr(main, "CROSSFADE_SEARCH", 15)
+    monkeypatch.setattr(main, "ENERGY_HOP", 0.05)
+
+
+def get_envelopes(rms, onset=None):
+    rms = np.asarray(rms, dtype=np.float32)
+    if onset is None:
+        onset = np.zeros_like(rms)
+    return rms, np.asarray(onset, dtype=np.float32)
+
+
+def test_silent_track_keeps_its_full_length():
+    envelopes = get_envelopes(np.zeros(6000))
+    assert main.pick_crossfade_points(envelopes, 300.0) == (0.0, 300.0)
+
+
+def test_flat_track_keeps_its_full_length():
+    rng = np.random.default_rng(0)
+    envelopes = get_envelopes(1 + 0.001 * rng.standard_normal(6000))
+    assert main.pick_crossfade_points(envelopes, 300.0) == (0.0, 300.0)
+
+
+def test_fades_move_to_quiet_passages():
+    rms = np.ones(6000)
+    # Quiet passages from 5s to 10s and from 285s to 290s
+    rms[100:200] = 0.1
+    rms[5700:5800] = 0.1
+    in_point, out_point = main.pick_crossfade_points(get_envelopes(rms), 300.0)
+    # Within CROSSFADE_TOLERANCE the fades may overlap the passage edges a little
+    assert in_point == pytest.approx(5.0, abs=0.2)
+    assert out_point == pytest.approx(290.0, abs=0.2)
+
+
+def test_onset_at_the_track_end_is_scored():
+    rms = np.ones(6000)
+    onset = np.zeros(6000)
+    # Cuts at the end of the envelopes are scored by its last onset frame,
+    # so the fade-out ends just before a beat there
+    onset[-1] = 1
+    _, out_point = main.pick_crossfade_points(get_envelopes(rms, onset), 300.0)
+    assert out_point == 299.9
@@ -0,0 +1,117 @@
+import asyncio
+import itertools
+import json
+import sys
+
+import pytest
+
+import main
+
+
+def make_playlist(name, priority=0, live=False):
+    return {"name": name, "priority": priority, "live": live}
+
+
+def test_live_renders_go_first_then_live_playlists_then_priority():
+    live = make_playlist("live", live=True)
+    urgent = make_playlist("urgent", priority=5)
+    other = make_playlist("other")
+    jobs = [
+        (other, "download"),
+        (urgent, "download"),
+        (live, "download"),
+        (other, "render"),
+        (live, "render"),
+        (urgent, "audio_mix"),
+    ]
+    jobs.sort(key=lambda job: main.get_job_priority(*job))
+    assert [(playlist["name"], stage) for playlist, stage in jobs] == [
+        ("live", "render"),
+        ("live", "download"),
+        ("urgent", "audio_mix"),
+        ("urgent", "download"),
+        ("other", "render"),
+        ("other", "download"),
+    ]
+
+
+def run_jobs(cpu_budget, max_jobs, blocker, jobs, tmp_path):
+    """Queue jobs while a blocker runs and return the order they started in."""
+
+    async def run():
+        scheduler = {
+            "cpu_budget": cpu_budget,
+            "max_jobs": max_jobs,
+            "cpu_used": 0,
+            "running": [],
+            "waiting": [],
+            "sequence": itertools.count(),
+            "condition": asyncio.Condition(),
+        }
+        log_path = tmp_path / "process.log"
+        tasks = [
+            asyncio.create_task(main.run_scheduled_job(scheduler, blocker, log_path))
+        ]
+        while blocker.get("state") != "running":
+            await asyncio.sleep(0)
+        for job in jobs:
+            tasks.append(
+                asyncio.create_task(main.run_scheduled_job(scheduler, job, log_path))
+            )
+        assert await asyncio.gather(*tasks) == [0] * len(tasks)
+        assert scheduler["cpu_used"] == 0 and scheduler["waiting"] == []
+
+    asyncio.run(run())
+    return [job["name"] for job in sorted(jobs, key=lambda job: job["started_at"])]
+
+
+def make_job(name, cores, priority=0, seconds=0):
+    return {
+        "name": name,
+        "cores": cores,
+        "priority": (priority,),
+        "command": [sys.executable, "-c", f"import time; time.sleep({seconds})"],
+    }
+
+
+def test_waiting_jobs_start_by_priority(tmp_path):
+    jobs = [
+        make_job("low", 1, priority=2),
+        make_job("high", 1, priority=0),
+        make_job("middle", 1, priority=1),
+    ]
+    blocker = make_job("blocker", 1, seconds=0.2)
+    order = run_jobs(4, 1, blocker, jobs, tmp_path)
+    assert order == ["high", "middle", "low"]
+
+
+def test_first_waiting_job_is_not_overtaken(tmp_path):
+    # The small job would fit next to the blocker but has to wait its turn
+    jobs = [make_job("large", 4, priority=0), make_job("small", 1, priority=1)]
+    blocker = make_job("blocker", 2, seconds=0.3)
+    order = run_jobs(4, 2, blocker, jobs, tmp_path)
+    assert order == ["large", "small"]
+    assert jobs[1]["started_at"] >= blocker["started_at"] + 0.3
+
+
+def test_config_defaults_and_unique_names(tmp_path):
+    config_path = tmp_path / "daemon.json"
+    playlists = [{"url": "https://example.com/a"}, {"url": "https://example.com/b"}]
+    config_path.write_text(json.dumps({"playlists": playlists, "max_jobs": 3}))
+
+    config = main.load_daemon_config(config_path)
+    assert config["max_jobs"] == 3
+    assert config["cpu_budget"] == main.DAEMON_CPU_BUDGET
+    first, second = config["playlists"]
+    assert first["name"] != second["name"]
+    assert (first["interval"], first["priority"], first["live"], first["args"]) == (
+        main.DAEMON_INTERVAL,
+        0,
+        False,
+        [],
+    )
+
+    playlists[1]["name"] = first["name"]
+    config_path.write_text(json.dumps({"playlists": playlists}))
+    with pytest.raises(ValueError, match="not unique"):
+        main.load_daemon_config(config_path)
@@ -0,0 +1,71 @@
+import os
+import shutil
+
+import pytest
+
+import benchmark
+import main
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg is not installed"
+)
+
+
+@pytest.fixture
+def playlist(workspace, monkeypatch):
+    """Serve three synthetic entries through the benchmark's stub downloader."""
+    monkeypatch.setattr(benchmark, "BENCH_DIR", str(workspace / "benchmarks"))
+    sources = benchmark.generate_sources(3, "320x240", 2, 4)
+    monkeypatch.setattr(benchmark.StubYoutubeDL, "sources", sources)
+    return sources
+
+
+def download(workers=2):
+    return main.download_pipeline(
+        "bench://playlist", workers=workers, ydl_class=benchmark.StubYoutubeDL
+    )
+
+
+def get_downloaded_paths(sources, kind):
+    return [
+        os.path.join(main.DL_DIR, os.path.basename(source[kind])) for source in sources
+    ]
+
+
+def test_pipeline_downloads_and_normalizes_every_entry(playlist):
+    results = download()
+
+    videos = get_downloaded_paths(playlist, "video")
+    assert sorted(results["normalized"]) == videos
+    assert results["failed"] == []
+    for path in videos:
+        assert main.is_stage_current(
+            main.get_normalized_path(path), main.get_normalize_key(path)
+        )
+    assert all(os.path.exists(path) for path in get_downloaded_paths(playlist, "audio"))
+    # Titles and video IDs are recorded for the track names
+    assert [media["video_id"] for media in main.get_indexed_media("_audio.m4a")] == [
+        source["id"] for source in playlist
+    ]
+
+    # A second run finds everything downloaded and normalized
+    results = download()
+    assert results["normalized"] == results["failed"] == []
+
+
+def test_pipeline_normalizes_earlier_downloads_again(playlist, monkeypatch):
+    normalize_video = main.normalize_video
+    monkeypatch.setattr(main, "normalize_video", lambda *args, **kwargs: False)
+    results = download()
+    videos = get_downloaded_paths(playlist, "video")
+    assert sorted(results["failed"]) == videos
+
+    # The downloads are not repeated, their failed normalizations are
+    monkeypatch.setattr(main, "normalize_video", normalize_video)
+    results = download()
+    assert sorted(results["normalized"]) == videos
+
+    # So are normalized copies built with other settings
+    monkeypatch.setitem(main.NORMALIZE_ENCODER_OPTS, "crf", 30)
+    results = download()
+    assert sorted(results["normalized"]) == videos
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import shutil
+
+import ffmpeg
+import pytest
+
+import main
+
+
+def write_track(filename, duration=2):
+    path = os.path.join(main.DL_DIR, filename)
+    (
+        ffmpeg.input(f"sine=duration={duration}", f="lavfi")
+        .output(path, acodec="aac")
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return path
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_unreadable_downloads_are_left_out_of_the_index(workspace):
+    good = write_track("Good_audio.m4a")
+    bad = os.path.join(main.DL_DIR, "Truncated_audio.m4a")
+    with open(bad, "wb") as f:
+        f.write(b"not an mp4")
+
+    assert [media["path"] for media in main.get_indexed_media("_audio.m4a")] == [good]
+    assert main.get_media_info(good)["duration"] == pytest.approx(2, abs=0.1)
+    with pytest.raises(ffmpeg.Error):
+        main.get_media_info(bad)
+
+    # A file that breaks after it was indexed is dropped from the index
+    with open(good, "r+b") as f:
+        f.truncate(16)
+    assert main.get_indexed_media("_audio.m4a") == []
+
+    # Once downloaded again it is indexed
+    os.remove(bad)
+    write_track("Truncated_audio.m4a", duration=3)
+    assert [media["path"] for media in main.get_indexed_media("_audio.m4a")] == [bad]
+
+
+def test_file_digests_are_remembered_until_the_file_changes(workspace, monkeypatch):
+    path = os.path.join(main.DL_DIR, "Track_audio.m4a")
+    with open(path, "wb") as f:
+        f.write(b"first")
+    digest = main.file_digest(path)
+    assert digest == hashlib.sha1(b"first").hexdigest()
+
+    # The second key computed from the same file does not read it again
+    with monkeypatch.context() as patch:
+        patch.setattr(main, "open", lambda *args: 1 / 0, raising=False)
+        assert main.file_digest(path) == digest
+
+    stat = os.stat(path)
+    with open(path, "wb") as f:
+        f.write(b"other")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert main.file_digest(path) == hashlib.sha1(b"other").hexdigest()
+
+
+def test_file_digests_are_not_remembered_in_a_dry_run(workspace):
+    path = os.path.join(main.DL_DIR, "Track_audio.m4a")
+    with open(path, "wb") as f:
+        f.write(b"first")
+    assert main.file_digest(path, remember=False) == hashlib.sha1(b"first").hexdigest()
+    assert not os.path.exists(main.MEDIA_INDEX)
@@ -0,0 +1,21 @@
+import json
+import os
+
+import main
+
+
+def test_metrics_log_is_rotated(workspace, monkeypatch):
+    monkeypatch.setattr(main, "METRICS_LOG_MAX_SIZE", 4096)
+    for i in range(500):
+        main.record_metrics("stream", "progress", frame=i, speed=1.0)
+
+    rotated = main.METRICS_LOG + ".1"
+    assert os.path.getsize(main.METRICS_LOG) <= 4096
+    assert 4096 < os.path.getsize(rotated) <= 4096 + 200
+
+    # The newest events are in the log, the ones before them in the rotation
+    with open(rotated) as f:
+        older = [json.loads(line)["frame"] for line in f]
+    with open(main.METRICS_LOG) as f:
+        newer = [json.loads(line)["frame"] for line in f]
+    assert older + newer == list(range(older[0], 500))
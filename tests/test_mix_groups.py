@@ -0,0 +1,75 @@
+import os
+
+import ffmpeg
+import pytest
+
+import main
+
+
+@pytest.fixture
+def mixes(workspace, monkeypatch):
+    """Record the ffmpeg runs of a mix instead of running them."""
+    monkeypatch.setattr(main, "TRANSITION_DURATION", 2)
+    monkeypatch.setattr(main, "MIX_GROUP_SIZE", 4)
+    runs = []
+
+    def run_ffmpeg(stream, stage):
+        output_path = stream.get_args()[-2]
+        open(output_path, "w").close()
+        runs.append(output_path)
+
+    monkeypatch.setattr(main, "run_ffmpeg", run_ffmpeg)
+    return runs
+
+
+def crossfade_all(paths, durations):
+    inputs = []
+    offsets = []
+
+    def open_input(path, level):
+        inputs.append((level, path))
+        return ffmpeg.input(path).audio
+
+    def crossfade(previous, current, offset):
+        offsets.append(offset)
+        return ffmpeg.filter([previous, current], "acrossfade", d=2)
+
+    main.crossfade_in_groups(
+        paths,
+        durations,
+        open_input,
+        crossfade,
+        "mix.flac",
+        {},
+        ".flac",
+        {},
+        "audio_mix",
+    )
+    return inputs, offsets
+
+
+def test_small_playlist_is_mixed_by_one_chain(mixes):
+    inputs, offsets = crossfade_all(["a", "b", "c"], [10, 20, 30])
+    assert inputs == [(0, "a"), (0, "b"), (0, "c")]
+    assert offsets == [8, 26]
+    assert mixes == ["mix.flac"]
+
+
+def test_groups_put_transitions_at_their_linear_offsets(mixes):
+    paths = [f"track{i}" for i in range(10)]
+    durations = [10 + i for i in range(10)]
+    inputs, offsets = crossfade_all(paths, durations)
+
+    # Balanced groups of 4, 4 and 2 inputs, then one chain of the groups
+    groups = [path for level, path in inputs if level == 1]
+    assert len(groups) == 3 and groups == mixes[:3]
+    assert [path for level, path in inputs if level == 0] == paths
+    assert len(offsets) == 3 + 3 + 1 + 2
+
+    linear = [sum(durations[:i]) - 2 * i for i in range(1, 10)]
+    assert offsets[:3] == linear[:3]
+    assert offsets[-2:] == [linear[3], linear[7]]
+
+    # Only the final mix is left
+    assert mixes[-1] == "mix.flac"
+    assert os.listdir(main.TMP_DIR) == []
@@ -0,0 +1,28 @@
+import main
+
+
+def test_one_failing_file_does_not_stop_the_batch(workspace, monkeypatch):
+    outcomes = {
+        "copied": "copy",
+        "encoded": "full",
+        "current": None,
+        "failed": False,
+    }
+
+    def normalize_video(input_path, threads):
+        if input_path == "crashed":
+            raise RuntimeError("worker crashed")
+        return outcomes[input_path]
+
+    monkeypatch.setattr(main, "normalize_video", normalize_video)
+    monkeypatch.setattr(main, "get_media_info", lambda path: {"duration": 2.0})
+
+    paths = ["copied", "crashed", "encoded", "current", "failed"]
+    results = main.normalize_videos(paths, workers=3, threads=1)
+
+    assert sorted(results["normalized"]) == ["copied", "encoded"]
+    assert results["skipped"] == ["current"]
+    assert sorted(results["failed"]) == ["crashed", "failed"]
+    assert results["media_seconds"] == 4.0
+    assert results["methods"]["copy"]["count"] == 1
+    assert results["methods"]["full"]["count"] == 1
@@ -0,0 +1,44 @@
+import pytest
+
+import main
+
+TRACK_INFO = [
+    {"name": "One", "start_time": 0, "duration": 60},
+    {"name": "Two", "start_time": 55, "duration": 60},
+    {"name": "Three", "start_time": 110, "duration": 60},
+]
+
+
+@pytest.fixture(autouse=True)
+def preview_settings(monkeypatch):
+    monkeypatch.setattr(main, "TRANSITION_DURATION", 5)
+    monkeypatch.setattr(main, "PREVIEW_CONTEXT", 10)
+
+
+def test_window_covers_the_crossfade_into_a_track():
+    assert main.get_preview_window(TRACK_INFO, 170, boundary=2) == (45, 70)
+    assert main.get_preview_window(TRACK_INFO, 170, boundary=3) == (100, 125)
+
+
+def test_window_is_clamped_to_the_mix():
+    assert main.get_preview_window(TRACK_INFO, 170) == (0, 170)
+    assert main.get_preview_window(TRACK_INFO, 170, start=-5, end=500) == (0, 170)
+    assert main.get_preview_window(TRACK_INFO, 170, start=120) == (120, 170)
+    assert main.get_preview_window(TRACK_INFO, 120, boundary=3) == (100, 120)
+
+
+@pytest.mark.parametrize("boundary", [0, 1, 4])
+def test_window_needs_a_crossfade(boundary):
+    with pytest.raises(ValueError):
+        main.get_preview_window(TRACK_INFO, 170, boundary=boundary)
+
+
+def test_window_cannot_be_empty():
+    with pytest.raises(ValueError):
+        main.get_preview_window(TRACK_INFO, 170, start=80, end=80)
+
+
+def test_preview_does_not_build_the_audio_mix(workspace, monkeypatch):
+    monkeypatch.setattr(main, "create_audio_mix", lambda *args, **kwargs: 1 / 0)
+    with pytest.raises(FileNotFoundError, match="Audio mix not found"):
+        main.render_preview()
@@ -0,0 +1,83 @@
+import json
+import os
+
+import ffmpeg
+import pytest
+
+import main
+
+
+def make_jobs(prefix, count=2, loop_path=None):
+    return [
+        {
+            "loop_path": loop_path or os.path.join(main.VIDEO_SEGMENT_DIR, "loop.mp4"),
+            "loop_duration": 10,
+            "span_path": os.path.join(main.RENDER_QUEUE_DIR, f"{prefix}{i:05d}.mp4"),
+            "start": i * 4,
+            "end": (i + 1) * 4,
+            "windows": [],
+            "audio_duration": count * 4,
+            "title_overlay": "png",
+            "font_path": None,
+        }
+        for i in range(count)
+    ]
+
+
+def test_render_chunks_start_on_the_keyframe_grid(monkeypatch):
+    monkeypatch.setattr(main, "KEYFRAME_INTERVAL", 2)
+    monkeypatch.setattr(main, "RENDER_CHUNK_DURATION", 11)
+    assert main.get_render_chunks(30) == [(0, 12), (12, 24), (24, 30)]
+    assert main.get_render_chunks(5) == [(0, 5)]
+
+
+def test_workers_only_claim_chunks_of_their_render(workspace):
+    main.submit_render_chunks(make_jobs("aaaa_"))
+    main.submit_render_chunks(make_jobs("bbbb_"))
+
+    claimed = [main.claim_render_chunk("bbbb_") for _ in range(3)]
+    assert [os.path.basename(path) for path, _ in claimed[:2]] == [
+        "bbbb_00000.claimed",
+        "bbbb_00001.claimed",
+    ]
+    assert claimed[2] is None
+
+    # Render workers without a prefix take any render's chunks
+    path, _ = main.claim_render_chunk()
+    assert os.path.basename(path) == "aaaa_00000.claimed"
+
+
+def test_jobs_are_resolved_against_the_data_dir_of_the_worker(workspace, monkeypatch):
+    # Queued with absolute paths from this working directory
+    loop_path = os.path.abspath(os.path.join(main.VIDEO_SEGMENT_DIR, "loop.mp4"))
+    main.submit_render_chunks(make_jobs("aaaa_", count=1, loop_path=loop_path))
+    with open(os.path.join(main.RENDER_QUEUE_DIR, "aaaa_00000.json")) as f:
+        queued = json.load(f)
+    assert queued["loop_path"] == os.path.join("cache", "segments", "video", "loop.mp4")
+    assert queued["span_path"] == os.path.join("render_queue", "aaaa_00000.mp4")
+
+    # Claimed on a node that mounts the data directory elsewhere
+    node = workspace / "node"
+    node.mkdir()
+    os.symlink(workspace / "data", node / "data")
+    monkeypatch.chdir(node)
+    _, job = main.claim_render_chunk()
+    assert job["loop_path"] == os.path.join(main.VIDEO_SEGMENT_DIR, "loop.mp4")
+    assert job["span_path"] == os.path.join(main.RENDER_QUEUE_DIR, "aaaa_00000.mp4")
+    assert job["font_path"] is None
+
+
+def test_inputs_outside_the_data_dir_are_rejected(workspace):
+    with pytest.raises(ValueError):
+        main.submit_render_chunks(make_jobs("aaaa_", loop_path="/tmp/loop.mp4"))
+
+
+def test_chunks_with_missing_inputs_fail_the_render(workspace):
+    jobs = make_jobs("aaaa_")
+    main.submit_render_chunks(jobs)
+    main.run_render_worker(threads=1, wait=False, prefix="aaaa_")
+
+    assert os.path.exists(os.path.join(main.RENDER_QUEUE_DIR, "aaaa_00000.failed"))
+    with pytest.raises(ffmpeg.Error) as error:
+        main.wait_for_render_chunks(jobs, threads=1, prefix="aaaa_")
+    assert b"loop.mp4: No such file" in error.value.stderr
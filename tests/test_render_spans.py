@@ -0,0 +1,48 @@
+import pytest
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def render_settings(monkeypatch):
+    monkeypatch.setattr(main, "KEYFRAME_INTERVAL", 2)
+    monkeypatch.setattr(main, "RENDER_FADE_DURATION", 3)
+
+
+def window(start, end):
+    return {"start_time": start, "end_time": end}
+
+
+def test_titles_and_fades_are_widened_to_keyframes():
+    spans = main.get_render_spans([window(12.5, 17.2)], 40, loop_duration=10)
+    assert spans == [
+        (0, 4, True),
+        (4, 12, False),
+        (12, 18, True),
+        (18, 36, False),
+        (36, 40, True),
+    ]
+
+
+def test_keyframes_restart_with_every_loop():
+    # The last keyframe interval of a 9s loop is cut short by the next loop
+    spans = main.get_render_spans([window(8.5, 8.9)], 27, loop_duration=9)
+    assert spans == [
+        (0, 4, True),
+        (4, 8, False),
+        (8, 9, True),
+        (9, 24, False),
+        (24, 27, True),
+    ]
+    spans = main.get_render_spans([window(7.5, 9.5)], 27, loop_duration=9)
+    assert spans[2] == (6, 11, True)
+
+
+def test_overlapping_spans_are_merged():
+    windows = [window(5, 6.5), window(7, 9), window(30, 31)]
+    spans = main.get_render_spans(windows, 36, loop_duration=10)
+    assert spans == [(0, 10, True), (10, 30, False), (30, 36, True)]
+
+
+def test_short_mix_is_encoded_whole():
+    assert main.get_render_spans([], 5, loop_duration=10) == [(0, 5, True)]
@@ -0,0 +1,57 @@
+import os
+
+import main
+
+
+def write_file(directory, filename, mtime):
+    path = os.path.join(directory, filename)
+    with open(path, "wb") as f:
+        f.write(b"x" * 100)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_evictions_keep_what_the_mixes_and_stream_use(workspace):
+    raw = write_file(main.DL_DIR, "A_video.mp4", 5000)
+    normalized = write_file(main.DL_DIR, "A_video_normalized.mp4", 1000)
+    old = write_file(main.DL_DIR, "B_audio.m4a", 2000)
+    newer = write_file(main.DL_DIR, "C_audio.m4a", 3000)
+    used = write_file(main.DL_DIR, "D_audio.m4a", 1500)
+    mixed = write_file(main.DL_DIR, "E_audio.m4a", 100)
+    streamed = write_file(main.DL_DIR, "F_audio.m4a", 200)
+
+    for mix, inputs in [("output_video.mp4", normalized), ("output_audio.mp4", mixed)]:
+        path = write_file(main.RENDERED_DIR, mix, 100)
+        main.record_stage_key(path, "key", [inputs])
+    main.mark_used([used])
+    main.mark_streaming([streamed])
+    try:
+        # Normalized raw downloads go first, then the least recently used
+        assert main.enforce_quotas({main.DL_DIR: 450}, min_free=None) == 300
+        assert sorted(os.listdir(main.DL_DIR)) == [
+            "A_video_normalized.mp4",
+            "D_audio.m4a",
+            "E_audio.m4a",
+            "F_audio.m4a",
+        ]
+        assert not any(os.path.exists(path) for path in [raw, old, newer])
+
+        # The mixes and the stream keep their files over the quota
+        assert main.enforce_quotas({main.DL_DIR: 1}, min_free=None) == 100
+        assert sorted(os.listdir(main.DL_DIR)) == [
+            "A_video_normalized.mp4",
+            "E_audio.m4a",
+            "F_audio.m4a",
+        ]
+    finally:
+        main.clear_streaming()
+
+    # Once the stream stopped its file can go
+    assert main.enforce_quotas({main.DL_DIR: 250}, min_free=None) == 100
+    assert not os.path.exists(streamed)
+
+
+def test_no_quotas_evict_nothing(workspace):
+    path = write_file(main.DL_DIR, "A_audio.m4a", 100)
+    assert main.enforce_quotas({main.DL_DIR: None}, min_free=None) == 0
+    assert os.path.exists(path)
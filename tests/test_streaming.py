@@ -0,0 +1,337 @@
+import json
+import os
+import queue
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import ffmpeg
+import numpy as np
+import pytest
+
+import main
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.dirname(__file__)), "main.py")
+LOOP_DURATION = 4
+
+
+@pytest.fixture
+def receiver(workspace):
+    """Start local ffmpeg listen-mode RTMP receivers, like YouTube ingest.
+
+    Returns a function that starts a receiver on the same port every time and
+    returns the ffmpeg process and the FLV file it records to. Receivers still
+    running at the end of the test are killed.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    processes = []
+
+    def start():
+        path = str(workspace / f"received_{len(processes)}.flv")
+        process = subprocess.Popen(
+            ["ffmpeg", "-v", "error", "-listen", "1"]
+            + ["-i", f"rtmp://127.0.0.1:{port}/live/test"]
+            + ["-c", "copy", "-f", "flv", path],
+            stdin=subprocess.DEVNULL,
+        )
+        processes.append(process)
+        # Give ffmpeg time to open the listening socket
+        time.sleep(0.5)
+        return process, path
+
+    start.rtmp_url = f"rtmp://127.0.0.1:{port}/live"
+    yield start
+
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def write_render(filename, size="320x240"):
+    """Write a short final render with the keyframe interval of real renders."""
+    path = os.path.join(main.RENDERED_DIR, filename)
+    tmp_path = os.path.join(main.TMP_DIR, filename)
+    (
+        ffmpeg.output(
+            ffmpeg.input(
+                f"testsrc2=size={size}:rate=25:duration={LOOP_DURATION}", f="lavfi"
+            ),
+            ffmpeg.input(f"sine=duration={LOOP_DURATION}", f="lavfi"),
+            tmp_path,
+            vcodec="libx264",
+            preset="ultrafast",
+            g=50,
+            acodec="aac",
+        )
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    # Renders appear atomically, as publish_output does
+    os.rename(tmp_path, path)
+    return path
+
+
+class StreamProcess:
+    """Run main.py stream in the workspace and collect its output lines."""
+
+    def __init__(self, *args):
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", MAIN_PY, "stream", "--stream-key", "test", *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        self.lines = queue.Queue()
+        self.output = []
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        for line in self.process.stdout:
+            self.lines.put(line)
+
+    def wait_for(self, pattern, timeout=30):
+        """Return the match of the first new output line matching pattern."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                line = self.lines.get(timeout=deadline - time.monotonic())
+            except queue.Empty:
+                break
+            self.output.append(line)
+            match = re.search(pattern, line)
+            if match:
+                return match
+        pytest.fail(f"No output matching {pattern!r}:\n{''.join(self.output)}")
+
+    def stop(self):
+        """Stop the stream like Ctrl+C does."""
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            raise
+
+
+def get_video_timestamps(path):
+    """Return the decoding times of the video packets of a recording."""
+    packets = ffmpeg.probe(path, select_streams="v:0", show_packets=None)["packets"]
+    return [float(packet["dts_time"]) for packet in packets]
+
+
+def test_reload_switches_renders_on_one_connection(mpegts_ffmpeg, receiver):
+    write_render("final_output_20240101_000000.mp4")
+    ingest, received = receiver()
+
+    stream = StreamProcess("--rtmp-url", receiver.rtmp_url, "--reload")
+    try:
+        stream.wait_for(r"Streaming final_output_20240101_000000\.mp4 from 0\.00s")
+        write_render("final_output_20240101_010000.mp4", size="320x180")
+        match = stream.wait_for(
+            r"Streaming final_output_20240101_010000\.mp4 from ([\d.]+)s"
+        )
+        # The new render starts at a loop boundary of the old one
+        offset = float(match.group(1))
+        assert offset >= LOOP_DURATION
+        loops = round(offset / LOOP_DURATION)
+        assert offset == pytest.approx(loops * LOOP_DURATION, abs=0.1)
+        time.sleep(2)
+        assert ingest.poll() is None
+    finally:
+        stream.stop()
+    ingest.wait(timeout=10)
+
+    # One connection carried both renders with continuous timestamps
+    timestamps = get_video_timestamps(received)
+    assert timestamps[-1] >= offset + 1
+    assert all(0 <= b - a < 0.5 for a, b in zip(timestamps, timestamps[1:]))
+
+
+def write_hls_render(name, complete=True, render_process=None):
+    """Write a segmented render, or one that is still being rendered.
+
+    The playlist of an incomplete render lacks ENDLIST and render_process
+    stands in for the process rendering it.
+    """
+    output_path, output_opts = main.get_render_output(name + ".mp4", "hls")
+    (
+        ffmpeg.output(
+            ffmpeg.input(
+                f"testsrc2=size=320x240:rate=25:duration={LOOP_DURATION}", f="lavfi"
+            ),
+            ffmpeg.input(f"sine=duration={LOOP_DURATION}", f="lavfi"),
+            output_path,
+            vcodec="libx264",
+            preset="ultrafast",
+            g=50,
+            acodec="aac",
+            hls_time=2,
+            **{k: v for k, v in output_opts.items() if k != "hls_time"},
+        )
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    pid_path = os.path.join(os.path.dirname(output_path), main.HLS_RENDER_PID)
+    if complete:
+        os.remove(pid_path)
+    else:
+        with open(output_path) as f:
+            playlist = f.read().replace("#EXT-X-ENDLIST\n", "")
+        with open(output_path, "w") as f:
+            f.write(playlist)
+        with open(pid_path, "w") as f:
+            f.write(str(render_process.pid))
+    return output_path
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_incomplete_hls_renders_are_only_followed_while_rendering(workspace):
+    write_hls_render("final_output_1")
+    render = subprocess.Popen(["sleep", "60"])
+    try:
+        write_hls_render("final_output_2", complete=False, render_process=render)
+        assert main.get_latest_render(hls=True) == "final_output_2/index.m3u8"
+        main.cleanup_temp_files().close()
+        assert os.path.isdir(os.path.join(main.RENDERED_DIR, "final_output_2"))
+    finally:
+        render.kill()
+        render.wait()
+
+    # A render killed before it finished is skipped and removed at startup
+    assert main.get_latest_render(hls=True) == "final_output_1/index.m3u8"
+    main.cleanup_temp_files().close()
+    assert os.listdir(main.RENDERED_DIR) == ["final_output_1"]
+
+
+def test_hls_stream_falls_back_when_the_render_is_killed(mpegts_ffmpeg, receiver):
+    write_hls_render("final_output_1")
+    render = subprocess.Popen(["sleep", "60"])
+    write_hls_render("final_output_2", complete=False, render_process=render)
+    ingest, received = receiver()
+
+    stream = StreamProcess("--rtmp-url", receiver.rtmp_url, "--hls")
+    try:
+        stream.wait_for(r"Streaming final_output_2/index\.m3u8 from 0\.00s")
+        time.sleep(LOOP_DURATION + 1)
+        render.kill()
+        render.wait()
+        stream.wait_for(r"Render of final_output_2/index\.m3u8 stopped")
+        match = stream.wait_for(r"Streaming final_output_1/index\.m3u8 from ([\d.]+)s")
+        offset = float(match.group(1))
+        time.sleep(LOOP_DURATION)
+        assert ingest.poll() is None
+    finally:
+        render.kill()
+        render.wait()
+        stream.stop()
+    ingest.wait(timeout=10)
+
+    # The fallback continued on the same connection without going back in time
+    timestamps = get_video_timestamps(received)
+    assert timestamps[-1] >= offset + LOOP_DURATION - 1
+    assert all(b >= a for a, b in zip(timestamps, timestamps[1:]))
+
+
+def get_first_frame(path, position=0.0):
+    """Return the first video frame at or after position as grayscale pixels."""
+    out, _ = (
+        ffmpeg.input(path, ss=position)
+        .output("pipe:", vframes=1, format="rawvideo", pix_fmt="gray")
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return np.frombuffer(out, np.uint8).astype(np.float32)
+
+
+def test_stream_reconnects_at_its_position_after_ingest_drops(mpegts_ffmpeg, receiver):
+    render = write_render("final_output_20240101_000000.mp4")
+    ingest, _ = receiver()
+
+    stream = StreamProcess("--rtmp-url", receiver.rtmp_url)
+    try:
+        stream.wait_for(r"Press Ctrl\+C")
+        time.sleep(LOOP_DURATION / 2 + 0.5)
+        # Drop the connection like an ingest server restart
+        ingest.kill()
+        ingest.wait()
+        ingest, received = receiver()
+        match = stream.wait_for(
+            r"Stream disconnected \(.*\), reconnecting in [\d.]+s at ([\d.]+)s"
+        )
+        position = float(match.group(1))
+        stream.wait_for(r"Reconnected after [\d.]+s")
+        time.sleep(2)
+        assert ingest.poll() is None
+    finally:
+        stream.stop()
+    ingest.wait(timeout=10)
+
+    assert 0 < position < LOOP_DURATION
+    events = [json.loads(line) for line in open(main.METRICS_LOG)]
+    disconnects = [e for e in events if e["event"] == "disconnect"]
+    reconnects = [e for e in events if e["event"] == "reconnect"]
+    assert [e["position_seconds"] for e in disconnects] == [
+        pytest.approx(position, abs=0.01)
+    ]
+    assert [e["reconnects"] for e in reconnects] == [1]
+
+    # The new connection resumed from the keyframe before the position, not
+    # from the start of the render
+    keyframe = position // 2 * 2
+    first = get_first_frame(received)
+    resumed = np.abs(first - get_first_frame(render, keyframe)).mean()
+    restarted = np.abs(first - get_first_frame(render)).mean()
+    assert keyframe > 0 and resumed < restarted
+
+
+def read_prometheus_metrics():
+    """Return the gauges of the Prometheus textfile by (name, stage)."""
+    values = {}
+    with open(main.METRICS_PROM) as f:
+        for line in f:
+            match = re.match(r'ytautostream_(\w+)\{stage="(\w+)"\} (\S+)', line)
+            if match:
+                values[match.group(1), match.group(2)] = float(match.group(3))
+    return values
+
+
+def test_simulcast_drops_a_dead_destination(mpegts_ffmpeg, receiver):
+    write_render("final_output_20240101_000000.mp4")
+    ingest, received = receiver()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        dead_url = f"rtmp://127.0.0.1:{sock.getsockname()[1]}/live/dead"
+
+    stream = StreamProcess(
+        "--rtmp-url", receiver.rtmp_url, "--destination", dead_url, "--standby"
+    )
+    try:
+        stream.wait_for(r"Destination 1 failed, streaming to 1/2")
+        # Health is recorded with the first progress of the stream
+        deadline = time.monotonic() + 30
+        metrics = read_prometheus_metrics()
+        while ("healthy", "destination_0") not in metrics:
+            assert time.monotonic() < deadline
+            time.sleep(1)
+            metrics = read_prometheus_metrics()
+        assert ingest.poll() is None
+    finally:
+        stream.stop()
+    ingest.wait(timeout=10)
+
+    assert metrics["healthy", "destination_0"] == 1
+    assert metrics["healthy", "destination_1"] == 0
+    # The idle standby muxer reports under its own stage
+    assert metrics["running", "stream_standby"] == 1
+    assert metrics["speed", "stream"] == pytest.approx(1, abs=0.3)
+    assert ("speed", "stream_standby") not in metrics
+
+    # The live destination kept receiving the stream
+    assert get_video_timestamps(received)[-1] >= main.METRICS_INTERVAL
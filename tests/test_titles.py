@@ -0,0 +1,59 @@
+import os
+import shutil
+
+import ffmpeg
+import numpy as np
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg is not installed"
+)
+
+
+def test_title_pngs_are_rendered_once_per_title(workspace, monkeypatch):
+    path = main.render_title_png("Artist - Title", width=640)
+    stream = ffmpeg.probe(path)["streams"][0]
+    fontsize, _ = main.get_title_geometry(640)
+    assert (stream["width"], stream["height"]) == (640, fontsize * 3)
+
+    # Cached titles are not rendered again
+    with monkeypatch.context() as patch:
+        patch.setattr(main, "run_ffmpeg", lambda *args: 1 / 0)
+        assert main.render_title_png("Artist - Title", width=640) == path
+
+    assert main.render_title_png("Other - Title", width=640) != path
+    assert main.render_title_png("Artist - Title", width=1280) != path
+    assert len(os.listdir(main.TITLE_CACHE_DIR)) == 3
+
+
+def test_overlay_titles_match_drawtext(workspace):
+    windows = main.get_title_windows(
+        [{"name": "Artist - Title", "start_time": 0, "duration": 20}]
+    )
+
+    def render(draw):
+        video = ffmpeg.input("color=c=gray:s=640x360:r=25:d=4", f="lavfi")
+        out, _ = (
+            ffmpeg.output(
+                draw(video), "pipe:", ss=3, vframes=1, format="rawvideo", pix_fmt="gray"
+            )
+            .global_args("-loglevel", "error")
+            .run(capture_stdout=True)
+        )
+        return np.frombuffer(out, np.uint8).reshape(360, 640)
+
+    background = render(lambda video: video)
+    drawtext = render(lambda video: main.draw_titles(video, windows, 640))
+    overlay = render(lambda video: main.overlay_titles(video, windows, 640))
+
+    # The text covers the same pixels, only its blending differs
+    def get_text_box(frame):
+        changed = np.argwhere(frame != background)
+        return changed.min(axis=0).tolist(), changed.max(axis=0).tolist()
+
+    assert get_text_box(overlay) == get_text_box(drawtext)
+    assert np.count_nonzero(overlay != background) == pytest.approx(
+        np.count_nonzero(drawtext != background), rel=0.05
+    )
@@ -0,0 +1,78 @@
+import os
+import shutil
+
+import ffmpeg
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg is not installed"
+)
+
+
+def write_video(filename, size, rate, **options):
+    path = os.path.join(main.DL_DIR, filename)
+    (
+        ffmpeg.input(f"testsrc2=size={size}:rate={rate}:duration=4", f="lavfi")
+        .output(path, vcodec="libx264", preset="ultrafast", **options)
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return path
+
+
+def get_time_base(path):
+    return ffmpeg.probe(path, select_streams="v:0")["streams"][0]["time_base"]
+
+
+@pytest.mark.parametrize("mode", ["segments", "xfade"])
+def test_copied_and_encoded_clips_crossfade(workspace, monkeypatch, mode):
+    monkeypatch.setattr(main, "TRANSITION_DURATION", 1)
+    # A conforming download keeps its own timescale when it is copied
+    copied = write_video("A_video.mp4", "320x180", 25, video_track_timescale=15360)
+    encoded = write_video("B_video.mp4", "320x240", 30)
+
+    assert main.normalize_video(copied, 320, 180) == "copy"
+    assert main.normalize_video(encoded, 320, 180) == "full"
+    normalized = [main.get_normalized_path(path) for path in (copied, encoded)]
+    assert get_time_base(normalized[0]) == get_time_base(normalized[1])
+
+    main.create_video_mix(mode=mode)
+    mix = ffmpeg.probe(os.path.join(main.RENDERED_DIR, "output_video.mp4"))
+    assert float(mix["format"]["duration"]) == pytest.approx(7, abs=0.1)
+
+
+def test_segments_follow_the_xfade_timeline(monkeypatch):
+    monkeypatch.setattr(main, "TRANSITION_DURATION", 1)
+    segments = main.get_video_segments(["a", "b", "c"], [4, 5, 6])
+    assert [(s["type"], s["inputs"], s["start"]) for s in segments] == [
+        ("body", ["a"], 0),
+        ("fade", ["a", "b"], 3),
+        ("body", ["b"], 1),
+        ("fade", ["b", "c"], 4),
+        ("body", ["c"], 1),
+    ]
+    assert [s["end"] for s in segments if s["type"] == "body"] == [3, 4, 6]
+
+
+def test_appending_a_video_encodes_only_the_segments_it_touches(
+    workspace, monkeypatch, capsys
+):
+    monkeypatch.setattr(main, "TRANSITION_DURATION", 1)
+    videos = []
+    for name in "ABC":
+        path = write_video(f"{name}_video.mp4", "320x180", 25)
+        main.normalize_video(path, 320, 180)
+        videos.append(main.get_normalized_path(path))
+
+    main.create_segmented_video_mix(videos[:2], [4, 4])
+    assert "0 cached, 3 to encode" in capsys.readouterr().out
+
+    # The old last body now ends before the new fade, the rest is reused
+    main.create_segmented_video_mix(videos, [4, 4, 4])
+    assert "2 cached, 3 to encode" in capsys.readouterr().out
+    mix = ffmpeg.probe(os.path.join(main.RENDERED_DIR, "output_video.mp4"))
+    assert float(mix["format"]["duration"]) == pytest.approx(10, abs=0.1)
+
+    main.create_segmented_video_mix(videos, [4, 4, 4])
+    assert "5 cached, 0 to encode" in capsys.readouterr().out